@@ -0,0 +1,187 @@
+"""
+  asyncio driver runtime
+  usage:
+     python aiodrive.py <track XML file> [<port> <simulator port> ...]
+
+  Every sensors packet is processed as soon as it arrives and commands are
+  sent either as a reply to each packet (``period=None``, the same order
+  as ``demo.drive``, so logs can be replayed with IOFromFile) or on their
+  own fixed schedule.
+"""
+import asyncio
+import os
+import sys
+import time
+
+from demo import Driver
+from iolog import IOLog, INPUT, OUTPUT
+from track import Track
+
+SIM_ADDRESS = ('127.0.0.1', 3001)
+SIM_PERIOD = 0.02  # simulator step in seconds
+
+# reply mode resends the last command after this many seconds of silence
+RESEND_TIMEOUT = 5 * SIM_PERIOD
+
+
+class CarProtocol(asyncio.DatagramProtocol):
+    """UDP endpoint of one car controlled by ``driver``
+
+    ``driver`` provides ``command()`` returning command packet and
+    ``update(status)`` returning False when the simulation stopped."""
+
+    def __init__(self, driver, sim_address, loop, period=None):
+        self.driver = driver
+        self.sim_address = sim_address
+        self.period = period
+        self.transport = None
+        self.records = asyncio.Queue()
+        self.done = loop.create_future()
+        self.received = 0
+        self.sent = 0
+        self.last_received = None
+        self.last_sent = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def send_command(self):
+        data = self.driver.command()
+        self.records.put_nowait((OUTPUT, bytes(data)))  # logged later
+        self.transport.sendto(data, self.sim_address)
+        self.sent += 1
+        self.last_sent = time.perf_counter()
+
+    def datagram_received(self, data, addr):
+        if self.done.done():
+            return
+        self.records.put_nowait((INPUT, data))
+        self.received += 1
+        self.last_received = time.perf_counter()
+        if not self.driver.update(data):
+            self.done.set_result(True)
+        elif self.period is None:
+            self.send_command()
+
+    def error_received(self, exc):
+        pass  # i.e. simulator not running yet
+
+    def connection_lost(self, exc):
+        if not self.done.done():
+            self.done.set_result(False)
+
+    def stats(self):
+        return {'received': self.received, 'sent': self.sent,
+                'queued_records': self.records.qsize()}
+
+
+def get_running_loop():
+    """Return loop of the current coroutine (asyncio.get_running_loop is
+    Python 3.7+, older get_event_loop returns it inside coroutines)"""
+    if hasattr(asyncio, 'get_running_loop'):
+        return asyncio.get_running_loop()
+    return asyncio.get_event_loop()
+
+
+async def send_loop(protocol):
+    """Send commands every ``protocol.period`` seconds"""
+    while True:
+        protocol.send_command()
+        await asyncio.sleep(protocol.period)
+
+
+async def resend_loop(protocol, timeout):
+    """Keep the simulator alive when reply mode lost a packet
+
+    The command is sent again ``timeout`` seconds after the last one, i.e.
+    the loop stalls at most ``timeout`` seconds."""
+    while True:
+        delay = protocol.last_sent + timeout - time.perf_counter()
+        if delay <= 0:
+            protocol.send_command()
+            delay = timeout
+        await asyncio.sleep(delay)
+
+
+async def log_loop(protocol, log):
+    """Store packets via ``log.log(io_dir, data)`` (i.e. IOLog)"""
+    while True:
+        io_dir, data = await protocol.records.get()
+        log.log(io_dir, data)
+
+
+async def telemetry_loop(protocol, telemetry, period):
+    while True:
+        await asyncio.sleep(period)
+        telemetry(protocol.stats())
+
+
+async def run_car(driver, port=4001, sim_address=SIM_ADDRESS, log=None,
+                  period=None, timeout=RESEND_TIMEOUT, telemetry=None,
+                  telemetry_period=1.0, ready=None):
+    """Drive one car until the simulation stops, return protocol stats
+
+    ``timeout`` is the resend timeout of reply mode (``period=None``),
+    ``ready`` is optional callback with bound (host, port) address."""
+    loop = get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+            lambda: CarProtocol(driver, sim_address, loop, period),
+            local_addr=('0.0.0.0', port))
+    if ready is not None:
+        ready(transport.get_extra_info('sockname'))
+    tasks = []
+    if period is None:
+        protocol.send_command()
+        tasks.append(loop.create_task(resend_loop(protocol, timeout)))
+    else:
+        tasks.append(loop.create_task(send_loop(protocol)))
+    if log is not None:
+        tasks.append(loop.create_task(log_loop(protocol, log)))
+    if telemetry is not None:
+        tasks.append(loop.create_task(
+                telemetry_loop(protocol, telemetry, telemetry_period)))
+    try:
+        await protocol.done
+        while log is not None and not protocol.records.empty():
+            io_dir, data = protocol.records.get_nowait()
+            log.log(io_dir, data)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        transport.close()
+    return protocol.stats()
+
+
+async def run_cars(cars):
+    """Run several cars in one process, ``cars`` is list of ``run_car``
+    keyword arguments"""
+    return await asyncio.gather(*[run_car(**car) for car in cars])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(2)
+    filename = sys.argv[1]
+    track = Track.from_xml_file(filename)
+    prefix = os.path.splitext(os.path.basename(filename))[0]
+
+    ports = [int(port) for port in sys.argv[2:]] or [4001, 3001]
+    cars = []
+    logs = []
+    for port, sim_port in zip(ports[::2], ports[1::2]):
+        log = IOLog(prefix='{}-{}'.format(prefix, port), buffered=True)
+        logs.append(log)
+        cars.append({'driver': Driver(track), 'port': port,
+                     'sim_address': ('127.0.0.1', sim_port), 'log': log,
+                     'telemetry': print})
+    loop = asyncio.new_event_loop()
+    try:
+        print(loop.run_until_complete(run_cars(cars)))
+    finally:
+        loop.close()
+        for log in logs:
+            log.close()
+
+# vim: expandtab sw=4 ts=4
@@ -0,0 +1,189 @@
+"""
+  Benchmarks of geometry, packet decoding and log I/O hot paths
+  usage:
+     python benchmark.py [<output JSON> [<reference JSON>]]
+
+  Results are stored as JSON (time per call in microseconds) and compared
+  with the reference results when given.
+"""
+import json
+import math
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+from fixtures import center_line_log
+from iolog import packet_gen, convert_log, INPUT
+from packets import Sensors, load_log, sensors_array
+from segment import Segment, normalize_angle
+from track import Track
+
+TRACK_SIZES = [10, 100, 1000, 10000]
+LOG_SIZES = [1000, 10000, 100000]
+
+
+def synthetic_track(num_segments, width=12.0):
+    """Closed track of straights and left turns (rounded polygon)"""
+    corners = max(2, num_segments // 2)
+    arc = 2 * math.pi / corners
+    segments = []
+    for i in range(corners):
+        segments.append(Segment(name='s%d' % i, length=50.0))
+        segments.append(Segment(name='t%d' % i, arc=arc, radius=30.0))
+    return Track(segments[:max(num_segments, 2)], width)
+
+
+def track_xml(track):
+    """Return Speed Dreams like XML description of the track"""
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<params name="synthetic" type="param">',
+             '  <section name="Main Track">',
+             '    <attnum name="width" unit="m" val="{}"/>'.format(track.width),
+             '    <attnum name="profil steps length" unit="m" val="4.0"/>',
+             '    <section name="Track Segments">']
+    for s in track.segments:
+        lines.append('      <section name="{}">'.format(s.name))
+        if s.length is not None:
+            lines.append('        <attstr name="type" val="str"/>')
+            lines.append('        <attnum name="lg" unit="m" val="{!r}"/>'.format(s.length))
+        else:
+            lines.append('        <attstr name="type" val="{}"/>'.format(
+                         'lft' if s.arc > 0 else 'rgt'))
+            lines.append('        <attnum name="arc" unit="deg" val="{!r}"/>'.format(
+                         math.degrees(abs(s.arc))))
+            lines.append('        <attnum name="radius" unit="m" val="{!r}"/>'.format(
+                         s.radius))
+        lines.append('        <section name="Left Side">')
+        lines.append('          <attnum name="width" unit="m" val="3.0"/>')
+        lines.append('        </section>')
+        lines.append('      </section>')
+    lines += ['    </section>', '  </section>', '</params>', '']
+    return '\n'.join(lines)
+
+
+def measure(name, func, min_time=0.2, **params):
+    """Return benchmark result with time per call in microseconds"""
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        duration = timer.timeit(number)
+        if duration >= min_time:
+            break
+        number *= 10 if duration < min_time / 10 else 2
+    return {'name': name, 'params': params, 'calls': number,
+            'us_per_call': duration / number * 1e6}
+
+
+def geometry_benchmarks(track_sizes, min_time):
+    results = []
+    segment = Segment(arc=math.radians(90), radius=50.0)
+    spiral = Segment(arc=math.radians(-90), radius=30.0, end_radius=60.0)
+    results.append(measure('normalize_angle', lambda: normalize_angle(123.4),
+                           min_time))
+    results.append(measure('Segment.get_offset', lambda: segment.get_offset((10.0, 2.0, 0.3)),
+                           min_time, segment='arc'))
+    results.append(measure('Segment.get_offset', lambda: spiral.get_offset((10.0, -2.0, 0.3)),
+                           min_time, segment='variable'))
+    results.append(measure('Segment.step', lambda: segment.step((1.0, 2.0, 0.3)), min_time))
+
+    for size in track_sizes:
+        track = synthetic_track(size)
+        pose = track.station_to_pose(track.length * 0.37)
+        pose = (pose[0] + 1.0, pose[1] - 1.0, pose[2])
+        results.append(measure('Track.nearest_segment',
+                               lambda: track.nearest_segment(pose), min_time,
+                               segments=size))
+        results.append(measure('Track.nearest_segment_scan',
+                               lambda: track.nearest_segment_scan(pose), min_time,
+                               segments=size))
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp_dir, 'track.xml')
+            with open(filename, 'w') as f:
+                f.write(track_xml(track))
+            for parser in ['etree', 'minidom']:
+                results.append(measure('Track.from_xml_file',
+                                       lambda: Track.from_xml_file(filename, parser=parser),
+                                       min_time, segments=size, parser=parser))
+            cache_dir = os.path.join(tmp_dir, 'cache')
+            Track.from_xml_file(filename, cache_dir=cache_dir)
+            results.append(measure('Track.from_xml_file',
+                                   lambda: Track.from_xml_file(filename, cache_dir=cache_dir),
+                                   min_time, segments=size, parser='cache'))
+        finally:
+            shutil.rmtree(tmp_dir)
+    return results
+
+
+def log_benchmarks(log_sizes, min_time):
+    results = []
+    track = synthetic_track(100)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for size in log_sizes:
+            filename = os.path.join(tmp_dir, 'log%d.log' % size)
+            center_line_log(filename, track, size)
+            if size == log_sizes[0]:
+                packet = next(data for io_dir, data in packet_gen(filename)
+                              if io_dir == INPUT)
+                results.append(measure('Sensors.from_packet',
+                                       lambda: Sensors.from_packet(packet), min_time))
+                results.append(measure('sensors_array',
+                                       lambda: sensors_array(packet), min_time))
+
+            compressed = filename + '.v2'
+            convert_log(filename, compressed)
+            for name, version in [(filename, 1), (compressed, 2)]:
+                results.append(measure('packet_gen',
+                                       lambda: sum(1 for rec in packet_gen(name)),
+                                       min_time, packets=size, version=version))
+                results.append(measure('load_log', lambda: load_log(name),
+                                       min_time, packets=size, version=version))
+    finally:
+        shutil.rmtree(tmp_dir)
+    return results
+
+
+def run_benchmarks(track_sizes=TRACK_SIZES, log_sizes=LOG_SIZES, min_time=0.2):
+    return {'python': platform.python_version(),
+            'machine': platform.machine(),
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'results': geometry_benchmarks(track_sizes, min_time) +
+                       log_benchmarks(log_sizes, min_time)}
+
+
+def compare(results, reference):
+    """Return list of (name, params, reference us, us, ratio)"""
+    ref = dict((r['name'] + json.dumps(r['params'], sort_keys=True), r)
+               for r in reference['results'])
+    ret = []
+    for r in results['results']:
+        key = r['name'] + json.dumps(r['params'], sort_keys=True)
+        if key in ref:
+            ret.append((r['name'], r['params'], ref[key]['us_per_call'],
+                        r['us_per_call'], r['us_per_call'] / ref[key]['us_per_call']))
+    return ret
+
+
+if __name__ == "__main__":
+    results = run_benchmarks()
+    for r in results['results']:
+        print('{:30s} {:40s} {:14.3f} us'.format(r['name'], json.dumps(r['params']),
+                                                 r['us_per_call']))
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'w') as f:
+            json.dump(results, f, indent=2)
+    if len(sys.argv) > 2:
+        with open(sys.argv[2]) as f:
+            reference = json.load(f)
+        print()
+        for name, params, ref_us, us, ratio in compare(results, reference):
+            print('{:40s} {:30s} {:10.3f} -> {:10.3f} us ({:.2f}x)'.format(
+                  name, json.dumps(params), ref_us, us, ratio))
+
+# vim: expandtab sw=4 ts=4
@@ -0,0 +1,191 @@
+"""
+  Controller interface and the runtime driving it
+
+  Controller.control(sensors, context) gets decoded SensorView and
+  TrackContext with the current localization and returns Command.
+  Runtime owns decoding, command packing and lap bookkeeping, ``run``
+  owns socket I/O (logging is done by IOLog).
+"""
+import math
+import struct
+
+import numpy as np
+
+from iolog import Timeout
+from packets import Command, Sensors, SENSORS_DTYPE
+from track import TrackLocalizer
+
+COMMAND_STRUCT = struct.Struct('fffiBB')
+
+# lap time, dist start, last lap time, position, angles, velocity,
+# sim status and counter of the sensors packet (see doc/from-simulator.md)
+SENSORS_STRUCT = struct.Struct('<3f32x3f3f12x3f700x2B')
+assert SENSORS_STRUCT.size == SENSORS_DTYPE.itemsize
+
+
+class SensorView(object):
+    """Sensors packet decoded in place into scalar attributes"""
+
+    __slots__ = ('packet', 'lap_time', 'dist', 'last_lap_time',
+                 'x', 'y', 'z', 'roll', 'pitch', 'heading',
+                 'vx', 'vy', 'vz', 'sim_status', 'sim_counter')
+
+    def __init__(self):
+        self.packet = None
+
+    def update(self, packet):
+        assert len(packet) == SENSORS_STRUCT.size, len(packet)
+        self.packet = packet
+        (self.lap_time, self.dist, self.last_lap_time,
+         self.x, self.y, self.z, self.roll, self.pitch, self.heading,
+         self.vx, self.vy, self.vz,
+         self.sim_status, self.sim_counter) = SENSORS_STRUCT.unpack_from(packet)
+
+    def running(self):
+        return self.sim_status != Sensors.SIMULATION_STOPPED
+
+    def speed(self):
+        return math.sqrt(self.vx*self.vx + self.vy*self.vy + self.vz*self.vz)
+
+    def record(self):
+        """Return complete packet as SENSORS_DTYPE record (i.e. for V2x)"""
+        return np.frombuffer(self.packet, dtype=SENSORS_DTYPE)[0]
+
+
+class TrackContext(object):
+    """Track with the current localization of the car
+
+    After ``update`` the ``index``, ``segment`` and ``rel_pose`` of the
+    nearest segment are set (None outside of the track) together with
+    signed ``offset`` and ``heading_offset`` from the center line."""
+
+    def __init__(self, track, profiler=None):
+        self.track = track
+        self.profiler = profiler
+        self.localizer = TrackLocalizer(track)
+        self.index = None
+        self.segment = None
+        self.rel_pose = None
+        self.offset = None
+        self.heading_offset = None
+
+    def update(self, sensors):
+        self.segment, self.rel_pose = self.localizer.nearest_segment(
+                (sensors.x, sensors.y, sensors.heading))
+        if self.profiler is not None:
+            self.profiler.mark('nearest_segment')
+        if self.segment is None:
+            self.index = None
+            self.offset = self.heading_offset = None
+            return
+        self.index = self.localizer.index
+        self.offset, self.heading_offset = self.segment.get_offset(self.rel_pose)
+        if self.profiler is not None:
+            self.profiler.mark('get_offset')
+
+    def station(self):
+        """Return distance along the track of the last update"""
+        if self.segment is None:
+            return None
+        return self.track.stations[self.index] + self.segment.get_station(self.rel_pose)
+
+
+class Controller(object):
+    """Base class of car controllers"""
+
+    def control(self, sensors, context):
+        """Return Command for SensorView and TrackContext
+
+        None keeps the previous command."""
+        raise NotImplementedError()
+
+
+class Runtime(object):
+    """Drive ``controller`` from sensor packets
+
+    ``update(packet)`` decodes the packet, localizes the car and asks the
+    controller, ``pack()`` writes the last command into the preallocated
+    ``buffer``. A lap is completed when LapTime restarts (like
+    ``lapstats.split_laps``), its LastLapTime is collected in
+    ``lap_times``."""
+
+    def __init__(self, controller, track, profiler=None):
+        self.controller = controller
+        self.profiler = profiler
+        self.sensors = SensorView()
+        self.context = TrackContext(track, profiler)
+        self.last_command = Command(0.0, 0.0, 0.0)
+        self.buffer = bytearray(COMMAND_STRUCT.size)
+        self.ctr = 0
+        self.lap_time = None
+        self.last_lap_time = None
+        self.lap_times = []
+
+    def pack(self):
+        """Return command packet (the buffer is reused by the next call)"""
+        cmd = self.last_command
+        COMMAND_STRUCT.pack_into(self.buffer, 0, cmd.steering, cmd.acc, cmd.brake,
+                                 cmd.gear_pos, cmd.ctrl_mode, self.ctr & 0xFF)
+        self.ctr += 1
+        return self.buffer
+
+    def command(self):
+        """Return next command packet for other runtimes (asyncio, replay)
+
+        Like ``pack`` it is the reused ``buffer``, callers which keep the
+        packet after the next call have to copy it."""
+        return self.pack()
+
+    def update(self, status):
+        """Process sensors packet, return False when simulation stopped"""
+        sensors = self.sensors
+        sensors.update(status)
+        if not sensors.running():
+            return False
+        if self.lap_time is not None and sensors.lap_time < self.lap_time:
+            # identical lap times are still separate laps
+            lap_time = sensors.last_lap_time
+            if lap_time <= 0:
+                lap_time = self.lap_time  # LastLapTime not provided
+            self.lap_times.append(lap_time)
+        self.lap_time = sensors.lap_time
+        self.last_lap_time = sensors.last_lap_time
+        self.context.update(sensors)
+        cmd = self.controller.control(sensors, self.context)
+        if cmd is not None:
+            self.last_command = cmd
+        if self.profiler is not None:
+            self.profiler.mark('control')
+        return True
+
+
+def run(io, runtime, port=4001, sim_address=('127.0.0.1', 3001), max_timeouts=None):
+    """Control loop until the simulation stops
+
+    With ``max_timeouts`` the loop also ends after that many consecutive
+    receive timeouts (simulator is gone)."""
+    profiler = runtime.profiler
+    io.bind(('', port))
+    io.settimeout(1.0)
+    timeouts = 0
+    while True:
+        data = runtime.pack()
+        if profiler is not None:
+            profiler.mark('command')
+        io.sendto(data, sim_address)
+        if profiler is not None:
+            profiler.end()
+        try:
+            status = io.recv(1024)
+            if profiler is not None and profiler.tick_start is None:
+                profiler.begin(status)  # io without profiler support
+            timeouts = 0
+            if not runtime.update(status):
+                break
+        except Timeout:
+            timeouts += 1
+            if max_timeouts is not None and timeouts >= max_timeouts:
+                break
+    return runtime
+
+# vim: expandtab sw=4 ts=4
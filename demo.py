@@ -2,15 +2,19 @@
   follow the race loop
 
   usage:
-     demo.py <track XML file> [<input log file>]
+     demo.py [--profile] <track XML file> [<input log file>]
+
+  With --profile the latency of control loop stages is reported at the end.
 """
 
 import math
 import os
-import struct
 import sys
 
-from iolog import IOLog, Timeout, IOFromFile
+from controller import Controller, Runtime, run
+from iolog import IOLog, IOFromFile
+from latency import LoopProfiler
+from packets import Command
 from track import Track
 
 
@@ -32,71 +36,100 @@ def segment_turn(segment):
     return math.degrees(angle)
 
 
-def drive(io, track):
-    port = 4001
-    io.bind(('', port))
-    io.settimeout(1.0)
-    ctr = 0
-    gas = 0.0
-    brake = 0.0
-    turn = 0.0
-    prev_segment = None
-    while True:
-        data = struct.pack('fffiBB', turn, gas, brake, 1, 11, ctr & 0xFF)
-        io.sendto(data, ('127.0.0.1', 3001))
-        try:
-            status = io.recv(1024)
-            assert len(status) == 794, len(status)
-            sim_status = struct.unpack_from('B', status, 792)[0]
-            if sim_status == 5: # simulation stopped
-                break
-            absPosX, absPosY, absPosZ = struct.unpack_from('fff', status, 44)
-            angX, angY, angZ = struct.unpack_from('fff', status, 56)
-            heading = angZ  # in radiands +/- PI
-            segment, rel_pose = track.nearest_segment((absPosX, absPosY, heading))
-            if segment is not None:
-                signed_dist, heading_offset = segment.get_offset(rel_pose)
-                if signed_dist < 5.0:
-                    gas = 0.2
-                else:
-                    gas = 0.1
-
-                turn = segment_turn(segment)
-                if heading_offset is not None:
-                    turn -= math.degrees(heading_offset)
-
-                dead_band = 0.1
-                max_dist_turn_deg = 10
-
-                if signed_dist < -dead_band:
-                    # turn left
-                    turn += min(max_dist_turn_deg, -dead_band - signed_dist)
-
-                elif signed_dist > dead_band:
-                    # turn right
-                    turn += max(-max_dist_turn_deg, dead_band - signed_dist)
-
-            if prev_segment != segment:
-                print(segment, rel_pose)
-                prev_segment = segment
-
-        except Timeout:
-            pass
-        ctr += 1
+class DemoController(Controller):
+    """Follow the track center line with turn feed-forward of the segment
+    and dead band steering correction"""
+
+    def __init__(self, track, verbose=True,
+                 gas=0.2, slow_gas=0.1, dead_band=0.1, max_dist_turn_deg=10):
+        self.verbose = verbose
+        self.gas = gas
+        self.slow_gas = slow_gas
+        self.dead_band = dead_band
+        self.max_dist_turn_deg = max_dist_turn_deg
+        self.feed_forward = [segment_turn(segment) for segment in track.segments]
+        self.prev_segment = None
+
+    def control(self, sensors, context):
+        """Return new Command, None (keep the previous one) outside of the track"""
+        cmd = None
+        segment = context.segment
+        if segment is not None:
+            signed_dist = context.offset
+            if signed_dist < 5.0:
+                acc = self.gas
+            else:
+                acc = self.slow_gas
+
+            turn = self.feed_forward[context.index]
+            if context.heading_offset is not None:
+                turn -= math.degrees(context.heading_offset)
+
+            dead_band = self.dead_band
+            max_dist_turn_deg = self.max_dist_turn_deg
+
+            if signed_dist < -dead_band:
+                # turn left
+                turn += min(max_dist_turn_deg, -dead_band - signed_dist)
+
+            elif signed_dist > dead_band:
+                # turn right
+                turn += max(-max_dist_turn_deg, dead_band - signed_dist)
+            cmd = Command(turn, acc, 0.0)
+
+        if self.prev_segment != segment:
+            if self.verbose:
+                print(segment, context.rel_pose)
+            self.prev_segment = segment
+        return cmd
+
+
+class Driver(Runtime):
+    """Demo controller following the track center line
+
+    ``command()`` and ``update(status)`` can be used by other runtimes
+    (asyncio, replay)."""
+
+    def __init__(self, track, verbose=True, profiler=None, **gains):
+        Runtime.__init__(self, DemoController(track, verbose, **gains), track,
+                         profiler=profiler)
+        self.track = track
+
+
+def drive(io, track, profiler=None, port=4001, sim_address=('127.0.0.1', 3001),
+          driver=None, max_timeouts=None):
+    """Control loop until the simulation stops, return the driver
+
+    With ``max_timeouts`` the loop also ends after that many consecutive
+    receive timeouts (simulator is gone)."""
+    if driver is None:
+        driver = Driver(track, profiler=profiler)
+    return run(io, driver, port=port, sim_address=sim_address,
+               max_timeouts=max_timeouts)
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
+    args = sys.argv[1:]
+    profiler = None
+    if '--profile' in args:
+        args.remove('--profile')
+        profiler = LoopProfiler()
+    if len(args) < 1:
         print(__doc__)
         sys.exit(2)
-    filename = sys.argv[1]
+    filename = args[0]
     track = Track.from_xml_file(filename)
 
-    if len(sys.argv) == 2:
+    if len(args) == 1:
         prefix = os.path.splitext(os.path.basename(filename))[0]
-        io = IOLog(prefix=prefix)
+        io = IOLog(prefix=prefix, buffered=True, profiler=profiler)
     else:
-        io = IOFromFile(filename=sys.argv[2])
-
-    drive(io, track)
+        io = IOFromFile(filename=args[1])
+
+    try:
+        drive(io, track, profiler=profiler)
+    finally:
+        io.close()
+        if profiler is not None:
+            print(profiler.format_report())
 
 # vim: expandtab sw=4 ts=4
@@ -0,0 +1,90 @@
+"""
+  Synthetic tracks, sensor packets and logs for tests and benchmarks
+
+  Packets follow the layout of doc/from-simulator.md, fields which are
+  not given stay zero.
+"""
+import math
+import struct
+
+import numpy as np
+
+from iolog import MAGIC_HEADER, VERSION, INPUT, OUTPUT
+from packets import Sensors, SENSORS_DTYPE
+from segment import Segment
+from track import Track
+
+SIMULATION_RUNNING = 3
+
+COMMAND_PACKET = struct.pack('fffiBB', 0.0, 0.2, 0.0, 1, 11, 0)
+
+
+def square_track(width=10.0):
+    """Closed track of four 100 m straights and 90 degrees left turns"""
+    segments = []
+    for i in range(4):
+        segments.append(Segment(name='s%d' % i, length=100.0))
+        segments.append(Segment(name='t%d' % i, arc=math.pi/2, radius=20.0))
+    return Track(segments, width=width)
+
+
+def sensors_packet(lap_time=0.0, x=0.0, y=0.0, heading=0.0,
+                   sim_status=SIMULATION_RUNNING, dist=0.0, last_lap_time=0.0,
+                   z=0.0, velocity=(0.0, 0.0, 0.0), counter=0):
+    """Return sensors packet (bytes) with the given values"""
+    packet = bytearray(SENSORS_DTYPE.itemsize)
+    struct.pack_into('fff', packet, 0, lap_time, dist, last_lap_time)
+    struct.pack_into('fff', packet, 44, x, y, z)
+    struct.pack_into('f', packet, 64, heading)
+    struct.pack_into('fff', packet, 80, *velocity)
+    struct.pack_into('BB', packet, 792, sim_status, counter & 0xFF)
+    return bytes(packet)
+
+
+def v2x_packet(objects):
+    """Return sensors packet with V2x list of (type, x, y, speed, yaw)"""
+    record = np.zeros(1, dtype=SENSORS_DTYPE)
+    record['v2x_n'] = len(objects)
+    for i, (obj_type, x, y, speed, yaw) in enumerate(objects):
+        record['v2x_type'][0, i] = obj_type
+        record['v2x_x_pos'][0, i] = x
+        record['v2x_y_pos'][0, i] = y
+        record['v2x_speed'][0, i] = speed
+        record['v2x_yaw'][0, i] = yaw
+    return record.tobytes()
+
+
+def write_log(f, records):
+    """Write (io_dir, data) records as log version 1 into open file"""
+    f.write(struct.pack('II', MAGIC_HEADER, VERSION))
+    for io_dir, data in records:
+        f.write(struct.pack('HH', len(data) + 2, io_dir))
+        f.write(data)
+
+
+def center_line_log(filename, track, count, start=0.0, speed=25.0, dt=0.02, offset=0.0):
+    """Write log of car driving ``offset`` meters left of the center line
+
+    The car starts at station ``start`` with constant ``speed``, there are
+    ``count`` sensors packets ``dt`` seconds apart followed by simulation
+    stop. LapTime restarts at the start line, LastLapTime is the time of
+    the previous lap (0 in the first lap)."""
+    lap_length = track.length
+    records = []
+    for i in range(count):
+        station = start + i * speed * dt
+        lap = int(station // lap_length)
+        x, y, heading = track.station_to_pose(station)
+        ca, sa = math.cos(heading), math.sin(heading)
+        packet = sensors_packet((station % lap_length) / speed,
+                                x - offset * sa, y + offset * ca, heading,
+                                dist=station % lap_length,
+                                last_lap_time=lap_length / speed if lap > 0 else 0.0,
+                                velocity=(speed * ca, speed * sa, 0.0), counter=i)
+        records.append((OUTPUT, COMMAND_PACKET))
+        records.append((INPUT, packet))
+    records.append((INPUT, sensors_packet(sim_status=Sensors.SIMULATION_STOPPED)))
+    with open(filename, 'wb') as f:
+        write_log(f, records)
+
+# vim: expandtab sw=4 ts=4
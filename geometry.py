@@ -0,0 +1,100 @@
+"""
+  Fast scalar geometry for the control loop
+
+  Closed-form angle wrapping, variable radius turn lengths and
+  per-segment precomputed transforms evaluated without tuple allocations.
+"""
+import math
+
+import numpy as np
+
+PI = math.pi
+TWO_PI = 2 * math.pi
+
+
+def wrap_angle(angle):
+    """angle in radians, return in range -PI .. PI (closed form of
+    ``segment.normalize_angle``)"""
+    if -PI <= angle <= PI:
+        return angle
+    return angle - TWO_PI * math.floor((angle + PI) / TWO_PI)
+
+
+def spiral_length(radius, slope, angle):
+    """Return length of variable radius turn after ``angle`` radians
+
+    The turn radius grows linearly ``radius + slope*angle`` around fixed
+    center (Archimedean spiral). The closed form integral is rearranged
+    so it stays exact for ``slope`` going to zero (constant radius)."""
+    end = radius + slope*angle
+    q0, q1 = math.hypot(radius, slope), math.hypot(end, slope)
+    length = (angle * (radius + end) * (radius*radius + end*end + slope*slope)
+              / (2.0 * (end*q1 + radius*q0)))
+    return length + slope / 2.0 * math.log1p(
+            slope * angle * (1.0 + (radius + end) / (q0 + q1)) / (radius + q0))
+
+
+def spiral_angle(radius, slope, station, iterations=4):
+    """Return angle of variable radius turn after ``station`` meters
+    (inverse of ``spiral_length``)"""
+    if abs(slope) < 1e-9:
+        angle = station / radius
+    else:
+        # the length without the radial component as initial guess
+        angle = (math.sqrt(max(0.0, radius*radius + 2.0*slope*station))
+                 - radius) / slope
+    for i in range(iterations):
+        angle -= ((spiral_length(radius, slope, angle) - station)
+                  / math.hypot(radius + slope*angle, slope))
+    return angle
+
+
+def spiral_lengths(radius, slope, angle):
+    """Vectorized ``spiral_length``"""
+    end = radius + slope*angle
+    q0, q1 = np.hypot(radius, slope), np.hypot(end, slope)
+    length = (angle * (radius + end) * (radius*radius + end*end + slope*slope)
+              / (2.0 * (end*q1 + radius*q0)))
+    return length + slope / 2.0 * np.log1p(
+            slope * angle * (1.0 + (radius + end) / (q0 + q1)) / (radius + q0))
+
+
+def spiral_angles(radius, slope, station, iterations=4):
+    """Vectorized ``spiral_angle``"""
+    small = np.abs(slope) < 1e-9
+    safe_slope = np.where(small, 1.0, slope)
+    angle = np.where(small, station / radius,
+                     (np.sqrt(np.maximum(0.0, radius*radius + 2.0*slope*station))
+                      - radius) / safe_slope)
+    for i in range(iterations):
+        angle = angle - ((spiral_lengths(radius, slope, angle) - station)
+                         / np.hypot(radius + slope*angle, slope))
+    return angle
+
+
+class SegmentGeometry(object):
+    """Segment with precomputed start pose transform
+
+    ``distance(x, y)`` converts the global point like ``track.relative_pose``
+    and returns the signed distance of ``Segment.project`` without creating
+    intermediate pose tuples."""
+
+    __slots__ = ('project', 'length', 'x', 'y', 'heading', 'ca', 'sa')
+
+    def __init__(self, segment, start):
+        self.project = segment.project
+        self.length = segment.get_length()
+        self.x, self.y, self.heading = start
+        self.ca, self.sa = math.cos(-self.heading), math.sin(-self.heading)  # rotate back
+
+    def distance(self, global_x, global_y):
+        """Return signed distance of global point or None outside of the segment"""
+        sx = global_x - self.x
+        sy = global_y - self.y
+        dist, station, heading = self.project(self.ca*sx - self.sa*sy,
+                                              self.sa*sx + self.ca*sy)
+        if 0 <= station <= self.length:
+            return dist
+        return None
+
+# vim: expandtab sw=4 ts=4
@@ -0,0 +1,120 @@
+"""
+  Drive several cars against several simulators in parallel processes
+  usage:
+     python harness.py <track XML file> <number of cars> [<first port> [<first simulator port>]]
+
+  Car i listens on <first port> + i and talks to simulator on
+  127.0.0.1:<first simulator port> + i. Results are printed as JSON lines
+  followed by the summary.
+"""
+import json
+from multiprocessing import Pool
+import os
+import sys
+import time
+
+from demo import Driver, drive
+from iolog import IOLog
+from track import Track
+
+
+def make_configs(track_filename, count, port=4001, sim_port=3001,
+                 sim_host='127.0.0.1', prefix=None, gains=None, **options):
+    """Return list of ``run_instance`` configurations
+
+    Instance i gets port pair ``port`` + i, ``sim_port`` + i and log
+    prefix <prefix>-<i>. ``gains`` is an optional list of Driver keyword
+    arguments (one dict per instance) for parameter sweeps, other
+    ``options`` are shared by all instances."""
+    if prefix is None:
+        prefix = os.path.splitext(os.path.basename(track_filename))[0]
+    if gains is not None:
+        assert len(gains) == count, (len(gains), count)
+    configs = []
+    for i in range(count):
+        config = {'name': '{}-{}'.format(prefix, i),
+                  'track': track_filename,
+                  'port': port + i,
+                  'sim_address': (sim_host, sim_port + i),
+                  'gains': {} if gains is None else dict(gains[i])}
+        config.update(options)
+        configs.append(config)
+    return configs
+
+
+def run_instance(config):
+    """Drive one car until its simulation stops, return dictionary result
+
+    Recognized ``config`` keys are name, track, port, sim_address, gains
+    and optional cache_dir, log_dir, max_timeouts (default 10)."""
+    start = time.time()
+    result = {'name': config['name'], 'port': config['port'],
+              'sim_address': list(config['sim_address']),
+              'gains': config.get('gains', {}), 'ok': False, 'error': None,
+              'log': None, 'lap_times': [], 'lap_time': None,
+              'last_lap_time': None}
+    try:
+        track = Track.from_xml_file(config['track'],
+                                    cache_dir=config.get('cache_dir'))
+        driver = Driver(track, verbose=False, **config.get('gains', {}))
+        io = IOLog(prefix=config['name'], buffered=True,
+                   log_dir=config.get('log_dir', 'logs'))
+        result['log'] = io.filename
+        try:
+            drive(io, track, port=config['port'],
+                  sim_address=tuple(config['sim_address']), driver=driver,
+                  max_timeouts=config.get('max_timeouts', 10))
+        finally:
+            io.close()
+        result.update({'ok': True,
+                       'lap_times': driver.lap_times,
+                       'lap_time': driver.lap_time,
+                       'last_lap_time': driver.last_lap_time})
+    except Exception as e:
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    result['seconds'] = time.time() - start
+    return result
+
+
+def run_harness(configs, processes=None):
+    """Run instances in parallel processes, return list of results"""
+    if processes is None:
+        processes = len(configs)
+    pool = Pool(processes)
+    try:
+        return pool.map(run_instance, configs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def summarize(results):
+    """Return summary of ``run_instance`` results with the best lap"""
+    summary = {'instances': len(results),
+               'failed': [r['name'] for r in results if not r['ok']],
+               'laps': sum(len(r['lap_times']) for r in results),
+               'best_lap_time': None, 'best': None}
+    for r in results:
+        if r['lap_times']:
+            best = min(r['lap_times'])
+            if summary['best_lap_time'] is None or best < summary['best_lap_time']:
+                summary['best_lap_time'] = best
+                summary['best'] = r['name']
+    return summary
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(2)
+
+    ports = [int(x) for x in sys.argv[3:5]]
+    results = run_harness(make_configs(sys.argv[1], int(sys.argv[2]), *ports))
+    for result in results:
+        print(json.dumps(result))
+    summary = summarize(results)
+    print(json.dumps(summary))
+    if summary['failed']:
+        sys.exit(1)
+
+# vim: expandtab sw=4 ts=4
@@ -1,15 +1,33 @@
 """
   Input/Output logging
+  usage:
+     python iolog.py <input log> <output log> [<version>]
+
+  Convert log to given version (default 2 = compressed) and report
+  compression ratio and decoding speed.
 """
 
+from collections import deque
 from datetime import datetime
+import mmap
 import os
 import socket
-from struct import pack, unpack
+from struct import pack, unpack, unpack_from
+import sys
+import threading
+import time
+import zlib
+
+import numpy as np
 
 
 MAGIC_HEADER = 0x492F4F01  # I/O
 VERSION = 1
+VERSION_COMPRESSED = 2  # zlib compressed blocks of VERSION 1 records
+
+# raw size, compressed size and number of records in the block
+BLOCK_HEADER = 'III'
+BLOCK_HEADER_SIZE = 12
 
 INPUT = 1
 OUTPUT = 0
@@ -19,16 +37,171 @@ class Timeout(socket.timeout):
     pass
 
 
+class BufferedWriter(object):
+    """File writer with bounded in-memory buffer drained by background thread
+
+    Every ``write()`` is kept as one record. When the buffer already holds
+    ``max_records`` the caller either waits (``block=True``, counted in
+    ``blocked``) or the record is thrown away (counted in ``dropped``).
+    The thread writes all buffered records at once when there are at
+    least ``batch_size`` bytes or after ``flush_interval`` seconds. Every
+    record is passed to ``f.write`` separately, so record oriented writers
+    (``CompressedWriter``) can be wrapped too."""
+
+    def __init__(self, f, max_records=4096, block=True, batch_size=64*1024,
+                 flush_interval=0.5, fsync=False):
+        self.f = f
+        self.max_records = max_records
+        self.block = block
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.buf = deque()
+        self.buf_size = 0
+        self.cond = threading.Condition()
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.flush_requests = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, data):
+        with self.cond:
+            assert not self.closed
+            if len(self.buf) >= self.max_records:
+                if not self.block:
+                    self.dropped += 1
+                    return
+                self.blocked += 1
+                while len(self.buf) >= self.max_records:
+                    self.cond.wait()
+            self.buf.append(data)
+            self.buf_size += len(data)
+            self.queued += 1
+            if self.buf_size >= self.batch_size:
+                self.cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                # pending flush with everything written waits like no flush
+                if (not self.closed and self.buf_size < self.batch_size
+                        and (not self.flush_requests or self.written >= self.queued)):
+                    self.cond.wait(self.flush_interval)
+                batch = list(self.buf)
+                self.buf.clear()
+                self.buf_size = 0
+                closing = self.closed
+                self.cond.notify_all()  # space for blocked writers
+            for data in batch:
+                self.f.write(data)
+            self.f.flush()
+            if self.fsync:
+                os.fsync(self.f.fileno())
+            with self.cond:
+                self.written += len(batch)
+                self.cond.notify_all()
+            if closing:
+                break
+
+    def flush(self):
+        """Wait until all records written so far are on disk"""
+        with self.cond:
+            target = self.queued
+            self.flush_requests += 1
+            self.cond.notify_all()
+            while self.written < target:
+                self.cond.wait()
+            self.flush_requests -= 1
+
+    def close(self):
+        with self.cond:
+            if self.closed:
+                return
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join()
+        self.f.close()
+
+
+class CompressedWriter(object):
+    """Writer of VERSION_COMPRESSED log
+
+    Every ``write()`` is expected to be one complete record. Records are
+    collected into blocks of at least ``block_size`` bytes, so the last
+    unfinished block is written only on ``close()``."""
+
+    def __init__(self, f, block_size=256*1024, level=6):
+        self.f = f
+        self.block_size = block_size
+        self.level = level
+        self.records = []
+        self.size = 0
+        self.f.write(pack('II', MAGIC_HEADER, VERSION_COMPRESSED))
+
+    def write(self, data):
+        self.records.append(bytes(data))
+        self.size += len(data)
+        if self.size >= self.block_size:
+            self.write_block()
+
+    def write_block(self):
+        if not self.records:
+            return
+        raw = b''.join(self.records)
+        data = zlib.compress(raw, self.level)
+        self.f.write(pack(BLOCK_HEADER, len(raw), len(data), len(self.records)))
+        self.f.write(data)
+        self.records = []
+        self.size = 0
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.write_block()
+        self.f.close()
+
+
 class IOLog(object):
+    """Socket with logging of all sent and received packets
+
+    ``version`` selects log format (VERSION or VERSION_COMPRESSED).
+    With ``buffered=True`` the log is written from ``BufferedWriter``
+    thread, ``buffer_options`` are passed to its constructor. Optional
+    ``profiler`` (latency.LoopProfiler) times log writes and socket sends.
+    Log files are created in ``log_dir``."""
 
-    def __init__(self, prefix):
+    def __init__(self, prefix, buffered=False, version=VERSION, profiler=None,
+                 log_dir='logs', **buffer_options):
         self.soc = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.profiler = profiler
         
-        if not os.path.exists('logs'):
-            os.mkdir('logs')
-        filename = datetime.now().strftime('logs/'+prefix+'-%y%m%d_%H%M%S.log')
+        if not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+        filename = os.path.join(log_dir, datetime.now().strftime(
+                prefix + '-%y%m%d_%H%M%S.log'))
+        self.filename = filename
         self.f = open(filename, 'wb')
-        self.f.write(pack('II', MAGIC_HEADER, VERSION))
+        if version == VERSION_COMPRESSED:
+            self.f = CompressedWriter(self.f)
+        else:
+            assert version == VERSION, version
+            self.f.write(pack('II', MAGIC_HEADER, VERSION))
+        if buffered:
+            self.f = BufferedWriter(self.f, **buffer_options)
+
+    def close(self):
+        self.f.close()
+        self.soc.close()
+
+    def log(self, io_dir, data):
+        """Store packet without socket I/O (used by other runtimes)"""
+        self.f.write(pack('HH', len(data) + 2, io_dir) + data)
 
     def bind(self, address):
         self.soc.bind(address)
@@ -38,28 +211,46 @@ class IOLog(object):
 
     def sendto(self, data, address):
         try:
-            self.f.write(pack('HH', len(data) + 2, OUTPUT))
-            self.f.write(data)
+            self.f.write(pack('HH', len(data) + 2, OUTPUT) + data)
+            if self.profiler is not None:
+                self.profiler.mark('log')
             self.soc.sendto(data, address)
+            if self.profiler is not None:
+                self.profiler.mark('send')
         except socket.timeout as e:
             raise Timeout(e)
 
     def recv(self, bufsize):
         try:
             data = self.soc.recv(bufsize)
-            self.f.write(pack('HH', len(data) + 2, INPUT))
-            self.f.write(data)
+            if self.profiler is not None:
+                self.profiler.begin(data)
+            self.f.write(pack('HH', len(data) + 2, INPUT) + data)
+            if self.profiler is not None:
+                self.profiler.mark('log')
             return data
         except socket.timeout as e:
             raise Timeout(e)
 
 
 class IOFromFile(object):
+    """Replay of logged packets
+
+    ``recv`` raises Timeout when the log continues by a command (no packet
+    arrived during recording) and EOFError at the end of log. With
+    ``strict=False`` commands different from the log do not stop the
+    replay, they are collected in ``divergences`` as
+    (packet number, logged data, data)."""
+
+    def __init__(self, filename, strict=True):
+        self.f = open_log(filename)
+        self.strict = strict
+        self.divergences = []
+        self.packet_number = 0  # number of already replayed records
+        self.header = None
 
-    def __init__(self, filename):
-        self.f = open(filename, 'rb')
-        data = self.f.read(8)
-        assert unpack('II', data) == (MAGIC_HEADER, VERSION)
+    def close(self):
+        self.f.close()
 
     def bind(self, address):
         pass
@@ -67,29 +258,211 @@ class IOFromFile(object):
     def settimeout(self, value):
         pass
 
+    def _peek(self):
+        if self.header is None:
+            data = self.f.read(4)
+            if len(data) != 4:
+                raise EOFError()
+            self.header = unpack('HH', data)
+        return self.header
+
+    def _read(self):
+        length, io_dir = self._peek()
+        self.header = None
+        self.packet_number += 1
+        return self.f.read(length - 2)
+
     def sendto(self, data, address):
-        length, io_dir = unpack('HH', self.f.read(4))
+        length, io_dir = self._peek()
         assert io_dir == OUTPUT
-        ref_data = self.f.read(length - 2)
-        assert data == ref_data
+        packet_number = self.packet_number
+        ref_data = self._read()
+        if self.strict:
+            assert data == ref_data
+        elif data != ref_data:
+            self.divergences.append((packet_number, ref_data, bytes(data)))
 
     def recv(self, bufsize):
-        length, io_dir = unpack('HH', self.f.read(4))
+        length, io_dir = self._peek()
+        if io_dir == OUTPUT:
+            raise Timeout()
         assert io_dir == INPUT
         assert length - 2 <= bufsize
-        return self.f.read(length - 2)
+        return self._read()
 
 
-def packet_gen(filename):
+def read_version(f):
+    """Read log file header and return its version"""
+    magic, version = unpack('II', f.read(8))
+    assert magic == MAGIC_HEADER, hex(magic)
+    assert version in [VERSION, VERSION_COMPRESSED], version
+    return version
+
+
+def block_gen(f):
+    """Generate decompressed blocks of VERSION_COMPRESSED log"""
+    while True:
+        header = f.read(BLOCK_HEADER_SIZE)
+        if len(header) != BLOCK_HEADER_SIZE:
+            break  # EOF
+        raw_size, size, records = unpack(BLOCK_HEADER, header)
+        data = f.read(size)
+        if len(data) != size:
+            break  # truncated log
+        yield zlib.decompress(data)
+
+
+class CompressedReader(object):
+    """File-like sequential reader of VERSION_COMPRESSED log records"""
+
+    def __init__(self, f):
+        self.f = f
+        self.blocks = block_gen(f)
+        self.buf = b''
+        self.pos = 0
+
+    def read(self, size):
+        while len(self.buf) - self.pos < size:
+            block = next(self.blocks, None)
+            if block is None:
+                break
+            self.buf = self.buf[self.pos:] + block
+            self.pos = 0
+        data = self.buf[self.pos:self.pos + size]
+        self.pos += len(data)
+        return data
+
+    def close(self):
+        self.f.close()
+
+
+def open_log(filename):
+    """Open log of any version for reading of records after the header"""
     f = open(filename, 'rb')
-    data = f.read(8)
-    assert unpack('II', data) == (MAGIC_HEADER, VERSION)
+    if read_version(f) == VERSION_COMPRESSED:
+        return CompressedReader(f)
+    return f
+
+
+def packet_gen(filename):
+    f = open_log(filename)
+    try:
+        while True:
+            data = f.read(4)
+            if len(data) != 4:
+                break  # EOF
+
+            length, io_dir = unpack('HH', data)
+            yield io_dir, f.read(length - 2)
+    finally:
+        f.close()
+
+
+# index of records - ``offset`` points to packet data after (length, io_dir)
+RECORD_DTYPE = np.dtype([('offset', '<i8'), ('length', '<i4'), ('io_dir', 'u1')])
+
+
+def scan_records(buf, start=0):
+    """Scan (length, io_dir) framing of records in buffer in one pass
+
+    Return RECORD_DTYPE array. Incomplete record at the end is ignored."""
+    offsets, lengths, io_dirs = [], [], []
+    pos = start
+    end = len(buf)
+    while pos + 4 <= end:
+        length, io_dir = unpack_from('HH', buf, pos)
+        if pos + 4 + length - 2 > end:
+            break  # truncated log
+        offsets.append(pos + 4)
+        lengths.append(length - 2)
+        io_dirs.append(io_dir)
+        pos += 4 + length - 2
+    index = np.empty(len(offsets), dtype=RECORD_DTYPE)
+    index['offset'] = offsets
+    index['length'] = lengths
+    index['io_dir'] = io_dirs
+    return index
+
+
+# position of compressed data in file and offset of raw data in VERSION 1 log
+BLOCK_DTYPE = np.dtype([('pos', '<i8'), ('offset', '<i8'),
+                        ('raw_size', '<i4'), ('size', '<i4'), ('records', '<i4')])
+
+
+def scan_blocks(f):
+    """Scan block headers of VERSION_COMPRESSED log (after file header)
+
+    Return BLOCK_DTYPE array, offsets are the same as if the log was
+    stored uncompressed."""
+    blocks = []
+    offset = 8
     while True:
-        data = f.read(4)
-        if len(data) != 4:
+        header = f.read(BLOCK_HEADER_SIZE)
+        if len(header) != BLOCK_HEADER_SIZE:
             break  # EOF
+        raw_size, size, records = unpack(BLOCK_HEADER, header)
+        pos = f.tell()
+        if f.seek(size, os.SEEK_CUR) > os.fstat(f.fileno()).st_size:
+            break  # truncated log
+        blocks.append((pos, offset, raw_size, size, records))
+        offset += raw_size
+    return np.array(blocks, dtype=BLOCK_DTYPE)
+
+
+def map_log(f):
+    """Memory map opened log file and return (mmap, index of records)
+
+    VERSION_COMPRESSED log is decompressed block by block into anonymous
+    memory as VERSION 1 log, so the offsets do not depend on the log
+    version."""
+    if read_version(f) == VERSION:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    else:
+        blocks = scan_blocks(f)
+        mm = mmap.mmap(-1, 8 + int(blocks['raw_size'].sum()))
+        mm.write(pack('II', MAGIC_HEADER, VERSION))
+        for block in blocks:
+            f.seek(block['pos'])
+            mm.write(zlib.decompress(f.read(block['size'])))
+    return mm, scan_records(mm, 8)
+
+
+def convert_log(src, dst, version=VERSION_COMPRESSED, **options):
+    """Store ``src`` log records into ``dst`` log of given version"""
+    f = open(dst, 'wb')
+    if version == VERSION_COMPRESSED:
+        f = CompressedWriter(f, **options)
+    else:
+        assert version == VERSION, version
+        f.write(pack('II', MAGIC_HEADER, VERSION))
+    for io_dir, data in packet_gen(src):
+        f.write(pack('HH', len(data) + 2, io_dir) + data)
+    f.close()
+
+
+def benchmark_log(filename):
+    """Return (file size, raw size, compression ratio, decoded MB/s)"""
+    start = time.perf_counter()
+    raw_size = 8
+    for io_dir, data in packet_gen(filename):
+        raw_size += 4 + len(data)
+    duration = time.perf_counter() - start
+    size = os.path.getsize(filename)
+    return size, raw_size, raw_size / float(size), raw_size / duration / 1e6
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(2)
 
-        length, io_dir = unpack('HH', data)
-        yield io_dir, f.read(length - 2)
+    version = VERSION_COMPRESSED
+    if len(sys.argv) > 3:
+        version = int(sys.argv[3])
+    convert_log(sys.argv[1], sys.argv[2], version=version)
+    for filename in sys.argv[1:3]:
+        size, raw_size, ratio, speed = benchmark_log(filename)
+        print('{}: {} bytes ({} raw), ratio {:.2f}, decode {:.1f} MB/s'.format(
+              filename, size, raw_size, ratio, speed))
 
 # vim: expandtab sw=4 ts=4
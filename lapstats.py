@@ -0,0 +1,237 @@
+"""
+  Lap and segment statistics from sensor logs
+  usage:
+     python lapstats.py <track XML file> <log file> [<log file> ...]
+
+  The log is processed in one pass by generator stages
+  decode -> localize -> split_laps -> aggregate.
+"""
+import json
+from multiprocessing import Pool
+import math
+import struct
+import sys
+
+from iolog import packet_gen, INPUT
+from packets import Sensors, SENSORS_DTYPE
+from track import Track, TrackLocalizer
+
+# the log starts at the start line if the first sample is this close to it
+LAP_START_TIME = 0.1  # s
+LAP_START_DIST = 2.0  # m
+
+
+class Sample(object):
+    """Decoded sensor packet, ``segment``, ``offset`` and ``lap`` are
+    filled by later stages"""
+
+    __slots__ = ('lap_time', 'dist_start', 'last_lap_time', 'x', 'y', 'heading',
+                 'speed', 'segment', 'offset', 'lap')
+
+    def __init__(self, lap_time, dist_start, last_lap_time, x, y, heading, speed):
+        self.lap_time = lap_time
+        self.dist_start = dist_start
+        self.last_lap_time = last_lap_time
+        self.x = x
+        self.y = y
+        self.heading = heading
+        self.speed = speed
+        self.segment = -1
+        self.offset = None
+        self.lap = 0
+
+
+def decode(packets):
+    """Generate Samples from (io_dir, packet) pairs of running simulation"""
+    for io_dir, packet in packets:
+        if io_dir != INPUT or len(packet) != SENSORS_DTYPE.itemsize:
+            continue
+        if packet[792] == Sensors.SIMULATION_STOPPED:
+            continue
+        lap_time, dist_start, last_lap_time = struct.unpack_from('fff', packet, 0)
+        x, y = struct.unpack_from('ff', packet, 44)
+        heading = struct.unpack_from('f', packet, 64)[0]
+        vx, vy, vz = struct.unpack_from('fff', packet, 80)
+        yield Sample(lap_time, dist_start, last_lap_time, x, y, heading,
+                     math.sqrt(vx*vx + vy*vy + vz*vz))
+
+
+def localize(samples, track):
+    """Set index of the nearest segment and signed offset of every sample"""
+    localizer = TrackLocalizer(track)
+    for sample in samples:
+        segment, rel_pose = localizer.nearest_segment((sample.x, sample.y, sample.heading))
+        if segment is not None:
+            sample.segment = localizer.index
+            sample.offset = segment.get_offset(rel_pose)[0]
+        yield sample
+
+
+def split_laps(samples):
+    """Number laps, new lap starts when LapTime decreases"""
+    lap = 0
+    prev_time = None
+    for sample in samples:
+        if prev_time is not None and sample.lap_time < prev_time:
+            lap += 1
+        prev_time = sample.lap_time
+        sample.lap = lap
+        yield sample
+
+
+class SegmentStats(object):
+    """Accumulated values of one segment in one lap"""
+
+    __slots__ = ('time', 'samples', 'offset_sum', 'max_offset', 'max_speed')
+
+    def __init__(self):
+        self.time = 0.0
+        self.samples = 0
+        self.offset_sum = 0.0
+        self.max_offset = 0.0
+        self.max_speed = 0.0
+
+    def add(self, dt, offset, speed):
+        self.time += dt
+        self.samples += 1
+        if offset is not None:
+            self.offset_sum += offset
+            self.max_offset = max(self.max_offset, abs(offset))
+        self.max_speed = max(self.max_speed, speed)
+
+    def row(self, track, lap, index):
+        return {'lap': lap, 'segment': index, 'name': track.segments[index].name,
+                'time': self.time, 'samples': self.samples,
+                'mean_offset': self.offset_sum / self.samples,
+                'max_offset': self.max_offset, 'max_speed': self.max_speed}
+
+
+def _lap_result(track, lap, stats, lap_time, complete):
+    return {'lap': lap, 'lap_time': lap_time, 'complete': complete,
+            'segments': [stats[i].row(track, lap, i) for i in sorted(stats)]}
+
+
+def aggregate(samples, track):
+    """Generate per lap dictionaries with list of per segment rows
+
+    The time between two samples is assigned to the segment of the former
+    one. Only the statistics of the current lap are kept in memory. The
+    first lap is reported with ``complete`` False unless the log starts at
+    the start line (``LAP_START_TIME`` or ``LAP_START_DIST``), the last one
+    (not finished) always."""
+    lap = None
+    stats = {}
+    prev = None
+    first_complete = None
+    for sample in samples:
+        if first_complete is None:
+            first_complete = (abs(sample.lap_time) <= LAP_START_TIME
+                              or abs(sample.dist_start) <= LAP_START_DIST)
+        if sample.lap != lap:
+            if lap is not None:
+                lap_time = prev.lap_time
+                if sample.last_lap_time > 0:
+                    lap_time = sample.last_lap_time
+                yield _lap_result(track, lap, stats, lap_time,
+                                  complete=lap > 0 or first_complete)
+            lap = sample.lap
+            stats = {}
+            prev = None
+        if prev is not None and prev.segment >= 0:
+            if prev.segment not in stats:
+                stats[prev.segment] = SegmentStats()
+            stats[prev.segment].add(sample.lap_time - prev.lap_time,
+                                    prev.offset, prev.speed)
+        prev = sample
+    if lap is not None:
+        yield _lap_result(track, lap, stats, prev.lap_time, complete=False)
+
+
+def lap_stats(packets, track):
+    """Complete pipeline over (io_dir, packet) pairs"""
+    return aggregate(split_laps(localize(decode(packets), track)), track)
+
+
+def analyze_log(filename, track):
+    """Return list of per lap results of one log file"""
+    return list(lap_stats(packet_gen(filename), track))
+
+
+def table(laps):
+    """Flatten per lap results into rows of per lap, per segment table"""
+    for lap in laps:
+        for row in lap['segments']:
+            yield row
+
+
+_tracks = {}
+
+
+def _analyze(args):
+    track_filename, filename = args
+    if track_filename not in _tracks:
+        _tracks[track_filename] = Track.from_xml_file(track_filename)
+    return filename, analyze_log(filename, _tracks[track_filename])
+
+
+def analyze_logs(track_filename, filenames, processes=None):
+    """Analyze logs in parallel processes, return list of (filename, laps)"""
+    pool = Pool(processes)
+    try:
+        return pool.map(_analyze, [(track_filename, filename) for filename in filenames])
+    finally:
+        pool.close()
+        pool.join()
+
+
+def merge(results):
+    """Merge complete laps of (filename, laps) results
+
+    Return the best lap and per segment rows with the best and mean time,
+    mean offset and maximal speed over all laps."""
+    best = None
+    segments = {}
+    for filename, laps in results:
+        for lap in laps:
+            if not lap['complete']:
+                continue
+            if best is None or lap['lap_time'] < best['lap_time']:
+                best = {'log': filename, 'lap': lap['lap'], 'lap_time': lap['lap_time']}
+            for row in lap['segments']:
+                merged = segments.get(row['segment'])
+                if merged is None:
+                    merged = segments[row['segment']] = {
+                            'segment': row['segment'], 'name': row['name'],
+                            'laps': 0, 'best_time': row['time'], 'time_sum': 0.0,
+                            'samples': 0, 'offset_sum': 0.0, 'max_speed': 0.0}
+                merged['laps'] += 1
+                merged['best_time'] = min(merged['best_time'], row['time'])
+                merged['time_sum'] += row['time']
+                merged['samples'] += row['samples']
+                merged['offset_sum'] += row['mean_offset'] * row['samples']
+                merged['max_speed'] = max(merged['max_speed'], row['max_speed'])
+    rows = []
+    for index in sorted(segments):
+        merged = segments[index]
+        rows.append({'segment': index, 'name': merged['name'], 'laps': merged['laps'],
+                     'best_time': merged['best_time'],
+                     'mean_time': merged['time_sum'] / merged['laps'],
+                     'mean_offset': merged['offset_sum'] / merged['samples'],
+                     'max_speed': merged['max_speed']})
+    return {'best': best, 'segments': rows}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(2)
+
+    results = analyze_logs(sys.argv[1], sys.argv[2:])
+    for filename, laps in results:
+        for lap in laps:
+            print(filename, lap['lap'], lap['lap_time'], lap['complete'])
+            for row in lap['segments']:
+                print('  {name:>12} {time:8.3f} {mean_offset:7.2f} {max_speed:6.1f}'.format(**row))
+    print(json.dumps(merge(results)))
+
+# vim: expandtab sw=4 ts=4
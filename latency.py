@@ -0,0 +1,149 @@
+"""
+  Latency instrumentation of the control loop
+"""
+import time
+
+try:
+    perf_counter_ns = time.perf_counter_ns
+except AttributeError:
+    # Python < 3.7
+    def perf_counter_ns():
+        return int(time.perf_counter() * 1e9)
+
+
+class LatencyHistogram(object):
+    """Log-linear (HDR style) histogram of integer values (nanoseconds)
+
+    Values are stored with relative precision 2**(1 - precision_bits)
+    up to 2**max_bits, larger values are clipped."""
+
+    def __init__(self, precision_bits=6, max_bits=40):
+        self.precision_bits = precision_bits
+        self.max_bits = max_bits
+        self.half = 1 << (precision_bits - 1)
+        self.counts = [0] * ((max_bits - precision_bits + 2) * self.half)
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        shift = value.bit_length() - self.precision_bits
+        if shift <= 0:
+            return value
+        return shift * self.half + (value >> shift)
+
+    def _value(self, index):
+        """Return the highest value of the bucket"""
+        if index < 2 * self.half:
+            return index
+        shift = index // self.half - 1
+        mantissa = index - shift * self.half
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value):
+        value = min(max(int(value), 0), (1 << self.max_bits) - 1)
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """Return value at percentile ``q`` (0..100)"""
+        if self.count == 0:
+            return None
+        target = max(1, int(round(q / 100.0 * self.count)))
+        total = 0
+        for index, count in enumerate(self.counts):
+            total += count
+            if total >= target:
+                return min(self._value(index), self.max)
+        return self.max
+
+    def summary(self):
+        return {'count': self.count, 'p50': self.percentile(50),
+                'p99': self.percentile(99), 'max': self.max}
+
+
+class SimCounterMonitor(object):
+    """Count missed and duplicate simulator cycles from SimCounter byte"""
+
+    def __init__(self):
+        self.prev = None
+        self.missed = 0
+        self.duplicate = 0
+
+    def update(self, counter):
+        if self.prev is not None:
+            diff = (counter - self.prev) & 0xFF
+            if diff == 0:
+                self.duplicate += 1
+            else:
+                self.missed += diff - 1
+        self.prev = counter
+
+
+class LoopProfiler(object):
+    """Per stage timing of the control loop with perf_counter_ns
+
+    ``begin(status)`` starts a tick when the sensors packet arrives,
+    ``mark(stage)`` records time since the previous mark and ``end()``
+    records the whole tick as stage 'total'."""
+
+    SIM_COUNTER_OFFSET = 793
+
+    def __init__(self):
+        self.histograms = {}
+        self.sim_counter = SimCounterMonitor()
+        self.tick_start = None
+        self.last = None
+
+    def _record(self, stage, value):
+        if stage not in self.histograms:
+            self.histograms[stage] = LatencyHistogram()
+        self.histograms[stage].record(value)
+
+    def begin(self, status=None):
+        self.tick_start = self.last = perf_counter_ns()
+        if status is not None and len(status) > self.SIM_COUNTER_OFFSET:
+            self.sim_counter.update(status[self.SIM_COUNTER_OFFSET])
+
+    def mark(self, stage):
+        if self.tick_start is None:
+            return  # outside of tick
+        now = perf_counter_ns()
+        self._record(stage, now - self.last)
+        self.last = now
+
+    def end(self):
+        if self.tick_start is None:
+            return
+        self._record('total', perf_counter_ns() - self.tick_start)
+        self.tick_start = None
+
+    def report(self):
+        """Return dictionary with stage latencies in microseconds and
+        simulator cycle counters"""
+        ret = {}
+        for stage, histogram in self.histograms.items():
+            summary = histogram.summary()
+            ret[stage] = dict((key, value / 1000.0 if key != 'count' else value)
+                              for key, value in summary.items())
+        ret['sim_counter'] = {'missed': self.sim_counter.missed,
+                              'duplicate': self.sim_counter.duplicate}
+        return ret
+
+    def format_report(self):
+        lines = []
+        for stage, summary in sorted(self.report().items()):
+            if stage == 'sim_counter':
+                continue
+            lines.append('{:16s} n={:<8d} p50={:9.1f}us p99={:9.1f}us max={:9.1f}us'.format(
+                         stage, summary['count'], summary['p50'], summary['p99'],
+                         summary['max']))
+        lines.append('sim cycles missed={missed} duplicate={duplicate}'.format(
+                     **self.sim_counter.__dict__))
+        return '\n'.join(lines)
+
+# vim: expandtab sw=4 ts=4
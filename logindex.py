@@ -0,0 +1,154 @@
+"""
+  Sidecar index of log records for random access
+  usage:
+     python logindex.py <logfile> [<logfile> ...]
+"""
+import mmap
+import os
+import sys
+import zlib
+
+import numpy as np
+
+from iolog import map_log, read_version, scan_blocks, INPUT, VERSION
+from packets import gather, race_time, SENSORS_DTYPE
+
+INDEX_EXT = '.idx'
+
+# the index file starts with stamp of the log - size, modification time
+# (ns) and CRC32 of the first STAMP_SIZE bytes (header and first records)
+STAMP_SIZE = 64*1024
+
+# ``time`` and ``lap`` of OUTPUT record are taken from the previous INPUT
+INDEX_DTYPE = np.dtype([('offset', '<i8'), ('length', '<i4'), ('io_dir', 'u1'),
+                        ('time', '<f8'), ('lap', '<i4')])
+
+
+def index_records(buf, records):
+    """Extend index of records by race time and lap number"""
+    index = np.zeros(len(records), dtype=INDEX_DTYPE)
+    for name in records.dtype.names:
+        index[name] = records[name]
+    inputs = np.flatnonzero((records['io_dir'] == INPUT) &
+                            (records['length'] == SENSORS_DTYPE.itemsize))
+    if len(inputs) > 0:
+        lap_time = gather(buf, records['offset'][inputs], np.dtype('<f4'))
+        time, lap = race_time(lap_time)
+        # forward fill to all records, the leading ones get the first time
+        last = np.maximum(np.searchsorted(inputs, np.arange(len(records)),
+                                          side='right') - 1, 0)
+        index['time'] = time[last]
+        index['lap'] = lap[last]
+    return index
+
+
+def build_index(filename):
+    """Create sidecar index file for the log and return the index"""
+    with open(filename, 'rb') as f:
+        mm, records = map_log(f)
+        try:
+            index = index_records(mm, records)
+        finally:
+            mm.close()
+    stamp = log_stamp(filename)
+    with open(filename + INDEX_EXT, 'wb') as f:
+        np.save(f, stamp)
+        np.save(f, index)
+    return index
+
+
+def log_stamp(filename):
+    """Return array identifying the log content (see ``STAMP_SIZE``)"""
+    stat = os.stat(filename)
+    with open(filename, 'rb') as f:
+        crc = zlib.crc32(f.read(STAMP_SIZE)) & 0xffffffff
+    return np.array([stat.st_size, stat.st_mtime_ns, crc], dtype='<i8')
+
+
+def load_index(filename):
+    """Load sidecar index or build it when missing or out of date"""
+    index_filename = filename + INDEX_EXT
+    if os.path.exists(index_filename):
+        with open(index_filename, 'rb') as f:
+            stamp = np.load(f)
+            # index without stamp is out of date
+            if stamp.dtype == np.dtype('<i8') and np.array_equal(stamp, log_stamp(filename)):
+                return np.load(f)
+    return build_index(filename)
+
+
+class LogReader(object):
+    """Random access to log records via sidecar index
+
+    Compressed logs are decompressed block by block as needed."""
+
+    def __init__(self, filename):
+        self.index = load_index(filename)
+        self.f = open(filename, 'rb')
+        self.mm = None
+        self.blocks = None
+        if read_version(self.f) == VERSION:
+            self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.blocks = scan_blocks(self.f)
+            self.block_index = None
+            self.block = None
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+        self.f.close()
+
+    def read(self, offset, length):
+        """Read data at ``offset`` of uncompressed log"""
+        if self.blocks is None:
+            return self.mm[offset:offset + length]
+        i = int(np.searchsorted(self.blocks['offset'], offset, side='right')) - 1
+        if i != self.block_index:
+            self.f.seek(int(self.blocks['pos'][i]))
+            self.block = zlib.decompress(self.f.read(int(self.blocks['size'][i])))
+            self.block_index = i
+        start = offset - int(self.blocks['offset'][i])
+        return self.block[start:start + length]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def packet(self, n):
+        """Return (io_dir, data) of n-th record"""
+        rec = self.index[n]
+        return int(rec['io_dir']), self.read(int(rec['offset']), int(rec['length']))
+
+    def seek_time(self, time):
+        """Return number of the first record with race time >= ``time``"""
+        return int(np.searchsorted(self.index['time'], time))
+
+    def seek_lap(self, lap):
+        """Return number of the first record of given lap"""
+        return int(np.searchsorted(self.index['lap'], lap))
+
+    def packets(self, start=0, end=None):
+        """Generate (io_dir, data) for records[start:end]"""
+        if end is None:
+            end = len(self.index)
+        for n in range(start, end):
+            yield self.packet(n)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(2)
+
+    for filename in sys.argv[1:]:
+        index = build_index(filename)
+        laps = int(index['lap'][-1]) + 1 if len(index) > 0 else 0
+        print(filename, len(index), 'records', laps, 'laps')
+
+# vim: expandtab sw=4 ts=4
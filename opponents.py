@@ -0,0 +1,106 @@
+"""
+  V2x objects (opponents) reported in sensor packets
+  usage:
+     python opponents.py <track XML file> <logfile>
+"""
+import sys
+
+import numpy as np
+
+from packets import SENSORS_DTYPE, V2X_SIZE
+from iolog import packet_gen, INPUT
+
+# V2x object types, see doc/from-simulator.md
+UNKNOWN = 0
+AI_CAR = 1
+HUMAN_DRIVER = 2
+SLOW_CAR = 3
+STATIC_OBJECT = 10
+
+
+class Opponents(object):
+    """Arrays of V2x objects from one sensor packet"""
+
+    @staticmethod
+    def from_packet(packet):
+        assert len(packet) == SENSORS_DTYPE.itemsize, len(packet)
+        return Opponents.from_record(np.frombuffer(packet, dtype=SENSORS_DTYPE)[0])
+
+    @staticmethod
+    def from_record(record):
+        """Decode V2x block of SENSORS_DTYPE record (data are copied)"""
+        n = min(int(record['v2x_n']), V2X_SIZE)
+        return Opponents(record['v2x_type'][:n].astype(np.int64),
+                         record['v2x_x_pos'][:n].astype(np.float64),
+                         record['v2x_y_pos'][:n].astype(np.float64),
+                         record['v2x_speed'][:n].astype(np.float64),
+                         record['v2x_yaw'][:n].astype(np.float64))
+
+    def __init__(self, type, x, y, speed, yaw):
+        self.type = type
+        self.x = x
+        self.y = y
+        self.speed = speed
+        self.yaw = yaw
+
+    def __len__(self):
+        return len(self.x)
+
+    def take(self, indices):
+        """Return Opponents subset"""
+        return Opponents(self.type[indices], self.x[indices], self.y[indices],
+                         self.speed[indices], self.yaw[indices])
+
+    def distances(self, x, y):
+        """Return euclidean distances from (x, y)"""
+        return np.hypot(self.x - x, self.y - y)
+
+    def within(self, x, y, radius):
+        """Return indices and distances of objects within ``radius``
+        of (x, y), nearest first"""
+        dist = self.distances(x, y)
+        indices = np.flatnonzero(dist <= radius)
+        indices = indices[np.argsort(dist[indices], kind='mergesort')]
+        return indices, dist[indices]
+
+    def ahead(self, track, station, distance, max_offset=None):
+        """Return indices, station gaps and lateral offsets of objects on
+        the track up to ``distance`` meters ahead of ``station``, nearest first
+
+        Only segments in the ahead window are evaluated. ``max_offset``
+        defaults to half of the track width plus ``track.index_margin``."""
+        if max_offset is None:
+            max_offset = track.index_margin
+            if track.width is not None:
+                max_offset += track.width / 2.0
+        segments = track.segments_between(station, station + distance)
+        obj_station, offset, index = track.track_coordinates(self.x, self.y, segments)
+        with np.errstate(invalid='ignore'):
+            gap = (obj_station - station) % track.length
+            valid = (index >= 0) & (gap <= distance) & (np.abs(offset) <= max_offset)
+        indices = np.flatnonzero(valid)
+        indices = indices[np.argsort(gap[indices], kind='mergesort')]
+        return indices, gap[indices], offset[indices]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(2)
+
+    from track import Track
+    track = Track.from_xml_file(sys.argv[1])
+    for io_dir, packet in packet_gen(sys.argv[2]):
+        if io_dir != INPUT or len(packet) != SENSORS_DTYPE.itemsize:
+            continue
+        record = np.frombuffer(packet, dtype=SENSORS_DTYPE)[0]
+        opponents = Opponents.from_record(record)
+        x, y = float(record['abs_pos_x']), float(record['abs_pos_y'])
+        station = track.pose_to_station((x, y, float(record['ang_z'])))
+        if station is None or len(opponents) == 0:
+            continue
+        indices, gap, offset = opponents.ahead(track, station, 100.0)
+        print('{:.2f}'.format(float(record['lap_time'])),
+              ' '.join('{:.1f}/{:.1f}'.format(g, o) for g, o in zip(gap, offset)))
+
+# vim: expandtab sw=4 ts=4
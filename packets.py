@@ -7,7 +7,138 @@ import math
 from struct import unpack_from
 import sys
 
-from iolog import packet_gen, INPUT, OUTPUT
+import numpy as np
+
+from iolog import packet_gen, map_log, INPUT, OUTPUT
+
+V2X_SIZE = 39
+
+# complete sensors packet layout, see doc/from-simulator.md
+SENSORS_DTYPE = np.dtype({
+    'names': ['lap_time', 'dist_start', 'last_lap_time', 'race_pos', 'rpm',
+              'energy_level', 'gear_pos',
+              'wheel_vel_fr', 'wheel_vel_fl', 'wheel_vel_rr', 'wheel_vel_rl',
+              'abs_pos_x', 'abs_pos_y', 'abs_pos_z',
+              'ang_x', 'ang_y', 'ang_z',
+              'ang_rate_x', 'ang_rate_y', 'ang_rate_z',
+              'abs_vel_x', 'abs_vel_y', 'abs_vel_z',
+              'accel_x', 'accel_y', 'accel_z',
+              'steer_angle',
+              'wheel_reaction_fl', 'wheel_reaction_fr',
+              'wheel_reaction_rr', 'wheel_reaction_rl',
+              'collision',
+              'v2x_n', 'v2x_type', 'v2x_x_pos', 'v2x_y_pos', 'v2x_speed', 'v2x_yaw',
+              'sim_status', 'sim_counter'],
+    'formats': ['<f4', '<f4', '<f4', '<i4', '<f4',
+                '<f4', '<i4',
+                '<f4', '<f4', '<f4', '<f4',
+                '<f4', '<f4', '<f4',
+                '<f4', '<f4', '<f4',
+                '<f4', '<f4', '<f4',
+                '<f4', '<f4', '<f4',
+                '<f4', '<f4', '<f4',
+                '<f4',
+                '<f4', '<f4',
+                '<f4', '<f4',
+                '<i4',
+                'u1', ('u1', V2X_SIZE), ('<f4', V2X_SIZE), ('<f4', V2X_SIZE),
+                ('<f4', V2X_SIZE), ('<f4', V2X_SIZE),
+                'u1', 'u1'],
+    'offsets': [0, 4, 8, 12, 16,
+                20, 24,
+                28, 32, 36, 40,
+                44, 48, 52,
+                56, 60, 64,
+                68, 72, 76,
+                80, 84, 88,
+                92, 96, 100,
+                104,
+                108, 112,
+                116, 120,
+                124,
+                128, 129, 168, 324,
+                480, 636,
+                792, 793],
+    'itemsize': 794})
+
+# command packet as packed by struct 'fffiBB'
+COMMAND_DTYPE = np.dtype({
+    'names': ['steering', 'acc', 'brake', 'gear_pos', 'ctrl_mode', 'ctr'],
+    'formats': ['<f4', '<f4', '<f4', '<i4', 'u1', 'u1'],
+    'offsets': [0, 4, 8, 12, 16, 17],
+    'itemsize': 18})
+
+
+def sensors_array(data):
+    """Return structured array view of one or more concatenated sensor
+    packets (no data are copied)"""
+    assert len(data) % SENSORS_DTYPE.itemsize == 0, len(data)
+    return np.frombuffer(data, dtype=SENSORS_DTYPE)
+
+
+def gather(buf, offsets, dtype):
+    """Copy records of given ``dtype`` starting at ``offsets`` into dense array"""
+    size = dtype.itemsize
+    view = memoryview(buf)
+    try:
+        data = b''.join([view[offset:offset + size] for offset in offsets.tolist()])
+    finally:
+        view.release()  # mmap can be closed
+    return np.frombuffer(data, dtype=dtype)
+
+
+def race_time(lap_time):
+    """Convert array of lap times into continuous race time and lap number
+
+    New lap is detected when the lap time decreases."""
+    lap_time = np.asarray(lap_time, dtype=np.float64)
+    reset = np.zeros(len(lap_time), dtype=bool)
+    reset[1:] = lap_time[1:] < lap_time[:-1]
+    lap = np.cumsum(reset)
+    offset = np.zeros(len(lap_time))
+    offset[1:] = np.where(reset[1:], lap_time[:-1], 0.0)
+    return lap_time + np.cumsum(offset), lap
+
+
+class LogData(object):
+    """Columns of the whole log file
+
+    ``sensors`` and ``commands`` are structured arrays (SENSORS_DTYPE,
+    COMMAND_DTYPE), ``sensors_record`` and ``commands_record`` are their
+    positions in ``index`` of all log records."""
+
+    def __init__(self, index, sensors, sensors_record, commands, commands_record):
+        self.index = index
+        self.sensors = sensors
+        self.sensors_record = sensors_record
+        self.commands = commands
+        self.commands_record = commands_record
+        self.time, self.lap = race_time(sensors['lap_time'])
+
+    def running(self):
+        """Return sensors with simulation not stopped"""
+        return self.sensors[self.sensors['sim_status'] != Sensors.SIMULATION_STOPPED]
+
+    def between(self, start, end):
+        """Return slice of sensors in race time interval [start, end)"""
+        i, j = np.searchsorted(self.time, [start, end])
+        return self.sensors[i:j]
+
+
+def load_log(filename):
+    """Load complete log file into LogData columns"""
+    with open(filename, 'rb') as f:
+        mm, index = map_log(f)
+        try:
+            inputs = np.flatnonzero((index['io_dir'] == INPUT) &
+                                    (index['length'] == SENSORS_DTYPE.itemsize))
+            outputs = np.flatnonzero((index['io_dir'] == OUTPUT) &
+                                     (index['length'] == COMMAND_DTYPE.itemsize))
+            sensors = gather(mm, index['offset'][inputs], SENSORS_DTYPE)
+            commands = gather(mm, index['offset'][outputs], COMMAND_DTYPE)
+        finally:
+            mm.close()
+    return LogData(index, sensors, inputs, commands, outputs)
 
 
 class Command(object):
@@ -16,13 +147,15 @@ class Command(object):
     @staticmethod
     def from_packet(packet):
         assert len(packet) == 18, len(packet)
-        steering, acc, brake = unpack_from('fff', packet, 0)
-        return Command(steering, acc, brake)
+        steering, acc, brake, gear_pos, ctrl_mode = unpack_from('fffiB', packet, 0)
+        return Command(steering, acc, brake, gear_pos, ctrl_mode)
 
-    def __init__(self, steering, acc, brake):
+    def __init__(self, steering, acc, brake, gear_pos=1, ctrl_mode=11):
         self.steering = steering
         self.acc = acc
         self.brake = brake
+        self.gear_pos = gear_pos
+        self.ctrl_mode = ctrl_mode
 
     def __str__(self):
         return 'Command(steering={}, acc={}, brake={})'.format(
@@ -0,0 +1,73 @@
+"""
+  Speed planning from track curvature
+  usage:
+     python planner.py <track XML file>
+"""
+import math
+import sys
+
+import numpy as np
+
+from track import Track
+
+GRAVITY = 9.81
+
+
+def speed_profile(curvature, resolution, max_lat_acc, max_acc, max_dec,
+                  max_speed, closed=True):
+    """Return friction limited target speed for every curvature sample
+
+    Speed is limited by lateral acceleration in turns, then a forward pass
+    limits acceleration and a backward pass braking. For a ``closed`` loop
+    both passes go around twice so the lap end matches the start."""
+    curvature = np.abs(np.asarray(curvature, dtype=np.float64))
+    with np.errstate(divide='ignore'):
+        speed = np.minimum(max_speed, np.sqrt(max_lat_acc / curvature))
+    count = len(speed)
+    laps = 2 if closed else 1
+    for i in range(1, count * laps):
+        prev, cur = (i - 1) % count, i % count
+        speed[cur] = min(speed[cur],
+                         math.sqrt(speed[prev]**2 + 2.0 * max_acc * resolution))
+    for i in range(count * laps - 2, -1, -1):
+        cur, next_ = i % count, (i + 1) % count
+        speed[cur] = min(speed[cur],
+                         math.sqrt(speed[next_]**2 + 2.0 * max_dec * resolution))
+    return speed
+
+
+class SpeedPlanner(object):
+    """Target speed along the track computed once per track"""
+
+    def __init__(self, track, resolution=1.0, friction=1.0, max_acc=3.0,
+                 max_dec=6.0, max_speed=80.0):
+        self.track = track
+        self.resolution = resolution
+        self.curvature = track.curvature_profile(resolution)
+        self.speed = speed_profile(self.curvature, resolution,
+                                   friction * GRAVITY, max_acc, max_dec, max_speed)
+
+    def target_speed(self, station):
+        """Return target speed at given station"""
+        i = int((station % self.track.length) / self.resolution)
+        return float(self.speed[i])
+
+    def speed_ahead(self, station, distance):
+        """Return target speeds for ``distance`` meters ahead of station"""
+        first = int((station % self.track.length) / self.resolution)
+        count = int(math.ceil(distance / self.resolution))
+        return self.speed.take(np.arange(first, first + count), mode='wrap')
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(2)
+
+    planner = SpeedPlanner(Track.from_xml_file(sys.argv[1]))
+    speed = planner.speed
+    print('length {:.1f} m, speed min {:.1f} max {:.1f} m/s, lap {:.1f} s'.format(
+          planner.track.length, speed.min(), speed.max(),
+          float(np.sum(planner.resolution / speed))))
+
+# vim: expandtab sw=4 ts=4
@@ -2,64 +2,26 @@
 """
   Plot track data
   usage:
-       ./plot.py <track XML> [<log file> [<log file> ...]]
+       ./plot.py [--speed|--offset] <track XML> [<log file> [<log file> ...]]
+
+  Trajectories are decimated to the current zoom level and optionally
+  coloured by speed or lateral offset from the center line.
 """
 import sys
-from math import sin, cos, pi
-
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 from matplotlib.path import Path
 import matplotlib.patches as patches
+import numpy as np
 
 from track import Track
-from packets import sensors_gen
-
-
-# Notes:
-#
-# The arc segments are interpolated via Bezier curves. See
-#   http://www.whizkidtech.redprince.net/bezier/circle/
-# or
-#   http://www.tinaja.com/glib/ellipse4.pdf
-# for explanation of recommended scale factors
-
-# Bezier curve - length of control points fro PI/2 circle split
-KAPPA = 0.5522847498
-
-def track_border(track, left_offset):
-    verts, codes = [], []
-
-    x, y, heading = (0, 0, 0)
-    verts.append((x, y, heading))
-    codes.append(Path.MOVETO)
-    for segment in track.segments:
-        if segment.arc is not None:
-            if segment.arc > 0:
-                radius = segment.radius - left_offset
-            else:
-                radius = segment.radius + left_offset
-
-            scale = abs(segment.arc) * radius * KAPPA * 2.0 / pi
-            verts.append((x + scale * cos(heading), 
-                          y + scale * sin(heading),
-                          heading))
-            codes.append(Path.CURVE4)
-
-        x, y, heading = segment.step((x, y, heading))
-
-        if segment.arc is None:
-            codes.append(Path.LINETO)
-        else:
-            codes.append(Path.CURVE4)
-            verts.append((x - scale * cos(heading), 
-                          y - scale * sin(heading),
-                          heading))
-            codes.append(Path.CURVE4)
-        verts.append((x, y, heading))
+from packets import load_log
+
 
-    vertsL = [(x + left_offset*cos(a + pi/2.0), y + left_offset*sin(a + pi/2.0))
-              for (x, y, a) in verts]
-    return Path(vertsL, codes)
+def track_border(track, left_offset, resolution=1.0):
+    """Return border ``left_offset`` meters left of the center line as Path
+    of the cached track polyline"""
+    return Path(track.polyline(resolution).border(left_offset))
 
 
 def draw(track):
@@ -83,21 +45,175 @@ def draw(track):
     return fig
 
 
+def rdp(x, y, epsilon):
+    """Return indices of points kept by Ramer-Douglas-Peucker simplification
+    with ``epsilon`` tolerance in meters"""
+    count = len(x)
+    if count < 3:
+        return np.arange(count)
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        px = x[first + 1:last] - x[first]
+        py = y[first + 1:last] - y[first]
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        norm = np.hypot(dx, dy)
+        if norm > 0:
+            dist = np.abs(dx*py - dy*px) / norm
+        else:
+            dist = np.hypot(px, py)
+        i = int(np.argmax(dist))
+        if dist[i] > epsilon:
+            mid = first + 1 + i
+            keep[mid] = True
+            stack.append((first, mid))
+            stack.append((mid, last))
+    return np.flatnonzero(keep)
+
+
+def minmax_decimate(x, y, bins):
+    """Return indices of the first, last and extreme x and y points
+    of every bin of consecutive samples"""
+    count = len(x)
+    if count <= 4 * bins:
+        return np.arange(count)
+    size = count // bins
+    used = size * bins
+    xs, ys = x[:used].reshape(bins, size), y[:used].reshape(bins, size)
+    base = np.arange(bins) * size
+    return np.unique(np.concatenate([
+            base, base + size - 1,
+            base + np.argmin(xs, axis=1), base + np.argmax(xs, axis=1),
+            base + np.argmin(ys, axis=1), base + np.argmax(ys, axis=1),
+            np.arange(used, count)]))
+
+
+def decimate(x, y, tolerance, method='rdp'):
+    """Return indices of points representing trajectory at ``tolerance``
+    meters, ``method`` is 'rdp' or 'minmax' (bins of ``tolerance`` length
+    along the trajectory)"""
+    if method == 'rdp':
+        return rdp(x, y, tolerance)
+    assert method == 'minmax', method
+    length = np.sum(np.hypot(np.diff(x), np.diff(y)))
+    return minmax_decimate(x, y, max(1, int(length / tolerance)))
+
+
+def speeds(sensors):
+    """Return speed of every sensors record"""
+    return np.sqrt(sensors['abs_vel_x'].astype(np.float64)**2 +
+                   sensors['abs_vel_y'].astype(np.float64)**2 +
+                   sensors['abs_vel_z'].astype(np.float64)**2)
+
+
+def lateral_offsets(track, x, y):
+    """Return signed distance from the track center line (NaN off track)"""
+    poses = np.column_stack([x, y, np.zeros(len(x))])
+    return track.get_offsets(poses)[0]
+
+
+def load_trajectory(filename, track=None, colour=None, tolerance=0.05):
+    """Return x, y and colour values of log trajectory
+
+    The positions are simplified by RDP with ``tolerance`` (far below
+    the plot resolution) so the offsets for ``colour='offset'`` are
+    computed on the remaining points only."""
+    sensors = load_log(filename).running()
+    x = sensors['abs_pos_x'].astype(np.float64)
+    y = sensors['abs_pos_y'].astype(np.float64)
+    kept = rdp(x, y, tolerance)
+    values = None
+    if colour == 'speed':
+        values = speeds(sensors)[kept]
+    elif colour == 'offset':
+        values = lateral_offsets(track, x[kept], y[kept])
+    else:
+        assert colour is None, colour
+    return x[kept], y[kept], values
+
+
+# default line colours of matplotlib 1.x ('C0'.. names need 2.0)
+COLOURS = ['b', 'g', 'r', 'c', 'm', 'y', 'k']
+
+
+class Trajectory(object):
+    """Trajectory drawn as LineCollection decimated to the current zoom
+
+    Only points in the view are used and simplified to one pixel
+    tolerance whenever the axes limits change."""
+
+    def __init__(self, ax, x, y, values=None, method='rdp', **kwargs):
+        self.ax = ax
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.values = None if values is None else np.asarray(values, dtype=np.float64)
+        self.method = method
+        if self.values is None and 'color' not in kwargs:
+            kwargs['color'] = COLOURS[len(ax.collections) % len(COLOURS)]
+        self.collection = LineCollection([], **kwargs)
+        if self.values is not None:
+            self.collection.set_array(np.zeros(0))
+            self.collection.set_clim(np.nanmin(self.values), np.nanmax(self.values))
+        ax.add_collection(self.collection)
+        ax.callbacks.connect('xlim_changed', self.update)
+        ax.callbacks.connect('ylim_changed', self.update)
+        self.update(ax)
+
+    def visible(self):
+        """Return indices of points in view including their neighbours"""
+        (xmin, xmax), (ymin, ymax) = self.ax.get_xlim(), self.ax.get_ylim()
+        inside = ((self.x >= min(xmin, xmax)) & (self.x <= max(xmin, xmax)) &
+                  (self.y >= min(ymin, ymax)) & (self.y <= max(ymin, ymax)))
+        mask = inside.copy()
+        mask[1:] |= inside[:-1]
+        mask[:-1] |= inside[1:]
+        return np.flatnonzero(mask)
+
+    def update(self, ax=None):
+        indices = self.visible()
+        if len(indices) < 2:
+            self.collection.set_segments([])
+            return
+        # split into runs of consecutive points, keep the run ends
+        run = np.concatenate([[0], np.cumsum(np.diff(indices) > 1)])
+        ends = np.flatnonzero(np.diff(run))
+        xmin, xmax = self.ax.get_xlim()
+        tolerance = abs(xmax - xmin) / max(1.0, self.ax.bbox.width)
+        kept = decimate(self.x[indices], self.y[indices], tolerance, self.method)
+        kept = np.union1d(kept, np.concatenate([ends, ends + 1]))
+        points = np.column_stack([self.x[indices[kept]], self.y[indices[kept]]])
+        same_run = run[kept[:-1]] == run[kept[1:]]
+        self.collection.set_segments(np.stack([points[:-1], points[1:]], axis=1)[same_run])
+        if self.values is not None:
+            self.collection.set_array(self.values[indices[kept[:-1]]][same_run])
+
+
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
+    args = sys.argv[1:]
+    colour = None
+    for option in ['--speed', '--offset']:
+        if option in args:
+            args.remove(option)
+            colour = option[2:]
+    if len(args) < 1:
         print(__doc__)
         sys.exit(2)
 
-    filename = sys.argv[1]
+    filename = args[0]
     track = Track.from_xml_file(filename)
     fig = draw(track)
-
-    for filename in sys.argv[2:]:
-        x, y = [], []
-        for sensors in sensors_gen(filename):
-            x.append(sensors.pos3d[0])
-            y.append(sensors.pos3d[1])
-        plt.plot(x, y, '--')
+    ax = fig.axes[0]
+
+    trajectories = []
+    for filename in args[1:]:
+        x, y, values = load_trajectory(filename, track, colour)
+        trajectories.append(Trajectory(ax, x, y, values))
+    if colour is not None and trajectories:
+        fig.colorbar(trajectories[0].collection, ax=ax, label=colour)
     plt.show()
 
 # vim: expandtab sw=4 ts=4
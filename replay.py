@@ -0,0 +1,101 @@
+"""
+  Replay driver against recorded logs as fast as possible
+  usage:
+     python replay.py <track XML file> <log file> [<log file> ...]
+"""
+import json
+from multiprocessing import Pool
+import sys
+
+import numpy as np
+
+from demo import Driver
+from iolog import IOFromFile, Timeout
+from latency import perf_counter_ns
+from track import Track
+
+
+class ReplayResult(object):
+    """Outcome of one log replay
+
+    ``divergences`` is list of (packet number, logged command, command)
+    and ``compute_ns`` array of controller update times in nanoseconds."""
+
+    def __init__(self, filename, packets, divergences, compute_ns):
+        self.filename = filename
+        self.packets = packets
+        self.divergences = divergences
+        self.compute_ns = compute_ns
+
+    def summary(self):
+        ret = {'filename': self.filename, 'packets': self.packets,
+               'divergences': len(self.divergences),
+               'first_divergence': None}
+        if self.divergences:
+            ret['first_divergence'] = self.divergences[0][0]
+        if len(self.compute_ns) > 0:
+            ret['compute_us'] = {
+                    'mean': float(np.mean(self.compute_ns)) / 1000.0,
+                    'p99': float(np.percentile(self.compute_ns, 99)) / 1000.0,
+                    'max': float(np.max(self.compute_ns)) / 1000.0}
+        return ret
+
+
+def replay(filename, driver):
+    """Run ``driver`` against recorded log without sockets or sleeps"""
+    io = IOFromFile(filename, strict=False)
+    compute_ns = []
+    try:
+        while True:
+            io.sendto(driver.command(), None)
+            try:
+                status = io.recv(1024)
+            except Timeout:
+                continue
+            start = perf_counter_ns()
+            running = driver.update(status)
+            compute_ns.append(perf_counter_ns() - start)
+            if not running:
+                break
+    except EOFError:
+        pass
+    finally:
+        io.close()
+    return ReplayResult(filename, io.packet_number, io.divergences,
+                        np.array(compute_ns, dtype=np.int64))
+
+
+_tracks = {}
+
+
+def replay_demo(track_filename, filename):
+    """Replay log with demo Driver (track is loaded once per process)"""
+    if track_filename not in _tracks:
+        _tracks[track_filename] = Track.from_xml_file(track_filename)
+    return replay(filename, Driver(_tracks[track_filename], verbose=False))
+
+
+def _replay_demo_summary(args):
+    return replay_demo(*args).summary()
+
+
+def replay_many(track_filename, filenames, processes=None):
+    """Replay logs in parallel processes and return list of summaries"""
+    pool = Pool(processes)
+    try:
+        return pool.map(_replay_demo_summary,
+                        [(track_filename, filename) for filename in filenames])
+    finally:
+        pool.close()
+        pool.join()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(2)
+
+    for summary in replay_many(sys.argv[1], sys.argv[2:]):
+        print(json.dumps(summary))
+
+# vim: expandtab sw=4 ts=4
@@ -1,7 +1,12 @@
+import bisect
 import math
 import sys
 from xml.dom.minidom import parse, Node
 
+import numpy as np
+
+from geometry import wrap_angle, spiral_length, spiral_angle, spiral_lengths
+
 
 def normalize_angle(angle):
     """angle in radians, return in range -PI .. PI"""
@@ -12,36 +17,78 @@ def normalize_angle(angle):
     return angle 
 
 
+def normalize_angles(angles):
+    """array of angles in radians, return in range -PI .. PI"""
+    angles = np.asarray(angles, dtype=np.float64)
+    outside = (angles < -math.pi) | (angles > math.pi)
+    wrapped = angles - 2*math.pi * np.floor((angles + math.pi) / (2*math.pi))
+    return np.where(outside, wrapped, angles)
+
+
+def _global_pose(origin, pose):
+    """Convert ``pose`` relative to ``origin`` pose into origin coordinates"""
+    ox, oy, oh = origin
+    x, y, heading = pose
+    return (ox + math.cos(oh)*x - math.sin(oh)*y,
+            oy + math.sin(oh)*x + math.cos(oh)*y, oh + heading)
+
+
 class Segment:
+    """Track segment - straight (``length``), turn (``arc``, ``radius``) or
+    variable radius turn (with ``end_radius``)
+
+    Variable radius turn with ``profil_steps_length`` is the chain of
+    constant radius steps Speed Dreams builds (see ``subdivide``), without
+    it the radius changes linearly with the turn angle around a fixed
+    center.
+
+    The end pose and the profil steps are cached at the first use, the
+    segment should not be changed after that."""
+
+    __slots__ = ('name', 'length', 'arc', 'radius', 'end_radius',
+                 'profil_steps_length', '_delta', '_steps')
 
     @classmethod
     def from_xml(cls, ele):
-        name = ele.getAttribute('name')
+        attrs = [(attr.getAttribute('name'), attr.getAttribute('val'),
+                  attr.getAttribute('unit'))
+                 for attr in ele.childNodes if attr.nodeType == Node.ELEMENT_NODE]
+        return cls.from_attributes(ele.getAttribute('name'), attrs)
+
+    @classmethod
+    def from_etree(cls, ele):
+        """Create segment from xml.etree element"""
+        attrs = [(attr.get('name', ''), attr.get('val', ''), attr.get('unit', ''))
+                 for attr in ele]
+        return cls.from_attributes(ele.get('name', ''), attrs)
+
+    @classmethod
+    def from_attributes(cls, name, attrs):
+        """Create segment from list of XML (name, val, unit) attributes"""
         seg_type = None
         length = None
         arc = None
         radius = None
         end_radius = None
         profil_steps_length = None
-        for attr in ele.childNodes:
-            if attr.nodeType == Node.ELEMENT_NODE:
-                if attr.getAttribute('name') == 'type':
-                    seg_type = attr.getAttribute('val')
-                if attr.getAttribute('name') == 'arc':
-                    assert attr.getAttribute('unit') == 'deg', attr.getAttribute('unit')
-                    arc = math.radians(float(attr.getAttribute('val')))
-                if attr.getAttribute('name') == 'radius':
-                    assert attr.getAttribute('unit') == 'm', attr.getAttribute('unit')
-                    radius = float(attr.getAttribute('val'))
-                if attr.getAttribute('name') == 'end radius':
-                    assert attr.getAttribute('unit') == 'm', attr.getAttribute('unit')
-                    end_radius = float(attr.getAttribute('val'))
-                if attr.getAttribute('name') == 'lg':
-                    assert attr.getAttribute('unit') == 'm', attr.getAttribute('unit')
-                    length = float(attr.getAttribute('val'))
-                if attr.getAttribute('name') == 'profil steps length':
-                    assert attr.getAttribute('unit') == 'm', attr.getAttribute('unit')
-                    profil_steps_length = float(attr.getAttribute('val'))
+        for attr_name, val, unit in attrs:
+            if attr_name == 'type':
+                seg_type = val
+            if attr_name == 'arc':
+                assert unit == 'deg', unit
+                arc = math.radians(float(val))
+            if attr_name == 'radius':
+                assert unit == 'm', unit
+                radius = float(val)
+            if attr_name == 'end radius':
+                assert unit == 'm', unit
+                end_radius = float(val)
+            if attr_name == 'lg':
+                assert unit == 'm', unit
+                length = float(val)
+            if attr_name == 'profil steps length':
+                assert unit == 'm', unit
+                profil_steps_length = float(val)
 
         assert seg_type in ['lft', 'str', 'rgt'], seg_type
         if seg_type == 'rgt':
@@ -56,11 +103,228 @@ class Segment:
         self.radius = radius
         self.end_radius = end_radius
         self.profil_steps_length = profil_steps_length
+        self._delta = None
+        self._steps = None
 
     def __str__(self):
         return "Segment('{}', {}, {}, {})".format(self.name, self.length,
                                                   self.arc, self.radius)
 
+    def get_length(self):
+        """Return length of the segment center line"""
+        if self.length is not None:
+            return self.length
+        if self.end_radius is None:
+            return abs(self.arc) * self.radius
+        steps = self.profil_steps()
+        if steps is not None:
+            return steps[2][-1]
+        return spiral_length(self.radius, self.slope(), abs(self.arc))
+
+    def profil_steps(self):
+        """Return constant radius steps of variable radius turn, their start
+        poses and stations (the extra last pose and station are the end of
+        the turn)
+
+        The steps are those of ``subdivide`` with ``profil_steps_length``.
+        Return None for turn without profil steps length or with a single
+        step and for other segments."""
+        if self._steps is None:
+            self._steps = False
+            if self.end_radius is not None and self.profil_steps_length is not None:
+                parts = subdivide(self, self.profil_steps_length)
+                if len(parts) > 1:
+                    poses, stations = [(0.0, 0.0, 0.0)], [0.0]
+                    for part in parts:
+                        poses.append(part.step(poses[-1]))
+                        stations.append(stations[-1] + part.get_length())
+                    self._steps = parts, poses, stations
+        return self._steps or None
+
+    def _step_index(self, station):
+        """Return index of the profil step at ``station``"""
+        parts, poses, stations = self._steps
+        i = bisect.bisect_right(stations, station) - 1
+        return min(max(i, 0), len(parts) - 1)
+
+    def slope(self):
+        """Return radius change per radian of turn (0 for constant radius)"""
+        if self.end_radius is None:
+            return 0.0
+        return (self.end_radius - self.radius) / abs(self.arc)
+
+    def _turn_angle(self, station):
+        """Return turn angle (absolute value) after ``station`` meters"""
+        if self.end_radius is None:
+            return station / self.radius
+        return spiral_angle(self.radius, self.slope(), station)
+
+    def get_station(self, pose):
+        """Return distance along the segment of segment relative pose
+        (clamped to the segment ends)"""
+        station = self.project(pose[0], pose[1])[1]
+        return min(max(station, 0.0), self.get_length())
+
+    def pose_at(self, station):
+        """Return segment relative pose after ``station`` meters"""
+        if self.length is not None:
+            return station, 0.0, 0.0
+        steps = self.profil_steps()
+        if steps is not None:
+            parts, poses, stations = steps
+            i = self._step_index(station)
+            return _global_pose(poses[i], parts[i].pose_at(station - stations[i]))
+        angle = self._turn_angle(station)
+        radius = self.radius
+        if self.end_radius is not None:
+            radius += (self.end_radius - self.radius) * angle / abs(self.arc)
+        x = radius * math.sin(angle)
+        y = self.radius - radius * math.cos(angle)
+        if self.arc < 0:
+            return x, -y, -angle
+        return x, y, angle
+
+    def sample_steps(self, stations):
+        """Vectorized ``pose_at`` and ``curvature_at`` of profil steps
+
+        Return arrays x, y, heading and signed curvature."""
+        parts, poses, starts = self._steps
+        stations = np.asarray(stations, dtype=np.float64)
+        i = np.clip(np.searchsorted(starts, stations, side='right') - 1, 0, len(parts) - 1)
+        radius = np.array([part.radius for part in parts])[i]
+        ox, oy, oh = np.array(poses[:-1])[i].T
+        side = math.copysign(1.0, self.arc)
+        angle = (stations - np.asarray(starts)[i]) / radius
+        # left turn around Point(0, radius), right turn is mirrored
+        x = radius * np.sin(angle)
+        y = side * (radius - radius * np.cos(angle))
+        ca, sa = np.cos(oh), np.sin(oh)
+        return ox + ca*x - sa*y, oy + sa*x + ca*y, oh + side*angle, side / radius
+
+    def curvature_at(self, station):
+        """Return signed curvature (1/radius, positive to the left)"""
+        if self.length is not None:
+            return 0.0
+        steps = self.profil_steps()
+        if steps is not None:
+            return steps[0][self._step_index(station)].curvature_at(0.0)
+        radius = self.radius
+        if self.end_radius is not None:
+            radius += self.slope() * self._turn_angle(station)
+        return math.copysign(1.0 / radius, self.arc)
+
+    def project(self, x, y):
+        """Project segment relative point on the center line
+
+        Return signed distance (positive to the left), station of the
+        projected point and heading of the center line there. The station
+        is outside of 0 .. ``get_length()`` for points before the start or
+        after the end of the segment."""
+        if self.length is not None:
+            return y, x, 0.0
+        if self.profil_steps() is not None:
+            return self._project_steps(x, y)
+
+        radius = self.radius
+        if self.arc > 0:
+            # distance from Point(0, radius)
+            angle = math.atan2(x, radius - y)
+            dist = math.hypot(x, y - radius)
+        else:
+            # distance from Point(0, -radius)
+            angle = -math.atan2(-x, y + radius)
+            dist = math.hypot(x, y + radius)
+        if self.end_radius is None:
+            turn_radius = radius
+            station = angle * radius
+        else:
+            # outside of the turn the station continues with end radius
+            slope = self.slope()
+            inside = min(max(angle, 0.0), abs(self.arc))
+            turn_radius = radius + slope * inside
+            station = spiral_length(radius, slope, inside) + (angle - inside) * turn_radius
+        if self.arc > 0:
+            return turn_radius - dist, station, angle
+        return dist - turn_radius, station, -angle
+
+    def projects(self, x, y):
+        """Vectorized ``project`` for arrays of segment relative points"""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if self.length is not None:
+            return y, x, np.zeros_like(x)
+        if self.profil_steps() is not None:
+            return self._projects_steps(x, y)
+
+        radius = self.radius
+        if self.arc > 0:
+            angle = np.arctan2(x, radius - y)
+            dist = np.hypot(x, y - radius)
+        else:
+            angle = -np.arctan2(-x, y + radius)
+            dist = np.hypot(x, y + radius)
+        if self.end_radius is None:
+            turn_radius = np.full_like(angle, radius)
+            station = angle * radius
+        else:
+            slope = self.slope()
+            inside = np.clip(angle, 0.0, abs(self.arc))
+            turn_radius = radius + slope * inside
+            station = spiral_lengths(radius, slope, inside) + (angle - inside) * turn_radius
+        if self.arc > 0:
+            return turn_radius - dist, station, angle
+        return dist - turn_radius, station, -angle
+
+    def _project_steps(self, x, y):
+        """``project`` on profil steps
+
+        The step is found by bisection - the later steps are searched
+        while the projection is beyond the end of the step. Only the first
+        and the last steps continue beyond the turn."""
+        parts, poses, stations = self._steps
+        lo, hi = 0, len(parts) - 1
+        while True:
+            i = (lo + hi) // 2
+            ox, oy, oh = poses[i]
+            ca, sa = math.cos(oh), math.sin(oh)
+            dist, station, heading = parts[i].project(ca*(x - ox) + sa*(y - oy),
+                                                      ca*(y - oy) - sa*(x - ox))
+            if lo == hi:
+                return dist, stations[i] + station, oh + heading
+            if station > stations[i + 1] - stations[i]:
+                lo = i + 1
+            else:
+                hi = i
+
+    def _projects_steps(self, x, y):
+        """Vectorized ``_project_steps``"""
+        parts, poses, stations = self._steps
+        radius = np.array([part.radius for part in parts])
+        length = np.diff(stations)
+        start = np.array(poses[:-1])
+        side = math.copysign(1.0, self.arc)
+
+        def project(i):
+            ox, oy, oh = start[i, 0], start[i, 1], start[i, 2]
+            ca, sa = np.cos(oh), np.sin(oh)
+            rx = ca*(x - ox) + sa*(y - oy)
+            ry = ca*(y - oy) - sa*(x - ox)
+            r = radius[i]
+            # left turn around Point(0, r), right turn is mirrored
+            angle = np.arctan2(rx, r - side*ry)
+            return side*(r - np.hypot(rx, ry - side*r)), angle*r, oh + side*angle
+
+        lo = np.zeros(x.shape, dtype=np.intp)
+        hi = np.full(x.shape, len(parts) - 1, dtype=np.intp)
+        while np.any(lo < hi):
+            active = lo < hi
+            i = (lo + hi) // 2
+            later = project(i)[1] > length[i]
+            lo = np.where(active & later, i + 1, lo)
+            hi = np.where(active & ~later, i, hi)
+        dist, station, heading = project(lo)
+        return dist, np.asarray(stations)[lo] + station, heading
+
     def get_offset(self, pose):
         """Calculate offset from the segment.
 
@@ -74,36 +338,21 @@ class Segment:
         return None"""
 
         x, y, heading = pose
+        dist, station, center_heading = self.project(x, y)
+        if 0 <= station <= self.get_length():
+            return dist, wrap_angle(heading - center_heading)
+        return None, None
 
-        if self.length is not None:
-            # line
-            if 0 <= x <= self.length:
-                return y, normalize_angle(heading)
-            return None, None
-
-        # variable turns
-        end_radius = self.end_radius
-        if end_radius is None:
-            end_radius = self.radius
+    def get_offsets(self, x, y, heading):
+        """Vectorized ``get_offset`` for arrays of segment relative poses
 
-        if self.arc > 0:
-            # radius - distance from Point(0, radius)
-            angle = math.atan2(x, self.radius - y)
-            if 0 <= angle <= self.arc:
-                t = angle / self.arc
-                radius = (1.0 - t) * self.radius + t * end_radius
-                return (radius - math.hypot(x, y - self.radius),
-                        normalize_angle(heading - angle))
-            return None, None
-
-        # radius - distance from Point(0, -radius)
-        angle = -math.atan2(-x, y + self.radius)
-        if 0 <= angle <= -self.arc:
-            t = -angle / self.arc
-            radius = (1.0 - t) * self.radius + t * end_radius
-            return (math.hypot(x, y + self.radius) - radius,
-                    normalize_angle(heading + angle))
-        return None, None
+        Return arrays of signed distance and heading offsets with NaN
+        for poses outside of the segment "influence"."""
+        heading = np.asarray(heading, dtype=np.float64)
+        dist, station, center_heading = self.projects(x, y)
+        valid = (0 <= station) & (station <= self.get_length())
+        return (np.where(valid, dist, np.nan),
+                np.where(valid, normalize_angles(heading - center_heading), np.nan))
 
     def _step(self):
         if self.arc is None:
@@ -113,6 +362,10 @@ class Segment:
 
         assert self.arc is not None
         assert self.radius is not None
+        steps = self.profil_steps()
+        if steps is not None:
+            # end of the last profil step
+            return steps[1][-1]
         if self.end_radius is None:
             # turn of fixed radius
             angle = self.arc / 2.0
@@ -130,8 +383,57 @@ class Segment:
         
         return math.cos(angle)*dist, math.sin(angle)*dist, self.arc
 
+    def bbox(self):
+        """Return bounding box (xmin, ymin, xmax, ymax) in segment coordinates
+
+        The box covers every point where ``get_offset`` measures zero
+        distance, i.e. |offset| is the distance to a point inside the box."""
+        if self.length is not None:
+            return min(0.0, self.length), 0.0, max(0.0, self.length), 0.0
+        steps = self.profil_steps()
+        if steps is not None:
+            return self._bbox_steps()
+
+        end_radius = self.end_radius
+        if end_radius is None:
+            end_radius = self.radius
+        arc = abs(self.arc)
+        angles = [0.0, arc]
+        quarter = math.pi/2.0
+        k = 1
+        while k * quarter < arc:
+            angles.append(k * quarter)
+            k += 1
+        xs, ys = [], []
+        for radius in (min(self.radius, end_radius), max(self.radius, end_radius)):
+            for angle in angles:
+                # left turn around Point(0, self.radius)
+                xs.append(radius * math.sin(angle))
+                ys.append(self.radius - radius * math.cos(angle))
+        if self.arc < 0:
+            # right turn is mirrored left turn
+            ys = [-y for y in ys]
+        return min(xs), min(ys), max(xs), max(ys)
+
+    def _bbox_steps(self):
+        """``bbox`` of profil steps - their ends and the points with
+        heading multiple of PI/2"""
+        parts, poses, stations = self._steps
+        points = list(poses)
+        quarter = math.pi/2.0
+        for part, (x, y, heading), station in zip(parts, poses, stations):
+            end_heading = heading + part.arc
+            for k in range(int(math.ceil(min(heading, end_heading)/quarter)),
+                           int(math.floor(max(heading, end_heading)/quarter)) + 1):
+                points.append(self.pose_at(station + abs(k*quarter - heading)*part.radius))
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        return min(xs), min(ys), max(xs), max(ys)
+
     def step(self, pose=None):
-        dx, dy, dh = self._step()
+        if self._delta is None:
+            self._delta = self._step()
+        dx, dy, dh = self._delta
         if pose is None:
             return dx, dy, dh
         x, y, heading = pose
@@ -140,4 +442,39 @@ class Segment:
         heading += dh
         return x, y, heading
 
+
+def subdivide(s, default_profil_steps_length):
+    """Split variable radius turn into list of constant radius segments"""
+    if s.end_radius is None:
+        return [s]
+    profil_steps_length = default_profil_steps_length
+    if s.profil_steps_length is not None:
+        profil_steps_length = s.profil_steps_length
+    length = abs((s.radius + s.end_radius)/2.0 * s.arc)
+    num_steps = int(length/profil_steps_length) + 1
+    if num_steps == 1:
+        return [s]
+    # rearange steps so:
+    #  - every part of the turn has the same length
+    #  - the first part has curvature given by ``radius``
+    #  - the last part had curvature given by ``end_radius``
+    #  - there are ``steps`` parts
+    #  - the total ``arc`` angle does not change
+    dradius = (s.end_radius - s.radius)/float(num_steps - 1)
+
+    tmp = 0.0
+    for i in range(num_steps):
+        tmp += 1.0/(s.radius + i*dradius)
+    geom_average = 1.0 / tmp
+
+    segments = []
+    for i in range(num_steps):
+        name = None if s.name is None else s.name + '.' + str(i)
+        radius = s.radius + i*dradius
+        arc = s.arc * geom_average / radius
+        segments.append(Segment(name=name, arc=arc,
+                                radius=radius,
+                                end_radius=None))
+    return segments
+
 # vim: expandtab sw=4 ts=4
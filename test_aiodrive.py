@@ -0,0 +1,112 @@
+import asyncio
+import math
+import struct
+import time
+import unittest
+
+from aiodrive import run_car, run_cars, RESEND_TIMEOUT
+from demo import Driver
+from fixtures import sensors_packet
+from iolog import INPUT, OUTPUT
+from segment import Segment
+from track import Track
+
+
+class StandInSimulator(asyncio.DatagramProtocol):
+    """Reply to every command with sensors packet, stop after ``count``
+
+    Replies to commands with numbers in ``lost`` are not sent."""
+
+    def __init__(self, count, lost=()):
+        self.count = count
+        self.lost = lost
+        self.commands = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.commands.append(data)
+        if len(self.commands) in self.lost:
+            return
+        i = len(self.commands) - len([j for j in self.lost if j < len(self.commands)])
+        packet = sensors_packet(i * 0.02, i * 0.5, 0.5,
+                                sim_status=5 if i >= self.count else 3)
+        self.transport.sendto(packet, addr)
+
+
+class MemoryLog(object):
+
+    def __init__(self):
+        self.records = []
+
+    def log(self, io_dir, data):
+        self.records.append((io_dir, data))
+
+
+async def simulate(loop, count, lost=()):
+    return await loop.create_datagram_endpoint(
+            lambda: StandInSimulator(count, lost), local_addr=('127.0.0.1', 0))
+
+
+class AioDriveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.track = Track([Segment(length=100.0), Segment(arc=math.radians(90), radius=50.0)]*4,
+                           width=20)
+        self.transports = []
+
+    def tearDown(self):
+        for transport in self.transports:
+            transport.close()
+        # let the closed transports release their sockets
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def simulate(self, count, lost=()):
+        transport, sim = self.loop.run_until_complete(simulate(self.loop, count, lost))
+        self.transports.append(transport)
+        return transport, sim
+
+    def test_run_car(self):
+        transport, sim = self.simulate(10)
+        log = MemoryLog()
+        stats = self.loop.run_until_complete(
+                run_car(Driver(self.track, verbose=False), port=0,
+                        sim_address=transport.get_extra_info('sockname'), log=log))
+        self.assertEqual(stats['received'], 10)
+        self.assertEqual(stats['sent'], 10)
+        self.assertEqual(len(sim.commands), 10)
+        self.assertEqual([io_dir for io_dir, data in log.records], [OUTPUT, INPUT]*10)
+        self.assertEqual(log.records[0][1], sim.commands[0])
+        # 2nd command already follows the track
+        self.assertAlmostEqual(struct.unpack_from('f', sim.commands[1], 4)[0], 0.2)
+
+    def test_lost_packet(self):
+        transport, sim = self.simulate(5, lost=(3,))
+        start = time.perf_counter()
+        stats = self.loop.run_until_complete(
+                run_car(Driver(self.track, verbose=False), port=0,
+                        sim_address=transport.get_extra_info('sockname')))
+        duration = time.perf_counter() - start
+        self.assertEqual(stats['received'], 5)
+        self.assertEqual(stats['sent'], 6)  # resent after the lost reply
+        self.assertLess(duration, 5 * RESEND_TIMEOUT)
+
+    def test_run_cars(self):
+        cars = []
+        sims = []
+        for count in [5, 8]:
+            transport, sim = self.simulate(count)
+            sims.append((transport, sim))
+            cars.append({'driver': Driver(self.track, verbose=False), 'port': 0, 'period': 0.001,
+                         'sim_address': transport.get_extra_info('sockname')})
+        results = self.loop.run_until_complete(run_cars(cars))
+        for (transport, sim), stats, count in zip(sims, results, [5, 8]):
+            self.assertEqual(stats['received'], count)
+            self.assertGreaterEqual(stats['sent'], count)
+
+# vim: expandtab sw=4 ts=4
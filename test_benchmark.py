@@ -0,0 +1,32 @@
+import json
+import math
+import unittest
+
+from benchmark import run_benchmarks, compare, synthetic_track
+from track import track2xy
+
+
+class BenchmarkTest(unittest.TestCase):
+
+    def test_synthetic_track(self):
+        for size in [10, 100]:
+            track = synthetic_track(size)
+            self.assertEqual(len(track.segments), size)
+            x, y, heading = track2xy(track.segments)
+            self.assertAlmostEqual(x, 0.0)
+            self.assertAlmostEqual(y, 0.0)
+            self.assertAlmostEqual(heading, 2 * math.pi)
+
+    def test_run_benchmarks(self):
+        results = run_benchmarks(track_sizes=[10], log_sizes=[20], min_time=0.001)
+        names = set(r['name'] for r in results['results'])
+        for name in ['normalize_angle', 'Segment.get_offset', 'Track.nearest_segment',
+                     'Track.nearest_segment_scan', 'Track.from_xml_file',
+                     'Sensors.from_packet', 'packet_gen', 'load_log']:
+            self.assertIn(name, names)
+        results = json.loads(json.dumps(results))
+        ratios = [ratio for name, params, ref, us, ratio in compare(results, results)]
+        self.assertEqual(len(ratios), len(results['results']))
+        self.assertEqual(set(ratios), {1.0})
+
+# vim: expandtab sw=4 ts=4
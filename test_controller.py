@@ -0,0 +1,136 @@
+import unittest
+import math
+import struct
+
+import numpy as np
+
+from controller import (SensorView, TrackContext, Controller, Runtime, run,
+                        COMMAND_STRUCT)
+from fixtures import sensors_packet
+from iolog import Timeout
+from packets import Command, SENSORS_DTYPE
+from segment import Segment
+from track import Track
+
+
+def status_packet(i, x, y, heading=0.0, sim_status=3):
+    return sensors_packet(i * 0.02, x, y, heading, sim_status, dist=i * 0.5,
+                          last_lap_time=12.5, z=0.1, velocity=(3.0, 4.0, 0.0), counter=i)
+
+
+class ConstantController(Controller):
+
+    def __init__(self):
+        self.calls = []
+
+    def control(self, sensors, context):
+        self.calls.append((sensors.lap_time, context.index, context.offset))
+        return Command(0.5, 0.25, 0.0)
+
+
+class FakeIO(object):
+    """Serve status packets, drop every ``lost`` reply"""
+
+    def __init__(self, packets, lost=None):
+        self.packets = list(packets)
+        self.lost = lost
+        self.sent = []
+
+    def bind(self, address):
+        self.address = address
+
+    def settimeout(self, value):
+        pass
+
+    def sendto(self, data, address):
+        self.sent.append(bytes(data))
+
+    def recv(self, bufsize):
+        if self.lost is not None and len(self.sent) % self.lost == 0:
+            raise Timeout()
+        if not self.packets:
+            raise Timeout()
+        return self.packets.pop(0)
+
+
+class ControllerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.track = Track([Segment(length=100.0), Segment(arc=math.pi, radius=20.0)]*2,
+                           width=10.0)
+
+    def test_sensor_view(self):
+        packet = status_packet(7, 10.0, 1.5, heading=0.25)
+        view = SensorView()
+        view.update(packet)
+        record = np.frombuffer(packet, dtype=SENSORS_DTYPE)[0]
+        self.assertEqual(view.lap_time, record['lap_time'])
+        self.assertEqual(view.last_lap_time, 12.5)
+        self.assertEqual((view.x, view.y, view.z), (10.0, 1.5, record['abs_pos_z']))
+        self.assertEqual(view.heading, record['ang_z'])
+        self.assertEqual(view.sim_counter, 7)
+        self.assertTrue(view.running())
+        self.assertAlmostEqual(view.speed(), 5.0)
+        self.assertEqual(view.record()['sim_counter'], 7)
+
+    def test_track_context(self):
+        context = TrackContext(self.track)
+        view = SensorView()
+        view.update(status_packet(0, 50.0, -1.5))
+        context.update(view)
+        self.assertEqual(context.index, 0)
+        self.assertAlmostEqual(context.offset, -1.5)
+        self.assertAlmostEqual(context.station(), 50.0)
+        context = TrackContext(Track([Segment(length=100.0)], width=10.0))
+        view.update(status_packet(0, -50.0, 0.0))
+        context.update(view)
+        self.assertIsNone(context.segment)
+        self.assertIsNone(context.offset)
+        self.assertIsNone(context.station())
+
+    def test_runtime(self):
+        controller = ConstantController()
+        runtime = Runtime(controller, self.track)
+        data = runtime.pack()
+        self.assertIs(runtime.pack(), data)  # buffer is reused
+        self.assertEqual(COMMAND_STRUCT.unpack(data), (0.0, 0.0, 0.0, 1, 11, 1))
+        self.assertTrue(runtime.update(status_packet(1, 10.0, 0.0)))
+        self.assertEqual(runtime.command(),
+                         struct.pack('fffiBB', 0.5, 0.25, 0.0, 1, 11, 2))
+        self.assertEqual(controller.calls, [(0.019999999552965164, 0, 0.0)])
+        self.assertEqual(runtime.lap_times, [])  # no lap start seen yet
+        self.assertFalse(runtime.update(status_packet(2, 10.0, 0.0, sim_status=5)))
+        self.assertEqual(len(controller.calls), 1)
+
+    def test_lap_times(self):
+        runtime = Runtime(ConstantController(), self.track)
+        for lap in range(3):
+            for i in range(5):
+                runtime.update(sensors_packet(i * 2.5, 10.0, 0.0,
+                                              last_lap_time=12.5 if lap > 0 else 0.0))
+        # two laps with the same LastLapTime
+        self.assertEqual(runtime.lap_times, [12.5, 12.5])
+        self.assertEqual(runtime.lap_time, 10.0)
+        runtime.update(sensors_packet(sim_status=5))
+        self.assertEqual(runtime.lap_times, [12.5, 12.5])
+
+    def test_run(self):
+        packets = [status_packet(i, i * 1.0, 0.0, sim_status=5 if i == 9 else 3)
+                   for i in range(10)]
+        io = FakeIO(packets, lost=4)
+        controller = ConstantController()
+        runtime = run(io, Runtime(controller, self.track), port=4005)
+        self.assertEqual(io.address, ('', 4005))
+        self.assertEqual(len(controller.calls), 9)
+        self.assertEqual(len(io.sent), 13)  # 3 timeouts
+        self.assertEqual(COMMAND_STRUCT.unpack(io.sent[0])[:3], (0.0, 0.0, 0.0))
+        self.assertEqual(io.sent[-1], struct.pack('fffiBB', 0.5, 0.25, 0.0, 1, 11, 12))
+
+        io = FakeIO([])
+        runtime = run(io, Runtime(controller, self.track), max_timeouts=3)
+        self.assertEqual(len(io.sent), 3)
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: expandtab sw=4 ts=4
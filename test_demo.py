@@ -1,8 +1,8 @@
 import unittest
-import math
 
-from demo import segment_turn
-from track import Segment
+from demo import segment_turn, Driver
+from fixtures import sensors_packet
+from track import Segment, Track
 
 class DemoTest(unittest.TestCase):
 
@@ -13,4 +13,17 @@ class DemoTest(unittest.TestCase):
         s = Segment(name='t4', radius=53.3, arc=-110.0)
         self.assertAlmostEqual(segment_turn(s), -2.763, places=2)
 
+    def test_driver_commands(self):
+        driver = Driver(Track([Segment(length=100.0)], width=10.0), verbose=False)
+        self.assertTrue(driver.update(sensors_packet(0.02, 10.0, 1.0)))
+        first = driver.last_command
+        self.assertTrue(driver.update(sensors_packet(0.04, 11.0, -1.0)))
+        self.assertIsNot(driver.last_command, first)  # no shared live state
+        self.assertNotEqual(driver.last_command.steering, first.steering)
+        second = driver.last_command
+        self.assertTrue(driver.update(sensors_packet(0.06, -50.0, 0.0)))
+        self.assertIs(driver.last_command, second)  # kept outside of the track
+        data = driver.command()
+        self.assertIs(data, driver.buffer)  # no copy per packet
+
 # vim: expandtab sw=4 ts=4
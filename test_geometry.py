@@ -0,0 +1,127 @@
+import unittest
+import math
+import random
+
+import numpy as np
+
+from geometry import (wrap_angle, SegmentGeometry, spiral_length, spiral_angle,
+                      spiral_lengths, spiral_angles)
+from segment import Segment, normalize_angle
+from track import Track, relative_pose
+
+
+def random_segment(rnd):
+    kind = rnd.randrange(3)
+    if kind == 0:
+        return Segment(length=rnd.uniform(0.1, 100.0))
+    arc = rnd.choice([-1, 1]) * rnd.uniform(0.01, math.pi)
+    radius = rnd.uniform(1.0, 200.0)
+    if kind == 1:
+        return Segment(arc=arc, radius=radius)
+    return Segment(arc=arc, radius=radius, end_radius=rnd.uniform(1.0, 200.0))
+
+
+def reference_distance(segment, pose):
+    """Signed distance of the original ``Segment.get_offset``"""
+    x, y, heading = pose
+    if segment.length is not None:
+        if 0 <= x <= segment.length:
+            return y
+        return None
+
+    end_radius = segment.end_radius
+    if end_radius is None:
+        end_radius = segment.radius
+    if segment.arc > 0:
+        # radius - distance from Point(0, radius)
+        angle = math.atan2(x, segment.radius - y)
+        if 0 <= angle <= segment.arc:
+            t = angle / segment.arc
+            radius = (1.0 - t) * segment.radius + t * end_radius
+            return radius - math.hypot(x, y - segment.radius)
+        return None
+
+    # radius - distance from Point(0, -radius)
+    angle = -math.atan2(-x, y + segment.radius)
+    if 0 <= angle <= -segment.arc:
+        t = -angle / segment.arc
+        radius = (1.0 - t) * segment.radius + t * end_radius
+        return math.hypot(x, y + segment.radius) - radius
+    return None
+
+
+class GeometryTest(unittest.TestCase):
+
+    def test_wrap_angle(self):
+        self.assertEqual(wrap_angle(0.0), 0.0)
+        self.assertEqual(wrap_angle(math.pi), math.pi)
+        self.assertEqual(wrap_angle(-math.pi), -math.pi)
+        self.assertAlmostEqual(wrap_angle(3 * math.pi / 2), -math.pi / 2)
+        self.assertAlmostEqual(wrap_angle(-3 * math.pi / 2), math.pi / 2)
+
+    def test_wrap_angle_equivalence(self):
+        rnd = random.Random(18)
+        for i in range(10000):
+            angle = rnd.uniform(-1000.0, 1000.0)
+            ref = normalize_angle(angle)
+            fast = wrap_angle(angle)
+            self.assertTrue(-math.pi <= fast <= math.pi, angle)
+            # the boundary (+PI vs. -PI) may differ by rounding
+            diff = abs(fast - ref)
+            self.assertTrue(diff < 1e-9 or abs(diff - 2 * math.pi) < 1e-9, angle)
+            if -math.pi <= angle <= math.pi:
+                self.assertEqual(fast, ref)
+
+    def test_spiral_length(self):
+        rnd = random.Random(24)
+        for i in range(50):
+            radius = rnd.uniform(5.0, 200.0)
+            slope = rnd.choice([0.0, 1e-12, rnd.uniform(-radius/4, radius)])
+            angle = rnd.uniform(0.01, 3.0)
+            n = 2000
+            ref = sum(math.hypot(radius + slope * (j + 0.5) * angle / n, slope)
+                      for j in range(n)) * angle / n
+            length = spiral_length(radius, slope, angle)
+            self.assertAlmostEqual(length, ref, delta=1e-6 * ref)
+            self.assertAlmostEqual(spiral_angle(radius, slope, length), angle)
+            station = rnd.uniform(0, length)
+            self.assertAlmostEqual(
+                    spiral_length(radius, slope, spiral_angle(radius, slope, station)),
+                    station)
+            self.assertAlmostEqual(float(spiral_lengths(np.array([radius]), slope, angle)[0]),
+                                   length)
+            self.assertAlmostEqual(float(spiral_angles(radius, np.array([slope]), station)[0]),
+                                   spiral_angle(radius, slope, station))
+        self.assertEqual(spiral_length(10.0, 0.0, 2.0), 20.0)
+
+    def test_distance_equivalence(self):
+        rnd = random.Random(42)
+        for i in range(200):
+            segment = random_segment(rnd)
+            start = (rnd.uniform(-100, 100), rnd.uniform(-100, 100),
+                     rnd.uniform(-math.pi, math.pi))
+            geometry = SegmentGeometry(segment, start)
+            for j in range(50):
+                x, y = rnd.uniform(-300, 300), rnd.uniform(-300, 300)
+                rel_pose = relative_pose((x, y, 0.0), start)
+                dist = geometry.distance(x, y)
+                ref = reference_distance(segment, rel_pose)
+                if ref is None:
+                    self.assertIsNone(dist)
+                else:
+                    self.assertAlmostEqual(dist, ref)
+                self.assertEqual(segment.get_offset(rel_pose)[0], dist)
+
+    def test_nearest_segment_equivalence(self):
+        rnd = random.Random(7)
+        segments = [random_segment(rnd) for i in range(30)]
+        track = Track(segments, width=10.0)
+        for i in range(500):
+            pose = (rnd.uniform(-500, 500), rnd.uniform(-500, 500), 0.0)
+            self.assertEqual(track.nearest_segment(pose),
+                             track.nearest_segment_scan(pose))
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: expandtab sw=4 ts=4
@@ -0,0 +1,117 @@
+import unittest
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+
+from fixtures import sensors_packet
+from harness import make_configs, run_harness, summarize
+from test_track import TRACK_XML
+
+
+class StubSimulator(threading.Thread):
+    """UDP simulator answering every command, lap takes ``lap`` packets"""
+
+    def __init__(self, count, lap):
+        super().__init__(daemon=True)
+        self.count = count
+        self.lap = lap
+        self.commands = []
+        self.soc = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.soc.bind(('127.0.0.1', 0))
+        self.soc.settimeout(10.0)
+        self.address = self.soc.getsockname()
+
+    def run(self):
+        try:
+            while len(self.commands) < self.count:
+                data, addr = self.soc.recvfrom(1024)
+                self.commands.append(data)
+                i = len(self.commands)
+                # every lap takes the same time
+                packet = sensors_packet((i % self.lap) * 0.1,
+                                        sim_status=5 if i >= self.count else 3,
+                                        last_lap_time=self.lap * 0.1 if i >= self.lap else 0.0)
+                self.soc.sendto(packet, addr)
+        except socket.timeout:
+            pass
+        finally:
+            self.soc.close()
+
+
+def free_port():
+    soc = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    soc.bind(('127.0.0.1', 0))
+    port = soc.getsockname()[1]
+    soc.close()
+    return port
+
+
+class HarnessTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.track_filename = os.path.join(self.tmp_dir, 'test.xml')
+        with open(self.track_filename, 'w') as f:
+            f.write(TRACK_XML)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_make_configs(self):
+        configs = make_configs(self.track_filename, 3, port=5000, sim_port=6000,
+                               gains=[{'gas': 0.1}, {'gas': 0.2}, {'gas': 0.3}],
+                               max_timeouts=2)
+        self.assertEqual([c['port'] for c in configs], [5000, 5001, 5002])
+        self.assertEqual(configs[2]['sim_address'], ('127.0.0.1', 6002))
+        self.assertEqual(configs[1]['name'], 'test-1')
+        self.assertEqual(configs[1]['gains'], {'gas': 0.2})
+        self.assertEqual(configs[0]['max_timeouts'], 2)
+
+    def test_run_harness(self):
+        sims = [StubSimulator(count=25, lap=10), StubSimulator(count=35, lap=7)]
+        for sim in sims:
+            sim.start()
+        log_dir = os.path.join(self.tmp_dir, 'logs')
+        configs = make_configs(self.track_filename, 2, gains=[{}, {'gas': 0.5}],
+                               log_dir=log_dir, max_timeouts=3)
+        for config, sim in zip(configs, sims):
+            config['port'] = free_port()
+            config['sim_address'] = sim.address
+        results = run_harness(configs)
+        for sim in sims:
+            sim.join()
+
+        self.assertEqual([r['ok'] for r in results], [True, True], results)
+        self.assertEqual(len(sims[0].commands), 25)
+        self.assertEqual(len(sims[1].commands), 35)
+        self.assertEqual(len(results[0]['lap_times']), 2)
+        # the lap finished by the stop packet is not counted
+        self.assertEqual(len(results[1]['lap_times']), 4)
+        for lap_time in results[1]['lap_times']:
+            self.assertAlmostEqual(lap_time, 0.7, 5)
+        self.assertTrue(os.path.exists(results[0]['log']))
+        self.assertNotEqual(results[0]['log'], results[1]['log'])
+        # the 2nd car uses its own gas gain
+        self.assertAlmostEqual(struct.unpack_from('f', sims[1].commands[1], 4)[0], 0.5)
+
+        summary = summarize(results)
+        self.assertEqual(summary['instances'], 2)
+        self.assertEqual(summary['failed'], [])
+        self.assertEqual(summary['laps'], 6)
+        self.assertEqual(summary['best'], 'test-1')
+
+    def test_failed_instance(self):
+        configs = make_configs(os.path.join(self.tmp_dir, 'missing.xml'), 1,
+                               log_dir=os.path.join(self.tmp_dir, 'logs'))
+        results = run_harness(configs)
+        self.assertFalse(results[0]['ok'])
+        self.assertIsNotNone(results[0]['error'])
+        self.assertEqual(summarize(results)['failed'], ['missing-0'])
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: expandtab sw=4 ts=4
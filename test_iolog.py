@@ -0,0 +1,158 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from struct import pack
+
+from iolog import (BufferedWriter, IOLog, IOFromFile, scan_records, packet_gen,
+                   map_log, convert_log, benchmark_log, scan_blocks, read_version,
+                   VERSION, VERSION_COMPRESSED, INPUT, OUTPUT)
+from fixtures import write_log
+
+
+class SlowFile(io.BytesIO):
+    """File blocked in write() until ``ready`` is set"""
+
+    def __init__(self):
+        super(SlowFile, self).__init__()
+        self.ready = threading.Event()
+        self.data = b''
+
+    def write(self, data):
+        self.ready.wait()
+        self.data += data
+        return len(data)
+
+    def close(self):
+        pass
+
+
+class IOLogTest(unittest.TestCase):
+
+    def test_scan_records(self):
+        buf = (pack('HH', 5, OUTPUT) + b'abc' + pack('HH', 3, INPUT) + b'x'
+               + pack('HH', 10, INPUT) + b'trunc')
+        index = scan_records(buf)
+        self.assertEqual(list(index['offset']), [4, 11])
+        self.assertEqual(list(index['length']), [3, 1])
+        self.assertEqual(list(index['io_dir']), [OUTPUT, INPUT])
+
+    def test_packet_gen(self):
+        records = [(OUTPUT, b'cmd'), (INPUT, b'sensors')]
+        with tempfile.NamedTemporaryFile(suffix='.log', delete=False) as f:
+            write_log(f, records)
+        try:
+            self.assertEqual(list(packet_gen(f.name)), records)
+        finally:
+            os.remove(f.name)
+
+    def test_buffered_writer(self):
+        f = SlowFile()
+        f.ready.set()
+        writer = BufferedWriter(f, batch_size=10, flush_interval=10.0)
+        for i in range(100):
+            writer.write(b'%03d' % i)
+        writer.flush()
+        self.assertEqual(f.data, b''.join(b'%03d' % i for i in range(100)))
+        writer.write(b'end')
+        writer.close()
+        self.assertTrue(f.data.endswith(b'099end'))
+        self.assertEqual(writer.dropped, 0)
+
+    def test_buffered_writer_pending_flush(self):
+        f = SlowFile()
+        f.ready.set()
+        flushes = []
+        f.flush = lambda: flushes.append(1)
+        writer = BufferedWriter(f, flush_interval=10.0)
+        writer.write(b'abc')
+        writer.flush()
+        # flush request not withdrawn yet, nothing left to write
+        with writer.cond:
+            writer.flush_requests += 1
+            writer.cond.notify_all()
+        time.sleep(0.05)
+        count = len(flushes)
+        with writer.cond:
+            writer.flush_requests -= 1
+        writer.close()
+        self.assertLessEqual(count, 2)
+        self.assertEqual(f.data, b'abc')
+
+    def test_buffered_writer_drop(self):
+        f = SlowFile()
+        writer = BufferedWriter(f, max_records=2, block=False, flush_interval=0.01)
+        for i in range(10):
+            writer.write(b'%d' % i)
+        self.assertGreaterEqual(writer.dropped, 6)
+        f.ready.set()
+        writer.close()
+        self.assertEqual(len(f.data), 10 - writer.dropped)
+        self.assertEqual(writer.blocked, 0)
+
+    def test_buffered_compressed_log(self):
+        log_dir = tempfile.mkdtemp()
+        try:
+            log = IOLog('test', buffered=True, version=VERSION_COMPRESSED,
+                        log_dir=log_dir, batch_size=1000)
+            records = [(INPUT, b'%04d' % i) for i in range(500)]
+            for io_dir, data in records:
+                log.log(io_dir, data)
+            log.close()
+            self.assertEqual(list(packet_gen(log.filename)), records)
+            with open(log.filename, 'rb') as f:
+                read_version(f)
+                blocks = scan_blocks(f)
+            self.assertEqual(blocks['records'].sum(), len(records))
+        finally:
+            shutil.rmtree(log_dir)
+
+    def test_compressed_log(self):
+        records = []
+        for i in range(1000):
+            records.append((OUTPUT, pack('fffiBB', 0.1, 0.2, 0, 1, 11, i & 0xFF)))
+            records.append((INPUT, pack('ff', i, 2*i) + bytes(786)))
+        with tempfile.NamedTemporaryFile(suffix='.log', delete=False) as f:
+            write_log(f, records)
+        src, dst = f.name, f.name + '.v2'
+        try:
+            convert_log(src, dst, block_size=10000)
+            self.assertEqual(list(packet_gen(dst)), records)
+            with open(dst, 'rb') as f:
+                self.assertEqual(read_version(f), VERSION_COMPRESSED)
+                blocks = scan_blocks(f)
+            self.assertGreater(len(blocks), 50)
+            self.assertEqual(blocks['records'].sum(), len(records))
+
+            with open(src, 'rb') as f1, open(dst, 'rb') as f2:
+                mm1, index1 = map_log(f1)
+                mm2, index2 = map_log(f2)
+                self.assertEqual(mm1[:], mm2[:])
+                self.assertEqual(index1.tolist(), index2.tolist())
+                mm1.close()
+                mm2.close()
+
+            io = IOFromFile(dst)
+            for io_dir, data in records[:20]:
+                if io_dir == OUTPUT:
+                    io.sendto(data, None)
+                else:
+                    self.assertEqual(io.recv(1024), data)
+            io.close()
+
+            size, raw_size, ratio, speed = benchmark_log(dst)
+            self.assertEqual(raw_size, os.path.getsize(src))
+            self.assertGreater(ratio, 10.0)
+
+            convert_log(dst, src + '.v1', version=VERSION)
+            with open(src, 'rb') as f1, open(src + '.v1', 'rb') as f2:
+                self.assertEqual(f1.read(), f2.read())
+        finally:
+            for filename in [src, dst, src + '.v1']:
+                if os.path.exists(filename):
+                    os.remove(filename)
+
+# vim: expandtab sw=4 ts=4
@@ -0,0 +1,95 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from fixtures import square_track, center_line_log
+from iolog import packet_gen
+from lapstats import (decode, localize, split_laps, lap_stats, analyze_logs,
+                      merge, table)
+from track import Track
+from test_track import LOOP_XML
+
+
+# car 1 m left of the center line, 2 m per sample
+LAPS = {'speed': 20.0, 'dt': 0.1, 'offset': 1.0}
+
+
+class LapStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.track = square_track()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_stages(self):
+        filename = os.path.join(self.tmp_dir, 'a.log')
+        center_line_log(filename, self.track, 20, start=500.0, **LAPS)
+        samples = list(split_laps(localize(decode(packet_gen(filename)), self.track)))
+        self.assertEqual(len(samples), 20)  # stopped packet is skipped
+        self.assertAlmostEqual(samples[0].speed, 20.0, 5)
+        self.assertEqual(samples[0].segment, 7)
+        self.assertAlmostEqual(samples[0].offset, 1.0, 4)
+        self.assertEqual(samples[1].segment, 7)
+        self.assertEqual(samples[-1].segment, 0)
+        # track length is 525.7 m, 2 m per sample
+        self.assertEqual([s.lap for s in samples[11:14]], [0, 0, 1])
+
+    def test_lap_stats(self):
+        filename = os.path.join(self.tmp_dir, 'a.log')
+        center_line_log(filename, self.track, 700, start=100.0, **LAPS)
+        laps = list(lap_stats(packet_gen(filename), self.track))
+        self.assertEqual([lap['lap'] for lap in laps], [0, 1, 2])
+        self.assertEqual([lap['complete'] for lap in laps], [False, True, False])
+        lap = laps[1]
+        self.assertAlmostEqual(lap['lap_time'], self.track.length / 20.0, 4)
+        self.assertEqual([row['name'] for row in lap['segments']],
+                         [s.name for s in self.track.segments])
+        self.assertAlmostEqual(sum(row['time'] for row in lap['segments']),
+                               lap['lap_time'], delta=0.2)
+        self.assertAlmostEqual(lap['segments'][0]['time'], 5.0, delta=0.2)
+        for row in lap['segments']:
+            self.assertAlmostEqual(row['mean_offset'], 1.0, 3)
+            self.assertAlmostEqual(row['max_speed'], 20.0, 4)
+        rows = list(table(laps))
+        self.assertEqual(rows[0]['lap'], 0)
+        self.assertEqual(len([row for row in rows if row['lap'] == 1]), 8)
+
+    def test_first_lap(self):
+        filename = os.path.join(self.tmp_dir, 'a.log')
+        # the log starts at the start line
+        center_line_log(filename, self.track, 400, start=0.0, **LAPS)
+        laps = list(lap_stats(packet_gen(filename), self.track))
+        self.assertEqual([lap['complete'] for lap in laps], [True, False])
+        self.assertAlmostEqual(laps[0]['lap_time'], self.track.length / 20.0, 4)
+        merged = merge([(filename, laps)])
+        self.assertEqual(merged['best']['lap'], 0)
+        self.assertEqual(len(merged['segments']), len(self.track.segments))
+
+    def test_analyze_logs(self):
+        track_filename = os.path.join(self.tmp_dir, 'loop.xml')
+        with open(track_filename, 'w') as f:
+            f.write(LOOP_XML)
+        track = Track.from_xml_file(track_filename)
+        filenames = []
+        for i, speed in enumerate([20.0, 25.0]):
+            filenames.append(os.path.join(self.tmp_dir, '%d.log' % i))
+            center_line_log(filenames[-1], track, int(2.5 * track.length / (speed * 0.1)),
+                            start=10.0, speed=speed, dt=0.1, offset=1.0)
+        results = analyze_logs(track_filename, filenames, processes=2)
+        self.assertEqual([filename for filename, laps in results], filenames)
+        merged = merge(results)
+        self.assertEqual(merged['best']['log'], filenames[1])
+        self.assertAlmostEqual(merged['best']['lap_time'], track.length / 25.0, 4)
+        self.assertEqual(len(merged['segments']), len(track.segments))
+        for row in merged['segments']:
+            self.assertEqual(row['laps'], 2)
+            self.assertLessEqual(row['best_time'], row['mean_time'])
+            self.assertAlmostEqual(row['max_speed'], 25.0, 4)
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: expandtab sw=4 ts=4
@@ -0,0 +1,66 @@
+import os
+import random
+import tempfile
+import unittest
+
+from demo import drive, Driver
+from iolog import IOFromFile
+from latency import LatencyHistogram, LoopProfiler, SimCounterMonitor, perf_counter_ns
+from test_replay import record_log
+from segment import Segment
+from track import Track
+
+
+class LatencyTest(unittest.TestCase):
+
+    def test_perf_counter_ns(self):
+        start = perf_counter_ns()
+        self.assertIsInstance(start, int)
+        self.assertGreaterEqual(perf_counter_ns(), start)
+
+    def test_histogram(self):
+        random.seed(1)
+        values = sorted(random.randint(0, 10**7) for i in range(10000))
+        histogram = LatencyHistogram()
+        for value in values:
+            histogram.record(value)
+        self.assertEqual(histogram.count, 10000)
+        self.assertEqual(histogram.max, values[-1])
+        self.assertEqual(histogram.min, values[0])
+        for q in [50, 90, 99]:
+            ref = values[int(q / 100.0 * len(values)) - 1]
+            self.assertAlmostEqual(histogram.percentile(q) / float(ref), 1.0, delta=0.04)
+        self.assertEqual(histogram.percentile(100), values[-1])
+        self.assertIsNone(LatencyHistogram().percentile(50))
+
+        histogram = LatencyHistogram()
+        for value in [0, 1, 2, 63]:
+            histogram.record(value)
+        self.assertEqual(histogram.summary(), {'count': 4, 'p50': 1, 'p99': 63, 'max': 63})
+
+    def test_sim_counter(self):
+        monitor = SimCounterMonitor()
+        for counter in [250, 251, 253, 253, 254, 255, 0, 3]:
+            monitor.update(counter)
+        self.assertEqual(monitor.missed, 1 + 2)
+        self.assertEqual(monitor.duplicate, 1)
+
+    def test_profile_drive(self):
+        track = Track([Segment(length=100.0)], width=20.0)
+        with tempfile.NamedTemporaryFile(suffix='.log', delete=False) as f:
+            record_log(f, track, 20, lost=[3])
+        self.addCleanup(os.remove, f.name)
+        profiler = LoopProfiler()
+        io = IOFromFile(f.name)
+        drive(io, track, driver=Driver(track, verbose=False, profiler=profiler))
+        io.close()
+        report = profiler.report()
+        self.assertEqual(report['nearest_segment']['count'], 18)
+        self.assertEqual(report['total']['count'], 18)
+        self.assertIn('control', report)
+        self.assertIn('command', report)
+        self.assertGreater(report['total']['max'], 0)
+        # recorded packets have SimCounter always 0
+        self.assertIn('sim cycles missed=0 duplicate=18', profiler.format_report())
+
+# vim: expandtab sw=4 ts=4
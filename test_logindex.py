@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+
+from iolog import convert_log, INPUT, OUTPUT
+from logindex import LogReader, build_index, load_index, INDEX_EXT
+from fixtures import sensors_packet, write_log
+
+
+class LogIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [(OUTPUT, b'start')]
+        for i, lap_time in enumerate([0.0, 1.0, 2.0, 0.5, 1.5, 0.5]):
+            self.records.append((INPUT, sensors_packet(lap_time, i, 0)))
+            self.records.append((OUTPUT, b'cmd%d' % i))
+        with tempfile.NamedTemporaryFile(suffix='.log', delete=False) as f:
+            write_log(f, self.records)
+        self.filename = f.name
+
+    def tearDown(self):
+        for filename in [self.filename, self.filename + INDEX_EXT]:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def test_build_index(self):
+        index = build_index(self.filename)
+        self.assertTrue(os.path.exists(self.filename + INDEX_EXT))
+        self.assertEqual(len(index), 13)
+        self.assertEqual(list(index['time'][:5]), [0.0, 0.0, 0.0, 1.0, 1.0])
+        self.assertEqual(list(index['lap'][-4:]), [1, 1, 2, 2])
+        self.assertEqual(list(load_index(self.filename)), list(index))
+
+    def test_log_reader(self):
+        with LogReader(self.filename) as log:
+            self.assertEqual(len(log), len(self.records))
+            self.assertEqual(log.packet(12), self.records[12])
+            n = log.seek_time(2.5)
+            self.assertEqual(n, 7)
+            self.assertEqual(log.packet(n), self.records[7])
+            self.assertEqual(log.seek_lap(1), 7)
+            self.assertEqual(list(log.packets(log.seek_lap(2))), self.records[11:])
+
+    def test_compressed_log_reader(self):
+        convert_log(self.filename, self.filename + '.v2', block_size=1000)
+        try:
+            with LogReader(self.filename + '.v2') as log:
+                self.assertEqual(len(log.blocks), 4)
+                self.assertEqual([log.packet(n) for n in range(len(log))],
+                                 self.records)
+                self.assertEqual(log.packet(log.seek_time(2.5)), self.records[7])
+        finally:
+            os.remove(self.filename + '.v2')
+            os.remove(self.filename + '.v2' + INDEX_EXT)
+
+    def test_stale_index(self):
+        build_index(self.filename)
+        with open(self.filename, 'wb') as f:
+            write_log(f, self.records[:3])
+        self.assertEqual(len(load_index(self.filename)), 3)
+
+    def test_rewritten_log(self):
+        build_index(self.filename)
+        stat = os.stat(self.filename)
+        # the same size and modification time, different records
+        records = list(self.records)
+        records[0] = (OUTPUT, b'go')
+        records[2] = (OUTPUT, b'cmd0abc')
+        with open(self.filename, 'wb') as f:
+            write_log(f, records)
+        os.utime(self.filename, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(os.path.getsize(self.filename), stat.st_size)
+        with LogReader(self.filename) as log:
+            self.assertEqual([log.packet(n) for n in range(len(log))], records)
+
+# vim: expandtab sw=4 ts=4
@@ -0,0 +1,69 @@
+import unittest
+
+import numpy as np
+
+from fixtures import square_track, v2x_packet
+from opponents import Opponents, AI_CAR, STATIC_OBJECT
+
+
+class OpponentsTest(unittest.TestCase):
+
+    def test_from_packet(self):
+        packet = v2x_packet([(AI_CAR, 10.0, 2.0, 30.0, 0.5),
+                             (STATIC_OBJECT, -5.0, 1.0, 0.0, 0.0)])
+        opponents = Opponents.from_packet(packet)
+        self.assertEqual(len(opponents), 2)
+        self.assertEqual(opponents.type.tolist(), [AI_CAR, STATIC_OBJECT])
+        self.assertEqual(opponents.x.tolist(), [10.0, -5.0])
+        self.assertAlmostEqual(opponents.yaw[0], 0.5, 6)
+        self.assertEqual(len(Opponents.from_packet(v2x_packet([]))), 0)
+
+    def test_within(self):
+        opponents = Opponents.from_packet(v2x_packet([
+                (AI_CAR, 30.0, 0.0, 0.0, 0.0),
+                (AI_CAR, 3.0, 4.0, 0.0, 0.0),
+                (AI_CAR, 10.0, 0.0, 0.0, 0.0)]))
+        indices, dist = opponents.within(0.0, 0.0, 20.0)
+        self.assertEqual(indices.tolist(), [1, 2])
+        self.assertEqual(dist.tolist(), [5.0, 10.0])
+        self.assertEqual(opponents.take(indices).x.tolist(), [3.0, 10.0])
+
+    def test_track_coordinates(self):
+        track = square_track()
+        rng = np.random.RandomState(19)
+        x = rng.uniform(-50, 200, 200)
+        y = rng.uniform(-50, 200, 200)
+        station, offset, index = track.track_coordinates(x, y)
+        dist, heading, ref_index = track.get_offsets(np.column_stack(
+                [x, y, np.zeros(len(x))]))
+        self.assertEqual(index.tolist(), ref_index.tolist())
+        np.testing.assert_allclose(offset, dist)
+        for i in np.flatnonzero(index >= 0)[:20]:
+            self.assertAlmostEqual(station[i], track.pose_to_station((x[i], y[i], 0.0)))
+
+    def test_ahead(self):
+        track = square_track()
+        # car at station 90, opponents at 110 (in turn), 95, 50 (behind)
+        # and one just after the finish line reached by wrap around
+        turn_pose = track.station_to_pose(110.0)
+        opponents = Opponents.from_packet(v2x_packet([
+                (AI_CAR, turn_pose[0], turn_pose[1], 0.0, 0.0),
+                (AI_CAR, 95.0, -2.0, 0.0, 0.0),
+                (AI_CAR, 50.0, 0.0, 0.0, 0.0),
+                (AI_CAR, 95.0, 30.0, 0.0, 0.0),  # off track
+                (AI_CAR, 5.0, 1.0, 0.0, 0.0)]))
+        indices, gap, offset = opponents.ahead(track, 90.0, 50.0)
+        self.assertEqual(indices.tolist(), [1, 0])
+        self.assertAlmostEqual(gap[0], 5.0, 5)
+        self.assertAlmostEqual(gap[1], 20.0, 4)
+        self.assertAlmostEqual(offset[0], -2.0, 5)
+
+        station = track.length - 10.0
+        indices, gap, offset = opponents.ahead(track, station, 20.0)
+        self.assertEqual(indices.tolist(), [4])
+        self.assertAlmostEqual(gap[0], 15.0, 4)
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: expandtab sw=4 ts=4
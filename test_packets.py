@@ -1,7 +1,12 @@
 import unittest
-import math
+import os
+import struct
+import tempfile
 
-from packets import Command
+from fixtures import sensors_packet, write_log
+from iolog import INPUT, OUTPUT
+from packets import (Command, Sensors, sensors_array, load_log, race_time,
+                     SENSORS_DTYPE)
 
 class PacketsTest(unittest.TestCase):
 
@@ -10,4 +15,68 @@ class PacketsTest(unittest.TestCase):
         cmd = Command.from_packet(packet)
         self.assertAlmostEqual(cmd.acc, 0.2)
 
+    def test_sensors_array(self):
+        packet = bytearray(794)
+        struct.pack_into('fff', packet, 0, 12.5, 100.0, 81.25)
+        struct.pack_into('fff', packet, 44, 1.0, 2.0, 3.0)
+        struct.pack_into('fff', packet, 80, 3.0, 4.0, 0.0)
+        struct.pack_into('fff', packet, 116, 2000.0, 2100.0, 0.0)
+        struct.pack_into('BB', packet, 128, 2, 1)
+        struct.pack_into('f', packet, 168 + 4, 55.5)
+        struct.pack_into('f', packet, 636 + 38*4, -1.5)
+        struct.pack_into('BB', packet, 792, 3, 17)
+        packet = bytes(packet)
+        self.assertEqual(SENSORS_DTYPE.itemsize, 794)
+
+        arr = sensors_array(packet)
+        self.assertEqual(arr.shape, (1,))
+        self.assertEqual(arr['lap_time'][0], 12.5)
+        self.assertEqual(arr['last_lap_time'][0], 81.25)
+        self.assertEqual(arr['abs_pos_y'][0], 2.0)
+        self.assertEqual(arr['wheel_reaction_rr'][0], 2000.0)
+        self.assertEqual(arr['wheel_reaction_rl'][0], 2100.0)
+        self.assertEqual(arr['v2x_n'][0], 2)
+        self.assertEqual(arr['v2x_type'][0][0], 1)
+        self.assertEqual(arr['v2x_x_pos'][0][1], 55.5)
+        self.assertEqual(arr['v2x_yaw'][0][38], -1.5)
+        self.assertEqual(arr['sim_status'][0], 3)
+        self.assertEqual(arr['sim_counter'][0], 17)
+
+        sensors = Sensors.from_packet(packet)
+        self.assertEqual(sensors.time, arr['lap_time'][0])
+        self.assertEqual(sensors.pos3d, (1.0, 2.0, 3.0))
+
+        arr = sensors_array(packet * 3)
+        self.assertEqual(arr.shape, (3,))
+        self.assertEqual(list(arr['abs_vel_y']), [4.0, 4.0, 4.0])
+
+    def test_race_time(self):
+        time, lap = race_time([0.0, 1.0, 2.0, 0.5, 1.5, 0.25])
+        self.assertEqual(list(time), [0.0, 1.0, 2.0, 2.5, 3.5, 3.75])
+        self.assertEqual(list(lap), [0, 0, 0, 1, 1, 2])
+
+    def test_load_log(self):
+        cmd = struct.pack('fffiBB', 0.5, 0.2, 0.0, 1, 11, 7)
+        records = []
+        for i, lap_time in enumerate([0.0, 1.0, 2.0, 0.5, 1.5]):
+            records.append((OUTPUT, cmd))
+            records.append((INPUT, sensors_packet(lap_time, i, -i)))
+        records.append((INPUT, sensors_packet(2.5, 5, -5, sim_status=Sensors.SIMULATION_STOPPED)))
+        with tempfile.NamedTemporaryFile(suffix='.log', delete=False) as f:
+            write_log(f, records)
+        try:
+            log = load_log(f.name)
+        finally:
+            os.remove(f.name)
+        self.assertEqual(len(log.index), 11)
+        self.assertEqual(len(log.sensors), 6)
+        self.assertEqual(list(log.sensors_record), [1, 3, 5, 7, 9, 10])
+        self.assertEqual(list(log.sensors['abs_pos_y']), [0, -1, -2, -3, -4, -5])
+        self.assertEqual(len(log.commands), 5)
+        self.assertEqual(log.commands['ctr'][0], 7)
+        self.assertAlmostEqual(log.commands['acc'][4], 0.2)
+        self.assertEqual(len(log.running()), 5)
+        self.assertEqual(list(log.between(1.0, 3.0)['abs_pos_x']), [1, 2, 3])
+        self.assertEqual(list(log.lap), [0, 0, 0, 1, 1, 1])
+
 # vim: expandtab sw=4 ts=4
@@ -0,0 +1,39 @@
+import math
+import unittest
+
+import numpy as np
+
+from planner import speed_profile, SpeedPlanner, GRAVITY
+from segment import Segment
+from track import Track
+
+
+class PlannerTest(unittest.TestCase):
+
+    def test_speed_profile(self):
+        curvature = [0.0]*100 + [0.01]*20 + [0.0]*100
+        speed = speed_profile(curvature, 1.0, max_lat_acc=4.0, max_acc=2.0,
+                              max_dec=5.0, max_speed=40.0, closed=False)
+        self.assertAlmostEqual(speed[110], 20.0)
+        self.assertAlmostEqual(speed[0], math.sqrt(20.0**2 + 2*5.0*100))
+        self.assertAlmostEqual(speed[99], math.sqrt(20.0**2 + 2*5.0))
+        self.assertAlmostEqual(speed[120], math.sqrt(20.0**2 + 2*2.0))
+        self.assertTrue(np.all(np.diff(speed[100:]) >= 0))
+
+        # the end of closed loop brakes for the start
+        speed = speed_profile([0.01] + [0.0]*100, 1.0, max_lat_acc=4.0, max_acc=2.0,
+                              max_dec=5.0, max_speed=40.0)
+        self.assertAlmostEqual(speed[-1], math.sqrt(20.0**2 + 2*5.0))
+
+    def test_speed_planner(self):
+        line = Segment(length=200.0)
+        arc = Segment(arc=math.radians(180), radius=50.0)
+        track = Track([line, arc]*2, width=20)
+        planner = SpeedPlanner(track, friction=1.0)
+        self.assertAlmostEqual(planner.target_speed(250.0), math.sqrt(GRAVITY*50.0))
+        self.assertGreater(planner.target_speed(100.0), planner.target_speed(250.0))
+        self.assertEqual(planner.target_speed(track.length + 100.0),
+                         planner.target_speed(100.0))
+        self.assertEqual(len(planner.speed_ahead(track.length - 1.0, 3.0)), 3)
+
+# vim: expandtab sw=4 ts=4
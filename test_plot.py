@@ -1,8 +1,16 @@
 import math
+import os
+import shutil
 import tempfile
 import unittest
 
-from plot import draw
+import numpy as np
+
+from matplotlib.colors import colorConverter
+
+from fixtures import center_line_log
+from plot import (draw, rdp, minmax_decimate, decimate, load_trajectory,
+                  Trajectory, COLOURS)
 from segment import Segment
 from track import Track
 
@@ -18,4 +26,74 @@ class PlotTest(unittest.TestCase):
         with tempfile.TemporaryFile() as f:
             fig.savefig(f, format='png')
 
+    def test_rdp(self):
+        x = np.arange(11, dtype=np.float64)
+        y = np.zeros(11)
+        y[5] = 1.0
+        self.assertEqual(rdp(x, y, 0.5).tolist(), [0, 4, 5, 6, 10])
+        self.assertEqual(rdp(x, y, 2.0).tolist(), [0, 10])
+        self.assertEqual(rdp(x[:2], y[:2], 1.0).tolist(), [0, 1])
+
+        # every removed point is within tolerance of the simplified line
+        angle = np.linspace(0, 2*math.pi, 1000)
+        x, y = 100*np.cos(angle), 100*np.sin(angle)
+        kept = rdp(x, y, 0.1)
+        self.assertLess(len(kept), 200)
+        for first, last in zip(kept[:-1], kept[1:]):
+            mid = (first + last) // 2
+            dx, dy = x[last] - x[first], y[last] - y[first]
+            dist = abs(dx*(y[mid] - y[first]) - dy*(x[mid] - x[first])) / math.hypot(dx, dy)
+            self.assertLessEqual(dist, 0.1)
+
+    def test_minmax_decimate(self):
+        x = np.arange(1000, dtype=np.float64)
+        y = np.zeros(1000)
+        y[123] = 5.0
+        y[456] = -5.0
+        kept = minmax_decimate(x, y, 10)
+        self.assertIn(123, kept)
+        self.assertIn(456, kept)
+        self.assertIn(0, kept)
+        self.assertIn(999, kept)
+        self.assertLessEqual(len(kept), 40)
+        self.assertEqual(minmax_decimate(x[:20], y[:20], 10).tolist(), list(range(20)))
+        self.assertIn(123, decimate(x, y, 50.0, method='minmax'))
+
+    def test_trajectory(self):
+        line = Segment(length=100.0)
+        arc = Segment(arc=math.radians(90), radius=50.0)
+        track = Track([line, arc]*4, width=20)
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp_dir, 'test.log')
+            center_line_log(filename, track, 2000)
+            x, y, values = load_trajectory(filename, track, 'offset')
+            self.assertLess(len(x), 200)
+            self.assertLess(np.nanmax(np.abs(values)), 1e-3)
+            x, y, values = load_trajectory(filename, track, 'speed')
+            self.assertAlmostEqual(values[0], 25.0, 4)
+
+            fig = draw(track)
+            ax = fig.axes[0]
+            trajectory = Trajectory(ax, x, y, values)
+            full = len(trajectory.collection.get_segments())
+            self.assertGreater(full, 0)
+            ax.set_xlim(-10, 50)
+            ax.set_ylim(-10, 10)
+            self.assertLess(len(trajectory.collection.get_segments()), full)
+            self.assertEqual(len(trajectory.collection.get_array()),
+                             len(trajectory.collection.get_segments()))
+            with tempfile.TemporaryFile() as f:
+                fig.savefig(f, format='png')
+
+            # plain trajectories cycle the colours
+            first = Trajectory(ax, x, y)
+            second = Trajectory(ax, x, y)
+            self.assertEqual(first.collection.get_colors().tolist(),
+                             [list(colorConverter.to_rgba(COLOURS[1]))])
+            self.assertEqual(second.collection.get_colors().tolist(),
+                             [list(colorConverter.to_rgba(COLOURS[2]))])
+        finally:
+            shutil.rmtree(tmp_dir)
+
 # vim: expandtab sw=4 ts=4
@@ -0,0 +1,84 @@
+import math
+import os
+import tempfile
+import unittest
+
+from demo import Driver
+from fixtures import sensors_packet, write_log
+from iolog import INPUT, OUTPUT
+from replay import replay, replay_many
+from segment import Segment
+from test_track import LOOP_XML
+from track import Track
+
+
+def record_log(f, track, count, lost=()):
+    """Write log of Driver following the first straight"""
+    driver = Driver(track, verbose=False)
+    records = []
+    for i in range(count):
+        records.append((OUTPUT, bytes(driver.command())))
+        if i in lost:
+            continue  # packet lost -> timeout
+        packet = sensors_packet(i * 0.02, i, 0.5 + 0.1*i,
+                                sim_status=5 if i == count - 1 else 3)
+        records.append((INPUT, packet))
+        driver.update(packet)
+    write_log(f, records)
+    return records
+
+
+class ReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.track = Track.from_xml_file(self.write_file('.xml', LOOP_XML.encode()))
+
+    def write_file(self, suffix, data=None):
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+            if data is not None:
+                f.write(data)
+        self.addCleanup(os.remove, f.name)
+        return f.name
+
+    def test_replay(self):
+        filename = self.write_file('.log')
+        with open(filename, 'wb') as f:
+            records = record_log(f, self.track, 20, lost=[5, 6])
+        result = replay(filename, Driver(self.track, verbose=False))
+        self.assertEqual(result.packets, len(records))
+        self.assertEqual(result.divergences, [])
+        self.assertEqual(len(result.compute_ns), 18)
+        self.assertEqual(result.summary()['divergences'], 0)
+
+    def test_replay_divergences(self):
+        filename = self.write_file('.log')
+        with open(filename, 'wb') as f:
+            records = record_log(f, Track([Segment(length=100.0)], width=20.0), 10)
+        result = replay(filename, Driver(self.track, verbose=False))
+        # the same straight start, but different track width -> no difference
+        self.assertEqual(result.divergences, [])
+
+        with open(filename, 'wb') as f:
+            records = record_log(f, Track([Segment(arc=math.radians(90), radius=30.0)],
+                                               width=20.0), 10)
+        result = replay(filename, Driver(self.track, verbose=False))
+        self.assertEqual(result.packets, 20)
+        self.assertGreater(len(result.divergences), 1)
+        n, logged, command = result.divergences[0]
+        self.assertEqual(records[n], (OUTPUT, logged))
+        self.assertEqual(result.summary()['first_divergence'], n)
+
+    def test_replay_many(self):
+        track_filename = self.write_file('.xml', LOOP_XML.encode())
+        filenames = []
+        for i in range(3):
+            filename = self.write_file('.log')
+            with open(filename, 'wb') as f:
+                record_log(f, self.track, 10 + i)
+            filenames.append(filename)
+        summaries = replay_many(track_filename, filenames, processes=2)
+        self.assertEqual([s['filename'] for s in summaries], filenames)
+        self.assertEqual([s['packets'] for s in summaries], [20, 22, 24])
+        self.assertEqual([s['divergences'] for s in summaries], [0, 0, 0])
+
+# vim: expandtab sw=4 ts=4
@@ -2,7 +2,10 @@ import unittest
 import math
 from xml.dom.minidom import parseString
 
-from segment import Segment
+import numpy as np
+
+from segment import Segment, normalize_angle, normalize_angles, subdivide
+from track import track2xy, track_length
 
 class SegmentTest(unittest.TestCase):
 
@@ -38,6 +41,14 @@ class SegmentTest(unittest.TestCase):
         for a, b in zip(s1.step(), s2.step()):
             self.assertAlmostEqual(a, b)
 
+    def test_step_cache(self):
+        s = Segment(length=10.0)
+        self.assertIsNone(s._delta)
+        self.assertEqual(s.step(), (10.0, 0.0, 0.0))
+        self.assertEqual(s._delta, (10.0, 0.0, 0.0))
+        with self.assertRaises(AttributeError):
+            s.color = 'red'
+
     def test_corkscrew_s10_step(self):
         s = Segment(arc=math.radians(-27.0), radius=105.7, end_radius=422.8)
         x, y, heading = s.step()
@@ -45,6 +56,50 @@ class SegmentTest(unittest.TestCase):
         self.assertAlmostEqual(y, 271.0175584268419)  # this is wrong
         self.assertAlmostEqual(heading, math.radians(-27.0))
 
+    def test_profil_steps(self):
+        for arc, radius, end_radius in [(90, 50.0, 70.0), (-27.0, 105.7, 422.8),
+                                        (120, 20.0, 80.0), (-200, 30.0, 40.0)]:
+            for profil_steps_length in [4.0, 1.0]:
+                s = Segment(arc=math.radians(arc), radius=radius, end_radius=end_radius,
+                            profil_steps_length=profil_steps_length)
+                parts = subdivide(s, profil_steps_length)
+                # the same end pose and length as the Speed Dreams subdivision
+                for a, b in zip(s.step(), track2xy(parts)):
+                    self.assertAlmostEqual(a, b, 9)
+                self.assertAlmostEqual(s.get_length(), track_length(parts)[1], 9)
+                self.assertAlmostEqual(s.curvature_at(0.0), math.copysign(1/radius, arc))
+                for a, b in zip(s.pose_at(s.get_length()), s.step()):
+                    self.assertAlmostEqual(a, b)
+
+                xmin, ymin, xmax, ymax = s.bbox()
+                stations = np.linspace(0.0, s.get_length(), 50)
+                xs, ys, headings, curvatures = s.sample_steps(stations)
+                for station, x, y, heading, curvature in zip(stations, xs, ys, headings,
+                                                             curvatures):
+                    for a, b in zip(s.pose_at(station), (x, y, heading)):
+                        self.assertAlmostEqual(a, b)
+                    self.assertAlmostEqual(s.curvature_at(station), curvature)
+                    self.assertTrue(xmin - 1e-9 <= x <= xmax + 1e-9)
+                    self.assertTrue(ymin - 1e-9 <= y <= ymax + 1e-9)
+                    # 2 meters to the left of the center line
+                    dist, st, h = s.project(x - 2.0*math.sin(heading),
+                                            y + 2.0*math.cos(heading))
+                    self.assertAlmostEqual(dist, 2.0)
+                    self.assertAlmostEqual(st, station)
+                    self.assertAlmostEqual(h, heading)
+
+                xs, ys = np.meshgrid(np.linspace(xmin - 10, xmax + 10, 7),
+                                     np.linspace(ymin - 10, ymax + 10, 7))
+                for a, b in zip(s.projects(xs, ys), np.array(
+                        [s.project(x, y) for x, y in zip(xs.flat, ys.flat)]).T):
+                    self.assertTrue(np.allclose(a.flat, b))
+
+        # single step turn is the spiral
+        s = Segment(arc=math.radians(90.0), radius=5.0, end_radius=6.0,
+                    profil_steps_length=100.0)
+        self.assertIsNone(s.profil_steps())
+        self.assertAlmostEqual(s.step()[0], 6.0)
+
     def test_line_offset(self):
         line = Segment(length=30.0)
         self.assertEqual(line.get_offset((3.0, 4.0, 0)), (4.0, 0))
@@ -73,6 +128,75 @@ class SegmentTest(unittest.TestCase):
         self.assertEqual(arc.get_offset((0, 0, 0)), (0, 0))
         self.assertEqual(arc.get_offset((20, -10, math.radians(-90))), (0, 0))
 
+    def test_segment_bbox(self):
+        s = Segment(arc=math.radians(90), radius=10.0)
+        for a, b in zip(s.bbox(), (0, 0, 10, 10)):
+            self.assertAlmostEqual(a, b)
+
+        s = Segment(arc=math.radians(-180), radius=10.0)
+        for a, b in zip(s.bbox(), (0, -20, 10, 0)):
+            self.assertAlmostEqual(a, b)
+
+    def test_get_offsets(self):
+        xs, ys = np.meshgrid(np.linspace(-30, 30, 41), np.linspace(-30, 30, 41))
+        xs, ys = xs.ravel(), ys.ravel()
+        headings = np.linspace(-10, 10, len(xs))
+        for s in [Segment(length=30.0),
+                  Segment(arc=math.radians(90), radius=10.0),
+                  Segment(arc=math.radians(-120), radius=10.0),
+                  Segment(arc=math.radians(90), radius=10.0, end_radius=20.0),
+                  Segment(arc=math.radians(-90), radius=10.0, end_radius=5.0)]:
+            dist, diff_heading = s.get_offsets(xs, ys, headings)
+            for x, y, h, d, dh in zip(xs, ys, headings, dist, diff_heading):
+                ref_dist, ref_heading = s.get_offset((x, y, h))
+                if ref_dist is None:
+                    self.assertTrue(np.isnan(d))
+                    self.assertTrue(np.isnan(dh))
+                else:
+                    self.assertAlmostEqual(d, ref_dist)
+                    self.assertAlmostEqual(dh, ref_heading)
+
+    def test_project(self):
+        xs, ys = np.meshgrid(np.linspace(-30, 30, 21), np.linspace(-30, 30, 21))
+        xs, ys = xs.ravel(), ys.ravel()
+        for s in [Segment(length=30.0),
+                  Segment(arc=math.radians(-120), radius=10.0),
+                  Segment(arc=math.radians(90), radius=10.0, end_radius=20.0)]:
+            dist, station, heading = s.projects(xs, ys)
+            for x, y, d, st, h in zip(xs, ys, dist, station, heading):
+                for a, b in zip(s.project(x, y), (d, st, h)):
+                    self.assertAlmostEqual(a, b)
+        arc = Segment(arc=math.radians(90), radius=10.0)
+        for a, b in zip(arc.project(10, 0), (10 - math.sqrt(2)*10, 10*math.pi/4, math.pi/4)):
+            self.assertAlmostEqual(a, b)
+        self.assertLess(arc.project(-1, 0)[1], 0.0)
+        self.assertGreater(arc.project(11, 11)[1], arc.get_length())
+
+    def test_normalize_angles(self):
+        angles = [0.0, math.pi, -math.pi, 3.5, -3.5, 100.0, -100.0, 7.5*math.pi]
+        for a, b in zip(normalize_angles(angles), angles):
+            self.assertAlmostEqual(a, normalize_angle(b))
+
+    def test_station(self):
+        for s in [Segment(length=30.0),
+                  Segment(arc=math.radians(90), radius=10.0),
+                  Segment(arc=math.radians(-120), radius=10.0),
+                  Segment(arc=math.radians(90), radius=10.0, end_radius=20.0),
+                  Segment(arc=math.radians(-90), radius=10.0, end_radius=5.0)]:
+            for a, b in zip(s.pose_at(s.get_length()), s.step()):
+                self.assertAlmostEqual(a, b)
+            for i in range(11):
+                station = s.get_length() * i / 10.0
+                pose = s.pose_at(station)
+                self.assertAlmostEqual(s.get_offset(pose)[0], 0.0)
+                self.assertAlmostEqual(s.get_offset(pose)[1], 0.0)
+                self.assertAlmostEqual(s.get_station(pose), station)
+        s = Segment(length=30.0)
+        self.assertEqual(s.get_station((-3, 1, 0)), 0.0)
+        self.assertEqual(s.get_station((33, 1, 0)), 30.0)
+        s = Segment(arc=math.radians(90), radius=10.0)
+        self.assertAlmostEqual(s.get_station((10, 0, 0)), 10*math.pi/4)
+
     def test_segment_str(self):
         s = Segment(name='s11', length=10)
         self.assertEqual(str(s), "Segment('s11', 10, None, None)")
@@ -1,8 +1,126 @@
 import unittest
 import math
+import os
+import shutil
+import tempfile
+
+import numpy as np
 
 from segment import Segment
-from track import Track
+from track import (Track, TrackLocalizer, TrackPolyline,
+                   check_track, check_tracks,
+                   track_length, track2xy,
+                   STRAIGHT, TURN, VARIABLE_TURN)
+
+TRACK_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE params SYSTEM "../../../../src/libs/tgf/params.dtd" [
+<!-- general definitions for tracks -->
+<!ENTITY default-surfaces SYSTEM "../../../data/tracks/surfaces.xml">
+]>
+<params name="test" type="param" mode="mw">
+  &default-surfaces;
+  <section name="Header">
+    <attstr name="name" val="test"/>
+  </section>
+  <section name="Main Track">
+    <attnum name="width" unit="m" val="12.0"/>
+    <attnum name="profil steps length" unit="m" val="8.0"/>
+    <section name="Track Segments">
+      <section name="s1">
+        <attstr name="type" val="str"/>
+        <attnum name="lg" unit="m" val="100.0"/>
+        <section name="Left Border">
+          <attnum name="width" unit="m" val="1.0"/>
+          <attnum name="lg" unit="m" val="5.0"/>
+        </section>
+      </section>
+      <section name="t1">
+        <attstr name="type" val="lft"/>
+        <attnum name="arc" unit="deg" val="90.0"/>
+        <attnum name="radius" unit="m" val="50.0"/>
+        <attnum name="end radius" unit="m" val="70.0"/>
+      </section>
+      <section name="t2">
+        <attstr name="type" val="rgt"/>
+        <attnum name="arc" unit="deg" val="45.0"/>
+        <attnum name="radius" unit="m" val="30.0"/>
+        <attnum name="end radius" unit="m" val="20.0"/>
+        <attnum name="profil steps length" unit="m" val="4.0"/>
+      </section>
+      <section name="t3">
+        <attstr name="type" val="lft"/>
+        <attnum name="arc" unit="deg" val="10.0"/>
+        <attnum name="radius" unit="m" val="10.0"/>
+        <attnum name="end radius" unit="m" val="11.0"/>
+      </section>
+      <section name="s2">
+        <attstr name="type" val="str"/>
+        <attnum name="lg" unit="m" val="20.0"/>
+      </section>
+    </section>
+  </section>
+  <section name="Graphic">
+    <attnum name="width" unit="m" val="99.0"/>
+  </section>
+</params>
+"""
+
+LOOP_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<params name="loop" type="param">
+  <section name="Main Track">
+    <attnum name="width" unit="m" val="20.0"/>
+    <attnum name="profil steps length" unit="m" val="4.0"/>
+    <section name="Track Segments">
+      <section name="s1">
+        <attstr name="type" val="str"/>
+        <attnum name="lg" unit="m" val="100.0"/>
+      </section>
+      <section name="t1">
+        <attstr name="type" val="lft"/>
+        <attnum name="arc" unit="deg" val="180.0"/>
+        <attnum name="radius" unit="m" val="50.0"/>
+      </section>
+      <section name="s2">
+        <attstr name="type" val="str"/>
+        <attnum name="lg" unit="m" val="100.0"/>
+      </section>
+      <section name="t2">
+        <attstr name="type" val="lft"/>
+        <attnum name="arc" unit="deg" val="180.0"/>
+        <attnum name="radius" unit="m" val="50.0"/>
+      </section>
+    </section>
+  </section>
+</params>
+"""
+
+# U-turns of two variable radius turns, closed loop for any turn shape
+SPIRAL_LOOP_XML = LOOP_XML.replace("""
+        <attnum name="arc" unit="deg" val="180.0"/>
+        <attnum name="radius" unit="m" val="50.0"/>
+      </section>""", """
+        <attnum name="arc" unit="deg" val="90.0"/>
+        <attnum name="radius" unit="m" val="40.0"/>
+        <attnum name="end radius" unit="m" val="60.0"/>
+      </section>
+      <section name="u">
+        <attstr name="type" val="lft"/>
+        <attnum name="arc" unit="deg" val="90.0"/>
+        <attnum name="radius" unit="m" val="60.0"/>
+        <attnum name="end radius" unit="m" val="40.0"/>
+      </section>""")
+
+
+def bisect_station(track, station):
+    i = 0
+    while i + 1 < len(track.stations) and track.stations[i + 1] <= station:
+        i += 1
+    return i
+
+
+def segment_values(track):
+    return [(s.name, s.length, s.arc, s.radius, s.end_radius, s.profil_steps_length)
+            for s in track.segments]
 
 class TrackTest(unittest.TestCase):
 
@@ -34,4 +152,282 @@ class TrackTest(unittest.TestCase):
         self.assertIsNone(segment.arc)
         self.assertAlmostEqual(rel_pose[2], 0.0)
 
+    def test_nearest_segment_index(self):
+        line = Segment(length=100.0)
+        arc = Segment(arc=math.radians(90), radius=50.0)
+        spiral = Segment(arc=math.radians(-90), radius=30.0, end_radius=60.0)
+        turn = Segment(arc=math.radians(-200), radius=20.0)
+
+        for track in [Track([line, arc]*4, width=20),
+                      Track([line, spiral, arc, turn, line], width=10),
+                      Track([line, arc]*4, width=None)]:
+            for x in range(-250, 300, 7):
+                for y in range(-250, 300, 7):
+                    pose = (x + 0.5, y + 0.25, 0.1)
+                    self.assertEqual(track.nearest_segment(pose),
+                                     track.nearest_segment_scan(pose))
+
+    def test_get_offsets(self):
+        line = Segment(length=100.0)
+        arc = Segment(arc=math.radians(90), radius=50.0)
+        spiral = Segment(arc=math.radians(-90), radius=30.0, end_radius=60.0)
+        turn = Segment(arc=math.radians(-200), radius=20.0)
+        track = Track([line, spiral, arc, turn, line, arc], width=10)
+
+        poses = [(x + 0.5, y + 0.25, 0.01 * (x - y))
+                 for x in range(-250, 300, 7) for y in range(-250, 300, 7)]
+        dist, diff_heading, index = track.get_offsets(poses)
+        self.assertEqual(len(index), len(poses))
+        for pose, d, h, i in zip(poses, dist, diff_heading, index):
+            segment, rel_pose = track.nearest_segment(pose)
+            if segment is None:
+                self.assertEqual(i, -1)
+                self.assertTrue(np.isnan(d))
+                continue
+            ref_dist, ref_heading = segment.get_offset(rel_pose)
+            self.assertIs(track.segments[i], segment)
+            self.assertAlmostEqual(d, ref_dist)
+            self.assertAlmostEqual(h, ref_heading)
+
+    def test_from_xml_file(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp_dir, 'test.xml')
+            with open(filename, 'w') as f:
+                f.write(TRACK_XML)
+            ref = Track.from_xml_file(filename, parser='minidom')
+            self.assertEqual(ref.width, 12.0)
+            self.assertEqual(len(ref.segments), 1 + 12 + 5 + 1 + 1)
+
+            track = Track.from_xml_file(filename)
+            self.assertEqual(track.width, ref.width)
+            self.assertEqual(segment_values(track), segment_values(ref))
+
+            cache_dir = os.path.join(tmp_dir, 'cache')
+            track = Track.from_xml_file(filename, cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            self.assertEqual(segment_values(track), segment_values(ref))
+            track = Track.from_xml_file(filename, cache_dir=cache_dir)
+            self.assertEqual(track.width, ref.width)
+            self.assertEqual(segment_values(track), segment_values(ref))
+            self.assertEqual(track.start_poses, ref.start_poses)
+
+            # modified file -> new cache entry
+            with open(filename, 'w') as f:
+                f.write(TRACK_XML.replace('val="12.0"', 'val="14.0"'))
+            track = Track.from_xml_file(filename, cache_dir=cache_dir)
+            self.assertEqual(track.width, 14.0)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+            # one segment per section, cached separately
+            track = Track.from_xml_file(filename, cache_dir=cache_dir,
+                                        subdivide_turns=False)
+            self.assertEqual([s.name for s in track.segments],
+                             ['s1', 't1', 't2', 't3', 's2'])
+            self.assertEqual(len(os.listdir(cache_dir)), 3)
+            self.assertEqual(segment_values(track),
+                             segment_values(Track.from_xml_file(filename,
+                                                                subdivide_turns=False)))
+            for i in range(50):
+                station = track.length * i / 50.0
+                pose = track.station_to_pose(station)
+                self.assertAlmostEqual(track.pose_to_station(pose), station)
+                segment, rel_pose = track.nearest_segment(pose)
+                self.assertAlmostEqual(segment.get_offset(rel_pose)[0], 0.0)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_check_tracks(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(tmp_dir, 'road'))
+            for name, data in [('road/open.xml', TRACK_XML),
+                               ('road/broken.xml', '<params>'),
+                               ('loop.xml', LOOP_XML),
+                               ('readme.txt', 'not a track')]:
+                with open(os.path.join(tmp_dir, name), 'w') as f:
+                    f.write(data)
+            reports = check_tracks(tmp_dir, processes=2)
+        finally:
+            shutil.rmtree(tmp_dir)
+        reports = dict((os.path.basename(r['filename']), r) for r in reports)
+        self.assertEqual(sorted(reports.keys()), ['broken.xml', 'loop.xml', 'open.xml'])
+        self.assertTrue(reports['loop.xml']['ok'])
+        self.assertAlmostEqual(reports['loop.xml']['length'], 200 + 2*math.pi*50)
+        self.assertAlmostEqual(reports['loop.xml']['arc_deg'], 360.0)
+        self.assertFalse(reports['open.xml']['ok'])
+        self.assertGreater(reports['open.xml']['closure_error'], 0.5)
+        self.assertIn('not closed', reports['open.xml']['error'])
+        self.assertFalse(reports['broken.xml']['ok'])
+        self.assertIn('ParseError', reports['broken.xml']['error'])
+
+    def test_check_spiral_track(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp_dir, 'spiral.xml')
+            with open(filename, 'w') as f:
+                f.write(SPIRAL_LOOP_XML)
+            subdivided = check_track(filename)
+            native = check_track(filename, subdivide_turns=False)
+            reports = check_tracks(tmp_dir, processes=1, subdivide_turns=False)
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.assertTrue(subdivided['ok'], subdivided)
+        self.assertTrue(native['ok'], native)
+        self.assertEqual(native['segments'], 6)
+        self.assertLess(native['closure_error'], 1e-9)
+        self.assertAlmostEqual(native['arc_deg'], 360.0)
+        # native turns are made of the subdivision steps
+        self.assertAlmostEqual(native['length'], subdivided['length'])
+        self.assertEqual(reports[0]['segments'], 6)
+
+    def test_track_length(self):
+        angle, length = track_length([
+                Segment(length=100.0),
+                Segment(arc=math.radians(-90), radius=10.0),
+                Segment(arc=math.radians(90), radius=10.0, end_radius=20.0)])
+        self.assertAlmostEqual(angle, 0.0)
+        # spiral length integrated numerically, radius grows 20/pi per radian
+        n = 10000
+        spiral = sum(math.hypot(10.0 + 20.0/math.pi * (i + 0.5) * math.pi/2 / n,
+                                20.0/math.pi) for i in range(n)) * math.pi/2 / n
+        self.assertAlmostEqual(length, 100.0 + 5*math.pi + spiral)
+        self.assertGreater(spiral, 7.5*math.pi)  # subdivision approximation
+
+    def test_stations(self):
+        line = Segment(length=100.0)
+        arc = Segment(arc=math.radians(90), radius=50.0)
+        track = Track([line, arc]*4, width=20)
+        self.assertAlmostEqual(track.length, 400 + 100*math.pi)
+        self.assertEqual(track.stations[:3], [0.0, 100.0, 100.0 + 25*math.pi])
+        self.assertEqual(track.pose_to_station((50, 3, 0)), 50.0)
+        self.assertAlmostEqual(track.pose_to_station((150, 150, 0)),
+                               200 + 25*math.pi)
+        self.assertIsNone(Track([line], width=20).pose_to_station((-10, 0, 0)))
+
+        for pose, ref in [(track.station_to_pose(50.0), (50, 0, 0)),
+                          (track.station_to_pose(track.length + 50.0), (50, 0, 0)),
+                          (track.station_to_pose(200 + 25*math.pi), (150, 150, math.pi/2))]:
+            for a, b in zip(pose, ref):
+                self.assertAlmostEqual(a, b)
+
+        spiral = Segment(arc=math.radians(-90), radius=30.0, end_radius=60.0)
+        track = Track([line, spiral, arc, line], width=20)
+        localizer = TrackLocalizer(track)
+        for i in range(100):
+            station = track.length * i / 100.0
+            pose = track.station_to_pose(station)
+            self.assertAlmostEqual(track.pose_to_station(pose), station)
+            self.assertAlmostEqual(localizer.pose_to_station(pose), station)
+            self.assertAlmostEqual(track.get_offset(pose)[0], 0.0)
+
+    def test_segment_table(self):
+        line = Segment(name='s1', length=100.0)
+        arc = Segment(name='t1', arc=math.radians(90), radius=50.0)
+        spiral = Segment(name='t2', arc=math.radians(-90), radius=30.0, end_radius=60.0)
+        track = Track([line, spiral, arc, line, arc], width=20)
+        table = track.table
+        self.assertIs(track.table, table)
+        self.assertEqual(len(table), 5)
+        self.assertEqual(list(table.kind), [STRAIGHT, VARIABLE_TURN, TURN, STRAIGHT, TURN])
+        self.assertEqual(table.station.tolist(), track.stations)
+        self.assertEqual([tuple(p) for p in table.start.tolist()[1:]], track.start_poses[1:])
+
+        self.assertEqual(table.center_length.tolist(),
+                         [s.get_length() for s in track.segments])
+        self.assertTrue(np.isnan(table.arc[0]))
+        self.assertEqual(table.end_radius[1], 60.0)
+
+    def test_curvature(self):
+        line = Segment(length=100.0)
+        arc = Segment(arc=math.radians(-90), radius=50.0)
+        spiral = Segment(arc=math.radians(90), radius=30.0, end_radius=60.0)
+        track = Track([line, arc, spiral, line], width=20)
+        profile = track.curvature_profile(1.0)
+        self.assertIs(track.curvature_profile(1.0), profile)
+        self.assertEqual(len(profile), int(math.ceil(track.length)))
+        self.assertEqual(profile[50], 0.0)
+        self.assertAlmostEqual(profile[110], -1/50.0)
+        for station in [170.0, 200.0, 240.0]:
+            i = bisect_station(track, station)
+            segment = track.segments[i]
+            self.assertAlmostEqual(profile[int(station)],
+                                   segment.curvature_at(station - track.stations[i]))
+        self.assertAlmostEqual(spiral.curvature_at(spiral.get_length()), 1/60.0)
+
+        ahead = track.curvature_ahead(95.0, 10.0)
+        self.assertEqual(len(ahead), 10)
+        self.assertEqual(list(ahead[:5]), [0.0]*5)
+        self.assertAlmostEqual(ahead[5], -1/50.0)
+        ahead = track.curvature_ahead((track.length - 2.0, 0, 0), 5.0)
+        self.assertEqual(len(ahead), 5)
+        ahead = track.curvature_ahead(track.length - 2.0, 5.0)
+        self.assertEqual(list(ahead), [0.0]*5)  # wraps to the first straight
+        self.assertIsNone(track.curvature_ahead((-500.0, 300.0, 0.0), 5.0))
+
+    def test_polyline(self):
+        line = Segment(length=100.0)
+        arc = Segment(arc=math.radians(-150), radius=50.0)
+        spiral = Segment(arc=math.radians(90), radius=30.0, end_radius=60.0)
+        track = Track([line, arc, spiral, line], width=20)
+
+        stations = np.linspace(0.0, track.length, 97, endpoint=False)
+        x, y, heading, curvature = track.sample(stations)
+        for i, station in enumerate(stations):
+            pose = track.station_to_pose(station)
+            self.assertAlmostEqual(x[i], pose[0])
+            self.assertAlmostEqual(y[i], pose[1])
+            self.assertAlmostEqual(heading[i], pose[2])
+
+        polyline = track.polyline(0.5)
+        self.assertIs(track.polyline(0.5), polyline)
+        self.assertEqual(len(polyline), int(math.ceil(track.length / 0.5)) + 1)
+        self.assertEqual(polyline.station[-1], track.length)
+        end_pose = track2xy(track.segments)
+        self.assertAlmostEqual(polyline.x[-1], end_pose[0])
+        self.assertAlmostEqual(polyline.y[-1], end_pose[1])
+        left, right = polyline.left(), polyline.right()
+        self.assertEqual(left[0].tolist(), [0.0, 10.0])
+        self.assertEqual(right[0].tolist(), [0.0, -10.0])
+        # borders keep the distance also in the turns
+        self.assertTrue(np.allclose(np.hypot(*(left - right).T), 20.0))
+        np.testing.assert_array_equal(polyline.curvature[:-1],
+                                      track.curvature_profile(0.5))
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp_dir, 'polyline.npz')
+            polyline.save(filename)
+            loaded = TrackPolyline.load(filename)
+            self.assertEqual(loaded.width, 20.0)
+            np.testing.assert_array_equal(loaded.y, polyline.y)
+            np.testing.assert_array_equal(loaded.curvature, polyline.curvature)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_localizer(self):
+        line = Segment(length=100.0)
+        arc = Segment(arc=math.radians(90), radius=50.0)
+        track = Track([line, arc]*4, width=20)
+        localizer = TrackLocalizer(track, window=1)
+
+        # drive around the loop twice
+        pose = 0, 2, 0
+        for lap in range(2):
+            for segment in track.segments:
+                for i in range(10):
+                    sub = Segment(length=segment.length/10.0) if segment.arc is None else \
+                          Segment(arc=segment.arc/10.0, radius=segment.radius - 2)
+                    pose = sub.step(pose)
+                    self.assertEqual(localizer.nearest_segment(pose),
+                                     track.nearest_segment(pose))
+
+        # teleport to the opposite side of the track
+        self.assertEqual(localizer.nearest_segment((50, 202, math.pi)),
+                         track.nearest_segment((50, 202, math.pi)))
+        self.assertEqual(localizer.index, 4)
+
+        localizer.reset()
+        self.assertIsNone(localizer.index)
+
 # vim: expandtab sw=4 ts=4
@@ -3,14 +3,29 @@
   Parse track XML data
   usage:
      ./track.py <xml data>
+     ./track.py <directory> [<number of processes>]
+
+  All XML tracks in directory are validated in parallel and reported
+  as JSON lines.
 """
 
+import bisect
+from functools import partial
+import hashlib
+import json
 import math
+from multiprocessing import Pool
 import os
+import re
 import sys
+import time
 from xml.dom.minidom import parse, Node
+import xml.etree.ElementTree as ET
+
+import numpy as np
 
-from segment import Segment
+from geometry import SegmentGeometry, spiral_lengths, spiral_angles
+from segment import Segment, normalize_angles, subdivide
 
 
 def get_main_track(xmldoc):
@@ -31,19 +46,116 @@ def get_track_root_info(xmldoc, name):
     return None
 
 
-def print_track(track):
+def etree_parser(filename):
+    """Return XMLParser ignoring external entities (i.e. &default-surfaces;)
+    like minidom does"""
+    parser = ET.XMLParser()
+    with open(filename, 'rb') as f:
+        head = f.read(4096)
+    for name in re.findall(br'<!ENTITY\s+([^\s%]+)\s+SYSTEM', head):
+        parser.entity[name.decode('utf-8')] = ''
+    return parser
+
+
+def parse_track_etree(filename):
+    """Stream parse track file, return (segments, width, profil steps length)
+
+    The result is the same as when using ``get_main_track`` and
+    ``get_track_root_info`` on minidom document."""
+    segments = []
+    info = {}
+    main_track = 0  # number of open "Main Track" sections
+    track_segments = None  # depth of the first "Track Segments" section
+    done = False
+    depth = 0
+    for event, ele in ET.iterparse(filename, events=('start', 'end'),
+                                   parser=etree_parser(filename)):
+        if event == 'start':
+            depth += 1
+            if ele.tag == 'section':
+                name = ele.get('name')
+                if name == 'Main Track':
+                    main_track += 1
+                if name == 'Track Segments' and track_segments is None:
+                    track_segments = depth
+            continue
+
+        if ele.tag == 'section' and ele.get('name') == 'Main Track':
+            main_track -= 1
+        elif main_track > 0 and ele.tag == 'attnum':
+            name = ele.get('name')
+            if name in ['width', 'profil steps length'] and name not in info:
+                info[name] = float(ele.get('val'))
+
+        if track_segments is not None and not done:
+            if depth == track_segments:
+                done = True
+            elif depth == track_segments + 1:
+                segments.append(Segment.from_etree(ele))
+            elif depth > track_segments + 1:
+                depth -= 1
+                continue  # keep attributes for the parent segment
+        ele.clear()
+        depth -= 1
+    return segments, info.get('width'), info.get('profil steps length')
+
+
+CACHE_VERSION = 2
+CACHE_FIELDS = ['length', 'arc', 'radius', 'end_radius', 'profil_steps_length']
+
+
+def cache_filename(filename, cache_dir, subdivide_turns=True):
+    """Return cache file name given by hash of the track file content
+    and loader options"""
+    sha = hashlib.sha1(b'track-cache-%d:' % CACHE_VERSION)
+    if not subdivide_turns:
+        sha.update(b'spirals:')
+    with open(filename, 'rb') as f:
+        sha.update(f.read())
+    return os.path.join(cache_dir, sha.hexdigest() + '.npz')
+
+
+def save_cache(track, filename):
+    arrays = {'names': np.array([s.name for s in track.segments], dtype=str),
+              'width': np.array(np.nan if track.width is None else track.width)}
+    for field in CACHE_FIELDS:
+        arrays[field] = np.array([np.nan if getattr(s, field) is None
+                                  else getattr(s, field) for s in track.segments],
+                                 dtype=np.float64)
+    tmp_filename = filename + '.tmp.npz'
+    np.savez(tmp_filename, **arrays)
+    os.replace(tmp_filename, filename)
+
+
+def load_cache(filename):
+    def value(x):
+        return None if math.isnan(x) else x
+
+    with np.load(filename) as data:
+        names = data['names'].tolist()
+        columns = [data[field].tolist() for field in CACHE_FIELDS]
+        width = value(float(data['width']))
+    segments = [Segment(name, *[value(x) for x in values])
+                for name, values in zip(names, zip(*columns))]
+    return Track(segments, width)
+
+
+def track_length(track):
+    """Return total arc angle and length of segments"""
     angle = 0.0
     length = 0.0
     for segment in track:
         if segment.arc is not None:
             angle += segment.arc
-        if segment.length is not None:
-            length += segment.length
-        else:
-            length += segment.arc * segment.radius
-            # TODO variable turns
+        length += segment.get_length()
+    return angle, length
+
+
+def print_track(track):
+    for segment in track:
         print(segment.name)
     print()
+    angle, length = track_length(track)
     print(math.degrees(angle), length)
 
 
@@ -55,56 +167,193 @@ def track2xy(track):
     return x, y, heading
 
 
+# used as index margin for tracks without known width
+DEFAULT_INDEX_MARGIN = 10.0
+
+
+def relative_pose(pose, origin):
+    """Convert global pose into coordinates relative to ``origin`` pose"""
+    global_x, global_y, global_a = pose
+    x, y, a = origin
+    ca, sa = math.cos(-a), math.sin(-a)  # rotate back
+    sx = global_x - x
+    sy = global_y - y
+    sx, sy = ca*sx - sa*sy, sa*sx + ca*sy
+    return sx, sy, global_a - a
+
+
+def global_bbox(bbox, origin):
+    """Return axis aligned bounding box of ``bbox`` given in ``origin``
+    coordinates"""
+    xmin, ymin, xmax, ymax = bbox
+    x, y, a = origin
+    ca, sa = math.cos(a), math.sin(a)
+    xs, ys = [], []
+    for bx, by in [(xmin, ymin), (xmin, ymax), (xmax, ymin), (xmax, ymax)]:
+        xs.append(x + ca*bx - sa*by)
+        ys.append(y + sa*bx + ca*by)
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def expand_bbox(bbox, margin):
+    xmin, ymin, xmax, ymax = bbox
+    return xmin - margin, ymin - margin, xmax + margin, ymax + margin
+
+
+class SegmentGrid:
+    """Uniform grid of cells referencing overlapping segment bounding boxes"""
+
+    def __init__(self, boxes, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+        for i, (xmin, ymin, xmax, ymax) in enumerate(boxes):
+            for ix in range(self._cell(xmin), self._cell(xmax) + 1):
+                for iy in range(self._cell(ymin), self._cell(ymax) + 1):
+                    self.cells.setdefault((ix, iy), []).append(i)
+
+    def _cell(self, value):
+        return int(math.floor(value / self.cell_size))
+
+    def candidates(self, x, y):
+        """Return sorted list of segment indices with box over (x, y)"""
+        return self.cells.get((self._cell(x), self._cell(y)), [])
+
+
+# SegmentTable.kind values
+STRAIGHT, TURN, VARIABLE_TURN = 0, 1, 2
+
+
+class SegmentTable(object):
+    """Struct of arrays representation of segments for vectorized queries
+
+    Segment attributes are stored in float64 arrays (NaN for None) together
+    with segment type, start pose and station of every segment. Like the
+    other ``Track`` caches the table expects the segments to stay
+    unchanged.
+
+    The table is a cache next to the ``Segment`` objects, not their storage
+    - segments stay plain objects (with ``__slots__``) so the geometry code
+    keeps scalar attribute access."""
+
+    FIELDS = ['length', 'arc', 'radius', 'end_radius']
+
+    def __init__(self, segments, start_poses, stations):
+        for field in self.FIELDS:
+            setattr(self, field, np.array(
+                    [np.nan if getattr(s, field) is None else getattr(s, field)
+                     for s in segments], dtype=np.float64))
+        self.kind = np.array([STRAIGHT if s.length is not None else
+                              (TURN if s.end_radius is None else VARIABLE_TURN)
+                              for s in segments], dtype=np.int8)
+        self.center_length = np.array([s.get_length() for s in segments],
+                                      dtype=np.float64)
+        self.start = np.array(start_poses, dtype=np.float64).reshape(-1, 3)
+        self.station = np.array(stations, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.station)
+
+
 class Track:
     """Definition of race track"""
 
     @staticmethod
-    def from_xml_file(filename):
-        xmldoc = parse(filename)
-        width = get_track_root_info(xmldoc, 'width')
-        default_profil_steps_length = get_track_root_info(xmldoc, 'profil steps length')
-
-        segments = []
-        for section in get_main_track(xmldoc).childNodes:
-            if section.nodeType == Node.ELEMENT_NODE:
-                s = Segment.from_xml(section)
-                if s.end_radius is None:
-                    segments.append(s)
-                else:
-                    profil_steps_length = default_profil_steps_length
-                    if s.profil_steps_length is not None:
-                        profil_steps_length = s.profil_steps_length
-                    length = abs((s.radius + s.end_radius)/2.0 * s.arc)
-                    num_steps = int(length/profil_steps_length) + 1
-                    if num_steps == 1:
-                        segments.append(s)
-                    else:
-                        # rearange steps so:
-                        #  - every part of the turn has the same length
-                        #  - the first part has curvature given by ``radius``
-                        #  - the last part had curvature given by ``end_radius``
-                        #  - there are ``steps`` parts
-                        #  - the total ``arc`` angle does not change
-                        dradius = (s.end_radius - s.radius)/float(num_steps - 1)
-
-                        tmp = 0.0
-                        for i in xrange(num_steps):
-                            tmp += 1.0/(s.radius + i*dradius)
-                        geom_average = 1.0 / tmp
-
-                        for i in xrange(num_steps):
-                            name = s.name + '.' + str(i)
-                            radius = s.radius + i*dradius
-                            arc = s.arc * geom_average / radius
-                            segments.append(Segment(name=name, arc=arc,
-                                                    radius=radius,
-                                                    end_radius=None))
-
-        return Track(segments, width)
+    def from_xml_file(filename, parser='etree', cache_dir=None, subdivide_turns=True):
+        """Load track from Speed Dreams XML file
+
+        ``parser`` is either streaming 'etree' or 'minidom' (reference).
+        With ``cache_dir`` the parsed track is stored there and reused
+        for the next load of the file with the same content.
+        With ``subdivide_turns=False`` variable radius turns are kept as
+        single segments (one segment per XML section) made of the same
+        constant radius steps as the subdivided turns."""
+        if cache_dir is not None:
+            cache = cache_filename(filename, cache_dir, subdivide_turns)
+            if os.path.exists(cache):
+                return load_cache(cache)
+
+        if parser == 'etree':
+            sections, width, default_profil_steps_length = parse_track_etree(filename)
+        else:
+            assert parser == 'minidom', parser
+            xmldoc = parse(filename)
+            width = get_track_root_info(xmldoc, 'width')
+            default_profil_steps_length = get_track_root_info(xmldoc, 'profil steps length')
+            sections = [Segment.from_xml(section)
+                        for section in get_main_track(xmldoc).childNodes
+                        if section.nodeType == Node.ELEMENT_NODE]
+
+        if subdivide_turns:
+            segments = []
+            for s in sections:
+                segments.extend(subdivide(s, default_profil_steps_length))
+        else:
+            segments = sections
+            for s in segments:
+                if s.end_radius is not None and s.profil_steps_length is None:
+                    s.profil_steps_length = default_profil_steps_length
+        track = Track(segments, width)
+
+        if cache_dir is not None:
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            save_cache(track, cache)
+        return track
 
     def __init__(self, segments, width):
         self.segments = segments
         self.width = width
+        self._table = None
+        self._curvature = {}  # resolution -> curvature profile
+        self._polyline = {}  # resolution -> TrackPolyline
+        # Note, that the segments are expected to stay unchanged
+        # - both start poses and the index are computed only once
+        self.start_poses = []
+        self.stations = []  # distance from start to segment start
+        track_pose = 0, 0, 0
+        station = 0.0
+        for segment in self.segments:
+            self.start_poses.append(track_pose)
+            self.stations.append(station)
+            track_pose = segment.step(track_pose)
+            station += segment.get_length()
+        self.length = station
+        self.geometry = [SegmentGeometry(segment, start)
+                         for segment, start in zip(self.segments, self.start_poses)]
+        if width is not None:
+            self.index_margin = float(width)
+        else:
+            self.index_margin = DEFAULT_INDEX_MARGIN
+        self.index = SegmentGrid(
+                [expand_bbox(global_bbox(segment.bbox(), start), self.index_margin)
+                 for segment, start in zip(self.segments, self.start_poses)],
+                cell_size=2.0 * self.index_margin)
+
+    @property
+    def table(self):
+        """SegmentTable of the track segments (created on demand)"""
+        if self._table is None:
+            self._table = SegmentTable(self.segments, self.start_poses, self.stations)
+        return self._table
+
+    def _nearest(self, pose, indices):
+        """Return index, relative pose and absolute distance of the nearest
+        segment from ``indices`` (or None, None, None)"""
+        global_x, global_y = pose[0], pose[1]
+        geometry = self.geometry
+        best_index = None
+        best_dist = None
+        for i in indices:
+            dist = geometry[i].distance(global_x, global_y)
+            if dist is not None:
+                if dist < 0:
+                    dist = -dist
+                if best_dist is None or dist < best_dist:
+                    best_index = i
+                    best_dist = dist
+        if best_index is None:
+            return None, None, None
+        return best_index, relative_pose(pose, self.start_poses[best_index]), best_dist
 
     def nearest_segment(self, pose):
         """Find nearest segment on the track
@@ -117,8 +366,140 @@ class Track:
           segment
 
         For the valid closed loop track you should always get values
-        other than (None, None).        
+        other than (None, None).
+
+        Only segments from the spatial index are checked. If none of them
+        is closer than ``index_margin`` all segments are checked, so the
+        result is always the same as for ``nearest_segment_scan``.
         """
+        i, rel_pose = self._nearest_indexed(pose)
+        if i is None:
+            return None, None
+        return self.segments[i], rel_pose
+
+    def _nearest_indexed(self, pose):
+        i, rel_pose, dist = self._nearest(pose, self.index.candidates(pose[0], pose[1]))
+        if dist is None or dist > self.index_margin:
+            i, rel_pose, dist = self._nearest(pose, range(len(self.segments)))
+        return i, rel_pose
+
+    def pose_to_station(self, pose):
+        """Return distance along the track (or None outside of the track)"""
+        i, rel_pose = self._nearest_indexed(pose)
+        if i is None:
+            return None
+        return self.stations[i] + self.segments[i].get_station(rel_pose)
+
+    def station_to_pose(self, station):
+        """Return global (x, y, heading) of the track center line
+        ``station`` meters from the start (modulo track length)"""
+        if self.length > 0:
+            station %= self.length
+        i = max(0, bisect.bisect_right(self.stations, station) - 1)
+        x, y, a = self.start_poses[i]
+        sx, sy, sa = self.segments[i].pose_at(station - self.stations[i])
+        ca, sin_a = math.cos(a), math.sin(a)
+        return x + ca*sx - sin_a*sy, y + sin_a*sx + ca*sy, a + sa
+
+    def track_coordinates(self, x, y, indices=None):
+        """Vectorized station and signed offset of global points
+
+        Only segments ``indices`` (default all) are considered. Return
+        arrays of station, offset (positive to the left) and segment index,
+        NaN and -1 for points outside of all considered segments."""
+        dist, station, heading, index = self._projects(x, y, indices)
+        found = index >= 0
+        station[found] += np.asarray(self.stations)[index[found]]
+        return station, dist, index
+
+    def segments_between(self, start, end):
+        """Return indices of segments overlapping stations ``start`` .. ``end``
+
+        Stations are taken modulo track length, the range can wrap over
+        the start line."""
+        stations = self.table.station
+        span = max(0.0, end - start)
+        if span >= self.length:
+            return np.arange(len(stations))
+        start %= self.length
+        end = start + span
+        first = max(0, np.searchsorted(stations, start, side='right') - 1)
+        if end <= self.length:
+            last = np.searchsorted(stations, end, side='right')
+            return np.arange(first, last)
+        last = np.searchsorted(stations, end - self.length, side='right')
+        return np.concatenate([np.arange(first, len(stations)), np.arange(0, last)])
+
+    def sample(self, stations):
+        """Vectorized ``station_to_pose`` and curvature
+
+        Return arrays x, y, heading and signed curvature of the center
+        line at ``stations`` (in range 0 .. track length)."""
+        table = self.table
+        stations = np.asarray(stations, dtype=np.float64)
+        i = np.maximum(np.searchsorted(table.station, stations, side='right') - 1, 0)
+        ds = np.minimum(stations - table.station[i], table.center_length[i])
+        kind = table.kind[i]
+        arc = table.arc[i]
+        radius = table.radius[i]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            abs_arc = np.abs(arc)
+            slope = np.where(kind == VARIABLE_TURN,
+                             (table.end_radius[i] - radius) / abs_arc, 0.0)
+            angle = spiral_angles(radius, slope, ds)
+            turn_radius = radius + slope * angle
+            side = np.sign(arc)
+            sx = np.where(kind == STRAIGHT, ds, turn_radius * np.sin(angle))
+            sy = np.where(kind == STRAIGHT, 0.0, side * (radius - turn_radius * np.cos(angle)))
+            sa = np.where(kind == STRAIGHT, 0.0, side * angle)
+            curvature = np.where(kind == STRAIGHT, 0.0, side / turn_radius)
+        for index in np.unique(i[kind == VARIABLE_TURN]):
+            if self.segments[index].profil_steps() is not None:
+                mask = i == index
+                sx[mask], sy[mask], sa[mask], curvature[mask] = \
+                        self.segments[index].sample_steps(ds[mask])
+        start = table.start[i]
+        ca, sin_a = np.cos(start[:, 2]), np.sin(start[:, 2])
+        return (start[:, 0] + ca*sx - sin_a*sy, start[:, 1] + sin_a*sx + ca*sy,
+                start[:, 2] + sa, curvature)
+
+    def curvature_profile(self, resolution=1.0):
+        """Return curvature sampled every ``resolution`` meters from the start
+
+        The profile is computed once per resolution and cached."""
+        if resolution not in self._curvature:
+            samples = np.arange(0.0, self.length, resolution)
+            self._curvature[resolution] = self.sample(samples)[3]
+        return self._curvature[resolution]
+
+    def polyline(self, resolution=1.0):
+        """Return TrackPolyline sampled every ``resolution`` meters
+
+        The polyline is computed once per resolution and cached."""
+        if resolution not in self._polyline:
+            self._polyline[resolution] = TrackPolyline.from_track(self, resolution)
+        return self._polyline[resolution]
+
+    def curvature_ahead(self, start, distance, resolution=1.0):
+        """Return curvature profile for ``distance`` meters ahead of ``start``
+
+        ``start`` is either station or (x, y, heading) pose, None is returned
+        for pose outside of the track (like ``pose_to_station``). Callers
+        which need the station too should pass it instead of the pose. The
+        lap end wraps to the start of the track."""
+        station = start
+        if np.ndim(start) > 0:
+            station = self.pose_to_station(start)
+            if station is None:
+                return None
+        profile = self.curvature_profile(resolution)
+        first = int((station % self.length) / resolution)
+        count = int(math.ceil(distance / resolution))
+        return profile.take(np.arange(first, first + count), mode='wrap')
+
+    def nearest_segment_scan(self, pose):
+        """Reference implementation of ``nearest_segment`` walking all
+        segments"""
         global_x, global_y, global_a = pose
         track_pose = 0, 0, 0
         best = None, None
@@ -149,6 +530,189 @@ class Track:
         assert abs(dist) < self.width/2.0, (abs(dist), self.width)
         return dist, diff_heading
 
+    def _projects(self, x, y, indices=None):
+        """Project global points on the nearest of segments ``indices``
+
+        Return arrays of signed distance, segment station, global center
+        line heading and segment index (NaN and -1 outside of all segments)."""
+        x = np.asarray(x, dtype=np.float64).reshape(-1)
+        y = np.asarray(y, dtype=np.float64).reshape(-1)
+        best_dist = np.full(len(x), np.nan)
+        best_station = np.full(len(x), np.nan)
+        best_heading = np.full(len(x), np.nan)
+        best_index = np.full(len(x), -1, dtype=np.int64)
+        if indices is None:
+            indices = range(len(self.segments))
+        for i in indices:
+            segment = self.segments[i]
+            sx, sy, a = self.start_poses[i]
+            ca, sa = math.cos(-a), math.sin(-a)  # rotate back
+            gx = x - sx
+            gy = y - sy
+            dist, station, heading = segment.projects(ca*gx - sa*gy, sa*gx + ca*gy)
+            better = ((0 <= station) & (station <= segment.get_length()) &
+                      ((best_index < 0) | (np.abs(dist) < np.abs(best_dist))))
+            best_dist[better] = dist[better]
+            best_station[better] = station[better]
+            best_heading[better] = a + heading[better]
+            best_index[better] = i
+        return best_dist, best_station, best_heading, best_index
+
+    def get_offsets(self, poses):
+        """Vectorized ``get_offset`` for (N, 3) array of poses
+
+        Return arrays of signed distance, heading offset and index of the
+        nearest segment. Poses outside of all segments have NaN offsets
+        and index -1. The width of the track is not checked."""
+        poses = np.asarray(poses, dtype=np.float64).reshape(-1, 3)
+        dist, station, heading, index = self._projects(poses[:, 0], poses[:, 1])
+        return dist, normalize_angles(poses[:, 2] - heading), index
+
+
+class TrackPolyline(object):
+    """Densely sampled center line, borders and curvature of the track
+
+    ``station``, ``x``, ``y``, ``heading`` and ``curvature`` are arrays of
+    the same length, the last sample is the end of the track."""
+
+    FIELDS = ['station', 'x', 'y', 'heading', 'curvature']
+
+    @staticmethod
+    def from_track(track, resolution=1.0):
+        station = np.append(np.arange(0.0, track.length, resolution), track.length)
+        x, y, heading, curvature = track.sample(station)
+        return TrackPolyline(station, x, y, heading, curvature, track.width)
+
+    @staticmethod
+    def load(filename):
+        with np.load(filename) as data:
+            width = float(data['width'])
+            return TrackPolyline(*[data[field] for field in TrackPolyline.FIELDS],
+                                 width=None if math.isnan(width) else width)
+
+    def __init__(self, station, x, y, heading, curvature, width=None):
+        self.station = station
+        self.x = x
+        self.y = y
+        self.heading = heading
+        self.curvature = curvature
+        self.width = width
+
+    def __len__(self):
+        return len(self.station)
+
+    def border(self, left_offset):
+        """Return (N, 2) array of points ``left_offset`` meters left
+        of the center line"""
+        return np.column_stack([self.x - left_offset * np.sin(self.heading),
+                                self.y + left_offset * np.cos(self.heading)])
+
+    def left(self):
+        return self.border(self.width / 2.0)
+
+    def right(self):
+        return self.border(-self.width / 2.0)
+
+    def save(self, filename):
+        """Store arrays into compressed .npz file"""
+        arrays = {field: getattr(self, field) for field in self.FIELDS}
+        arrays['width'] = np.array(np.nan if self.width is None else self.width)
+        np.savez_compressed(filename, **arrays)
+
+
+class TrackLocalizer:
+    """Nearest segment search seeded by the last matched segment
+
+    Only ``window`` segments before and after the last match are checked.
+    The whole (indexed) track is searched on the first call or when the
+    pose is not within ``Track.index_margin`` of any nearby segment
+    (crash, restart of the simulation ...)."""
+
+    def __init__(self, track, window=2):
+        self.track = track
+        self.window = window
+        self.index = None
+
+    def reset(self):
+        self.index = None
+
+    def _nearby(self):
+        count = len(self.track.segments)
+        if count <= 2 * self.window + 1:
+            return range(count)
+        ret = [self.index]
+        for k in range(1, self.window + 1):
+            ret.append((self.index + k) % count)
+            ret.append((self.index - k) % count)
+        return ret
+
+    def nearest_segment(self, pose):
+        """Return segment and relative pose like ``Track.nearest_segment``"""
+        i = None
+        if self.index is not None:
+            i, rel_pose, dist = self.track._nearest(pose, self._nearby())
+            if dist is None or dist > self.track.index_margin:
+                i = None
+        if i is None:
+            i, rel_pose = self.track._nearest_indexed(pose)
+        self.index = i
+        if i is None:
+            return None, None
+        return self.track.segments[i], rel_pose
+
+    def pose_to_station(self, pose):
+        """Return distance along the track like ``Track.pose_to_station``"""
+        segment, rel_pose = self.nearest_segment(pose)
+        if segment is None:
+            return None
+        return self.track.stations[self.index] + segment.get_station(rel_pose)
+
+
+def check_track(filename, subdivide_turns=True):
+    """Validate that the track is closed loop, return dictionary report
+
+    With ``subdivide_turns=False`` the closure of native variable radius
+    turns is checked (see ``Track.from_xml_file``)."""
+    start = time.perf_counter()
+    report = {'filename': filename, 'ok': False, 'error': None}
+    try:
+        track = Track.from_xml_file(filename, subdivide_turns=subdivide_turns)
+        end_pose = track2xy(track.segments)
+        angle, length = track_length(track.segments)
+        deg_angle = int(round(math.degrees(end_pose[2])))
+        report.update({
+                'segments': len(track.segments),
+                'end_pose': end_pose,
+                'closure_error': abs(end_pose[0]) + abs(end_pose[1]),
+                'heading_deg': math.degrees(end_pose[2]),
+                'arc_deg': math.degrees(angle),
+                'length': length})
+        if report['closure_error'] >= 0.5:
+            report['error'] = 'track is not closed {}'.format(end_pose)
+        elif deg_angle not in [-360, 0, 360]:
+            report['error'] = 'unexpected end heading {}'.format(deg_angle)
+        else:
+            report['ok'] = True
+    except Exception as e:
+        report['error'] = '{}: {}'.format(type(e).__name__, e)
+    report['seconds'] = time.perf_counter() - start
+    return report
+
+
+def check_tracks(path, processes=None, subdivide_turns=True):
+    """Validate all XML tracks in directory tree in process pool"""
+    filenames = []
+    for dirpath, dirnames, names in os.walk(path):
+        for filename in sorted(names):
+            if filename.endswith('xml'):
+                filenames.append(os.path.join(dirpath, filename))
+    pool = Pool(processes)
+    try:
+        return pool.map(partial(check_track, subdivide_turns=subdivide_turns), filenames)
+    finally:
+        pool.close()
+        pool.join()
+
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -160,15 +724,12 @@ if __name__ == "__main__":
         track = Track.from_xml_file(path)
         print(track2xy(track.segments))
     else:
-        for dirpath, dirnames, filenames in os.walk(path):
-            for filename in filenames:
-                if filename.endswith('xml'):
-                    track = Track.from_xml_file(os.path.join(dirpath, filename))
-                    end_pose = track2xy(track.segments)
-                    print(filename, end_pose)
-                    assert abs(end_pose[0]) + abs(end_pose[1]) < 0.5, end_pose
-                    deg_angle = int(round(math.degrees(end_pose[2])))
-                    assert deg_angle in [-360, 0, 360], deg_angle
+        processes = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        reports = check_tracks(path, processes)
+        for report in reports:
+            print(json.dumps(report))
+        if not all(report['ok'] for report in reports):
+            sys.exit(1)
 
 # vim: expandtab sw=4 ts=4 
 